@@ -0,0 +1,208 @@
+import collections
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+
+from comfyui_client import ComfyUIClient, WorkflowResult, ResultClaim
+
+# Inputs naming the model files a node loads; a change in any of them reloads weights on the GPU
+MODEL_INPUTS = ('ckpt_name', 'lora_name', 'vae_name')
+
+# Sorted (input name, file) pairs, e.g. (('ckpt_name', 'sd15.ckpt'), ('lora_name', 'ink.safetensors'))
+ModelSignature = Tuple[Tuple[str, str], ...]
+
+
+def model_signature(workflow: Dict[str, Any]) -> ModelSignature:
+    """Every checkpoint, LoRA and VAE a workflow loads; empty if it loads none"""
+    nodes = workflow.get('nodes', workflow)
+    files = set()
+    for node in nodes.values():
+        inputs = node.get('inputs') if isinstance(node, dict) else None
+        if isinstance(inputs, dict):
+            for name in MODEL_INPUTS:
+                if isinstance(inputs.get(name), str):
+                    files.add((name, inputs[name]))
+    return tuple(sorted(files))
+
+
+def count_swaps(signatures: Iterable[ModelSignature]) -> int:
+    """Model loads needed to run workflows in this order (the first load included)"""
+    swaps, loaded = 0, None
+    for signature in signatures:
+        # A workflow without models runs with whatever is loaded
+        if signature and signature != loaded:
+            swaps += 1
+            loaded = signature
+    return swaps
+
+
+class _Job:
+    __slots__ = ('workflow', 'signature', 'output_dir', 'claim', 'enqueued')
+
+    def __init__(self, workflow: Dict[str, Any], output_dir: str, claim: ResultClaim):
+        self.workflow = workflow
+        self.signature = model_signature(workflow)
+        self.output_dir = output_dir
+        self.claim = claim
+        self.enqueued = time.monotonic()
+
+
+class AffinityScheduler:
+    """
+    Orders submissions to one ComfyUI server so consecutive prompts share models
+
+    Workflows are held locally and only max_queued at a time are queued on
+    the server (enough to keep it busy). Whenever a slot frees up, the next
+    prompt is the oldest held workflow with the same checkpoint/LoRA/VAE
+    signature as the last one queued, so the server keeps its models
+    loaded; when none is left, the oldest workflow goes next and its models
+    are loaded. Workflows held for max_wait seconds are queued before any
+    others (still grouped by model among themselves), which bounds how long
+    a rare model can be starved.
+
+    execute_workflow blocks like ComfyUIClient.execute_workflow, so the
+    scheduler can stand in for the client in BatchPipeline; reordering
+    only helps when several callers submit at once. Workflows the client's
+    result_store already has, or that are executing, are not held at all.
+    """
+
+    def __init__(self, client: ComfyUIClient, max_queued: int = 2, max_wait: float = 60.0):
+        """
+        Args:
+            client: Client of the server to submit to
+            max_queued: Prompts queued on the server at once
+            max_wait: Seconds a workflow may be passed over for better-matching ones
+        """
+        self.client = client
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        # Model loads caused by our submission order, and those forced by max_wait
+        self.swaps = 0
+        self.forced = 0
+        self.submitted = 0
+        # Longest time a workflow was held before being queued
+        self.max_held = 0.0
+
+        self._pending: "collections.deque[_Job]" = collections.deque()
+        self._queued = 0
+        self._loaded: Optional[ModelSignature] = None
+        self._closing = False
+        self._cond = threading.Condition()
+        self._collector = ThreadPoolExecutor(max_queued, thread_name_prefix="affinity-collect")
+        self._thread = threading.Thread(target=self._dispatch_loop, name="affinity-dispatch", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Queue everything still held, wait for it to finish and stop"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._collector.shutdown(wait=True)
+
+    def __enter__(self) -> "AffinityScheduler":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"submitted": self.submitted, "swaps": self.swaps, "forced": self.forced,
+                    "max_held": round(self.max_held, 3), "held": len(self._pending), "queued": self._queued}
+
+    # -- submission ----------------------------------------------------------
+
+    def submit(self, workflow: Dict[Any, Any], output_dir: str = "outputs") -> "Future[Optional[WorkflowResult]]":
+        """Hold a workflow for execution; the future resolves to its WorkflowResult (or None on failure)"""
+        claim = self.client.claim_result(workflow)
+        if not claim.leader:
+            return claim.future
+        job = _Job(workflow, output_dir, claim)
+        with self._cond:
+            if self._closing:
+                claim.complete(None)
+                raise RuntimeError("AffinityScheduler is closed")
+            self._pending.append(job)
+            self._cond.notify_all()
+        return claim.future
+
+    def execute_workflow(self, workflow: Dict[Any, Any], output_dir: str = "outputs") -> Optional[WorkflowResult]:
+        """Submit a workflow and wait for its result"""
+        return self.submit(workflow, output_dir).result()
+
+    def execute_many(self, workflows: Iterable[Dict[Any, Any]],
+                     output_dir: str = "outputs") -> List[Optional[WorkflowResult]]:
+        """
+        Execute many workflows, reordered by model signature
+
+        Returns:
+            One WorkflowResult (or None on failure) per workflow, in input order
+        """
+        futures = [self.submit(workflow, output_dir) for workflow in workflows]
+        return [future.result() for future in futures]
+
+    # -- dispatch ------------------------------------------------------------
+
+    def _fits(self, job: _Job) -> bool:
+        return not job.signature or job.signature == self._loaded
+
+    def _next(self) -> _Job:
+        """Take the job to queue next; the lock is held and a job is pending"""
+        now = time.monotonic()
+        # Held in arrival order, so the workflows past max_wait are a prefix; they go first
+        overdue = list(itertools.takewhile(lambda job: now - job.enqueued >= self.max_wait, self._pending))
+        candidates = overdue or self._pending
+        job = next((job for job in candidates if self._fits(job)), candidates[0])
+        if overdue and not self._fits(job) and any(self._fits(other) for other in self._pending):
+            self.forced += 1
+        self._pending.remove(job)
+        self.max_held = max(self.max_held, now - job.enqueued)
+        if job.signature and job.signature != self._loaded:
+            self.swaps += 1
+            self._loaded = job.signature
+        return job
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._queued >= self.max_queued or not (self._pending or self._closing):
+                    self._cond.wait()
+                if not self._pending:
+                    # Closing and nothing left to queue
+                    return
+                job = self._next()
+                self._queued += 1
+            self._queue(job)
+
+    def _queue(self, job: _Job) -> None:
+        try:
+            pending = self.client.submit(job.workflow)
+        except Exception as e:
+            logging.error(f"Error queueing workflow: {str(e)}")
+            pending = None
+        if pending is None:
+            logging.error("Workflow could not be queued")
+            self._done(job, None)
+            return
+        with self._cond:
+            self.submitted += 1
+        self._collector.submit(self._collect, job, pending)
+
+    def _collect(self, job: _Job, pending: Any) -> None:
+        try:
+            result = self.client.finish(pending, job.output_dir)
+        except Exception as e:
+            logging.error(f"Error executing workflow: {str(e)}")
+            result = None
+        self._done(job, result)
+
+    def _done(self, job: _Job, result: Optional[WorkflowResult]) -> None:
+        with self._cond:
+            self._queued -= 1
+            self._cond.notify_all()
+        job.claim.complete(result)
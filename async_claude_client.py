@@ -0,0 +1,292 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Dict, Any, Optional, List, Iterable, Tuple, Union
+
+import anthropic
+
+from claude_client import ClaudeClient, GENERATE_INSTRUCTIONS, REFINE_INSTRUCTIONS
+from workflow_cache import WorkflowCache
+from workflow_templates import WorkflowTemplates
+
+
+class TokenBucket:
+    """
+    Continuously refilling token bucket for per-minute limits
+
+    The level may go negative when a request turns out to use more than was
+    reserved for it; later requests then wait until the debt is refilled.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken (0 if it can be taken now)"""
+        self._refill()
+        # Never ask for more than a full bucket, or a huge request would wait forever
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def adjust(self, amount: float) -> None:
+        """Give back (positive) or charge (negative) tokens after the fact"""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimitScheduler:
+    """
+    Admission control for API calls under requests- and tokens-per-minute limits
+
+    A request waits until both buckets can cover it and a concurrency slot is
+    free. Admission is first come, first served, so a large request is not
+    starved by a stream of small ones. A 429 pauses every caller until the
+    server's retry-after has passed, instead of each one retrying on its own.
+    """
+
+    def __init__(self, requests_per_minute: float = 50, tokens_per_minute: float = 40000, max_concurrency: int = 8):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self._waiters = 0
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests waiting for admission"""
+        return self._waiters
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every new request for the given time (e.g. a retry-after)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens: float) -> None:
+        """Wait for a concurrency slot and for budget in both buckets"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._waiters += 1
+        try:
+            await self._slots.acquire()
+            try:
+                # The lock makes admission FIFO: the head waiter sleeps while holding it
+                async with self._lock:
+                    while True:
+                        delay = max(self._paused_until - time.monotonic(),
+                                    self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                        if delay <= 0:
+                            break
+                        await asyncio.sleep(delay)
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+            except BaseException:
+                self._slots.release()
+                raise
+        finally:
+            self._waiters -= 1
+        self.in_flight += 1
+
+    def release(self, reserved: float, used: Optional[float] = None) -> None:
+        """Free the slot and settle the token reservation against actual usage"""
+        self.in_flight -= 1
+        self._slots.release()
+        if used is not None:
+            self.tokens.adjust(reserved - used)
+
+
+class AsyncClaudeClient:
+    """
+    asyncio counterpart of ClaudeClient with rate-limit-aware scheduling
+
+    Every call passes through a RateLimitScheduler sized to the account's
+    requests- and tokens-per-minute limits, so many generations can be in
+    flight without tripping 429s. Rate-limit, overload and connection errors
+    are retried with jittered exponential backoff, using the server's
+    retry-after when it sends one. Prompts, templates and the workflow cache
+    are shared with ClaudeClient.
+    """
+
+    MODEL = ClaudeClient.MODEL
+
+    def __init__(self, api_key: str, requests_per_minute: float = 50, tokens_per_minute: float = 40000,
+                 max_concurrency: int = 8, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0,
+                 output_token_estimate: int = 1500, base_url: Optional[str] = None,
+                 cache: Optional[WorkflowCache] = None, use_templates: bool = True):
+        # Retries are ours, so the scheduler sees (and paces) every attempt
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, base_url=base_url, max_retries=0)
+        self.scheduler = RateLimitScheduler(requests_per_minute, tokens_per_minute, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.output_token_estimate = output_token_estimate
+        self.cache = cache
+        self.use_templates = use_templates
+        self.template_fingerprint = ClaudeClient.prompt_fingerprint()
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    async def __aenter__(self) -> "AsyncClaudeClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "queue_depth": self.scheduler.queue_depth,
+            "in_flight": self.scheduler.in_flight,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's retry-after"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return delay if retry_after is None else retry_after + delay * 0.1
+
+    @staticmethod
+    def _retry_after(error: anthropic.APIStatusError) -> Optional[float]:
+        value = error.response.headers.get("retry-after") if error.response is not None else None
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    async def _create(self, instructions: str, prompt: str, timeout: float = 30) -> Any:
+        """Send one messages request through the scheduler, retrying transient failures"""
+        # Rough estimate (4 characters per token) reserved up front, settled with the real usage afterwards
+        reserved = (len(instructions) + len(prompt)) / 4 + self.output_token_estimate
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire(reserved)
+            used = None
+            try:
+                self.requests += 1
+                response = await self.client.messages.create(
+                    model=self.MODEL,
+                    max_tokens=4096,
+                    temperature=0,
+                    system=ClaudeClient.system_blocks(instructions),
+                    messages=[{"role": "user", "content": prompt}],
+                    timeout=timeout,
+                )
+                usage = getattr(response, 'usage', None)
+                used = (getattr(usage, 'input_tokens', 0) or 0) + (getattr(usage, 'output_tokens', 0) or 0)
+                self.input_tokens += getattr(usage, 'input_tokens', 0) or 0
+                self.output_tokens += getattr(usage, 'output_tokens', 0) or 0
+                return response
+            except anthropic.RateLimitError as e:
+                self.rate_limited += 1
+                error, delay = e, self._backoff(attempt, self._retry_after(e))
+                # Everyone backs off, not just this request
+                self.scheduler.pause(delay)
+            except anthropic.APIStatusError as e:
+                # 529 overloaded and 5xx are transient; other 4xx are our fault
+                if e.status_code < 500:
+                    raise Exception(f"Error calling Claude API: {str(e)}")
+                error, delay = e, self._backoff(attempt, self._retry_after(e))
+            except (anthropic.APIConnectionError, anthropic.APITimeoutError) as e:
+                error, delay = e, self._backoff(attempt, None)
+            finally:
+                self.scheduler.release(reserved, used)
+
+            if attempt == self.max_retries:
+                break
+            self.retries += 1
+            logging.warning(f"Claude API call failed ({str(error)}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        if isinstance(error, anthropic.RateLimitError):
+            raise Exception("Rate limit exceeded. Please try again in a few minutes.")
+        raise Exception(f"Error calling Claude API: {str(error)}")
+
+    @staticmethod
+    def _response_text(response: Any) -> str:
+        if not response.content or not response.content[0].text:
+            raise Exception("Empty response received from Claude API")
+        return response.content[0].text
+
+    async def generate_workflow(self, description: str, use_cache: bool = True) -> str:
+        """
+        Generate a ComfyUI workflow JSON based on the provided description
+
+        Args:
+            description: User's description of the desired workflow
+            use_cache: Look up and store the result in the workflow cache
+
+        Returns:
+            str: JSON string containing the generated workflow
+        """
+        if self.use_templates:
+            workflow = WorkflowTemplates.build(description)
+            if workflow is not None:
+                return json.dumps(workflow)
+
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = WorkflowCache.make_key(description, self.MODEL, self.template_fingerprint)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        response = await self._create(GENERATE_INSTRUCTIONS, ClaudeClient.build_generate_prompt(description))
+        workflow_json = ClaudeClient.extract_json_from_response(self._response_text(response))
+        if cache_key is not None:
+            self.cache.put(cache_key, workflow_json)
+        return workflow_json
+
+    async def request_refinement(self, workflow: Union[str, Dict[str, Any]], error_log: str,
+                                 timeout: float = 30, focus: Optional[Iterable[str]] = None) -> Tuple[str, Dict[str, int]]:
+        """
+        Send one refine request to Claude
+
+        Returns:
+            Tuple of (refined workflow JSON string, token usage); see
+            ClaudeClient.request_refinement
+        """
+        prompt, base = ClaudeClient.prepare_refinement(workflow, error_log, focus)
+        response = await self._create(REFINE_INSTRUCTIONS, prompt, timeout)
+        workflow_json = ClaudeClient.finish_refinement(self._response_text(response), base)
+        return workflow_json, ClaudeClient.response_usage(response)
+
+    async def refine_workflow_with_claude(self, workflow: Dict[str, Any], error_log: str) -> Dict[str, Any]:
+        """Refine the workflow JSON using Claude based on the provided error log"""
+        refined_workflow_json, _ = await self.request_refinement(workflow, error_log)
+        return json.loads(refined_workflow_json)
+
+    async def generate_many(self, descriptions: Iterable[str]) -> List[Union[str, Exception]]:
+        """
+        Generate workflows for many descriptions concurrently
+
+        Returns:
+            One JSON string (or the Exception that stopped it) per description,
+            in input order
+        """
+        return await asyncio.gather(*(self.generate_workflow(description) for description in descriptions),
+                                    return_exceptions=True)
@@ -0,0 +1,333 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Iterable, Union
+
+import aiohttp
+
+from comfyui_client import WorkflowResult, iter_output_images, local_image_name, DOWNLOAD_CHUNK_SIZE
+from comfyui_session import history_events
+from workflow_format import to_api_prompt
+
+Event = Union[Dict[str, Any], bytes]
+
+
+class AsyncComfyUIClient:
+    """
+    asyncio counterpart of ComfyUIClient
+
+    Exposes the same calls as coroutines. HTTP requests share one pooled
+    aiohttp session, and a single WebSocket routes events to per-prompt
+    queues, so one process can drive many workflows at once. At most
+    max_concurrency workflows execute concurrently.
+    """
+
+    MAX_ORPHANED_PROMPTS = 1024
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8188, max_concurrency: int = 8,
+                 pool_size: int = 100, ws_idle_timeout: float = 30.0, reconnect_delay: float = 0.5):
+        self.base_url = f"http://{host}:{port}"
+        self.ws_url = f"ws://{host}:{port}/ws"
+        self.client_id = str(uuid.uuid4())
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.ws_idle_timeout = ws_idle_timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnects = 0
+
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._ws_lock: Optional[asyncio.Lock] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._subscribers: Dict[str, "asyncio.Queue[Event]"] = {}
+        self._orphans: "OrderedDict[str, List[Event]]" = OrderedDict()
+        self._current_prompt: Optional[str] = None
+        self._closing = False
+
+    # -- lifecycle -----------------------------------------------------------
+
+    async def __aenter__(self) -> "AsyncComfyUIClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        """Pooled HTTP session, created on first use inside the running loop"""
+        if self._http is None or self._http.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._http = aiohttp.ClientSession(connector=connector)
+        return self._http
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def close(self) -> None:
+        """Close the WebSocket, stop the reader task and release pooled connections"""
+        self._closing = True
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self._http is not None:
+            await self._http.close()
+        self._ws = self._reader = self._http = None
+        self._closing = False
+
+    # -- REST ----------------------------------------------------------------
+
+    async def check_connection(self) -> tuple[bool, str]:
+        """Check if ComfyUI is accessible"""
+        try:
+            async with self.http.get(f"{self.base_url}/history", timeout=aiohttp.ClientTimeout(total=5)):
+                return True, "ComfyUI is running and accessible"
+        except aiohttp.ClientConnectionError:
+            return False, "Could not connect to ComfyUI. Please ensure ComfyUI is running on port 8188"
+        except Exception as e:
+            return False, f"Error connecting to ComfyUI: {str(e)}"
+
+    async def queue_prompt(self, prompt: Dict[Any, Any]) -> Optional[str]:
+        """Queue a prompt for execution in ComfyUI (nodes/connections workflows are converted to API format)"""
+        try:
+            payload = {"prompt": to_api_prompt(prompt), "client_id": self.client_id}
+            async with self.http.post(f"{self.base_url}/prompt", json=payload) as response:
+                if response.status == 200:
+                    response_data = await response.json()
+                    return response_data.get('prompt_id')
+                logging.error(f"Error: Received non-200 status code: {response.status}: {await response.text()}")
+                return None
+        except Exception as e:
+            logging.error(f"Error queueing prompt: {str(e)}")
+            return None
+
+    async def get_history(self, prompt_id: str) -> Optional[Dict[str, Any]]:
+        """Get execution history for a prompt"""
+        try:
+            async with self.http.get(f"{self.base_url}/history/{prompt_id}",
+                                     timeout=aiohttp.ClientTimeout(total=5)) as response:
+                if response.status != 200:
+                    return None
+                return (await response.json()).get(prompt_id)
+        except Exception as e:
+            logging.error(f"Error getting history: {str(e)}")
+            return None
+
+    async def get_image(self, filename: str, subfolder: str = "", folder_type: str = "output") -> Optional[bytes]:
+        """Download an image from ComfyUI"""
+        try:
+            params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
+            async with self.http.get(f"{self.base_url}/view", params=params,
+                                     timeout=aiohttp.ClientTimeout(total=10)) as response:
+                return await response.read() if response.status == 200 else None
+        except Exception as e:
+            logging.error(f"Error downloading image: {str(e)}")
+            return None
+
+    async def download_image(self, image: Dict[str, Any], destination: str) -> bool:
+        """Stream one image from /view to disk in chunks; see ComfyUIClient.download_image"""
+        params = {
+            "filename": image['filename'],
+            "subfolder": image.get('subfolder', ''),
+            "type": image.get('type', 'output'),
+        }
+        try:
+            async with self.http.get(f"{self.base_url}/view", params=params) as response:
+                if response.status != 200:
+                    logging.error(f"Error downloading image {image['filename']}: HTTP {response.status}")
+                    return False
+                f = await asyncio.to_thread(open, destination, 'wb')
+                try:
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        await asyncio.to_thread(f.write, chunk)
+                except BaseException:
+                    f.close()
+                    os.remove(destination)
+                    raise
+                f.close()
+                return True
+        except Exception as e:
+            logging.error(f"Error downloading image {image['filename']}: {str(e)}")
+            return False
+
+    async def download_outputs(self, prompt_id: str, outputs: Dict[str, Any],
+                               output_dir: str = "outputs") -> WorkflowResult:
+        """Download every image in a prompt's outputs concurrently"""
+        result = WorkflowResult(prompt_id=prompt_id, outputs=outputs)
+        images = iter_output_images(outputs)
+        if not images:
+            return result
+        os.makedirs(output_dir, exist_ok=True)
+        destinations = [os.path.join(output_dir, local_image_name(prompt_id, image)) for image in images]
+        oks = await asyncio.gather(*(self.download_image(image, dest) for image, dest in zip(images, destinations)))
+        for image, destination, ok in zip(images, destinations, oks):
+            if ok:
+                result.paths.append(destination)
+            else:
+                result.failed.append(image)
+        return result
+
+    # -- WebSocket -----------------------------------------------------------
+
+    def _get_ws_lock(self) -> asyncio.Lock:
+        # Created lazily so it belongs to the running event loop
+        if self._ws_lock is None:
+            self._ws_lock = asyncio.Lock()
+        return self._ws_lock
+
+    async def _ensure_ws(self) -> None:
+        async with self._get_ws_lock():
+            if self._ws is None or self._ws.closed:
+                await self._connect_ws()
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read_ws())
+
+    async def _connect_ws(self) -> None:
+        self._ws = await self.http.ws_connect(
+            self.ws_url, params={"clientId": self.client_id},
+            headers={"Origin": self.base_url}, max_msg_size=0,
+        )
+
+    def _dispatch(self, prompt_id: Optional[str], event: Event) -> None:
+        if prompt_id is None:
+            return
+        subscriber = self._subscribers.get(prompt_id)
+        if subscriber is not None:
+            subscriber.put_nowait(event)
+            return
+        self._orphans.setdefault(prompt_id, []).append(event)
+        self._orphans.move_to_end(prompt_id)
+        while len(self._orphans) > self.MAX_ORPHANED_PROMPTS:
+            self._orphans.popitem(last=False)
+
+    async def _resync(self) -> None:
+        for prompt_id in list(self._subscribers):
+            for event in history_events(prompt_id, await self.get_history(prompt_id)) or []:
+                self._dispatch(prompt_id, event)
+
+    def _handle(self, msg: aiohttp.WSMessage) -> None:
+        if msg.type == aiohttp.WSMsgType.BINARY:
+            self._dispatch(self._current_prompt, msg.data)
+            return
+        if msg.type != aiohttp.WSMsgType.TEXT:
+            return
+        message = json.loads(msg.data)
+        data = message.get('data') or {}
+        if message.get('type') == 'executing':
+            self._current_prompt = data.get('prompt_id') if data.get('node') is not None else None
+        self._dispatch(data.get('prompt_id'), message)
+
+    async def _read_ws(self) -> None:
+        while not self._closing:
+            async for msg in self._ws:
+                if msg.type == aiohttp.WSMsgType.ERROR:
+                    break
+                # A malformed frame must not kill the reader every pending prompt depends on
+                try:
+                    self._handle(msg)
+                except Exception as e:
+                    logging.error(f"Error handling WebSocket message: {str(e)}")
+            if self._closing:
+                return
+
+            logging.error("WebSocket connection lost; reconnecting")
+            self._current_prompt = None
+            while not self._closing:
+                try:
+                    # Under the lock, so a concurrent _ensure_ws cannot open a second socket
+                    async with self._get_ws_lock():
+                        if self._ws is None or self._ws.closed:
+                            await self._connect_ws()
+                            self.reconnects += 1
+                    await self._resync()
+                    break
+                except Exception as e:
+                    logging.error(f"WebSocket reconnect failed: {str(e)}")
+                    await asyncio.sleep(self.reconnect_delay)
+
+    async def _wait_for_prompt(self, events: "asyncio.Queue[Event]", prompt_id: str) -> Optional[Dict[str, Any]]:
+        """Wait for a prompt's terminal event; see ComfyUIClient._wait_for_prompt"""
+        outputs: Dict[str, Any] = {}
+        while True:
+            try:
+                message = await asyncio.wait_for(events.get(), timeout=self.ws_idle_timeout)
+            except asyncio.TimeoutError:
+                for event in history_events(prompt_id, await self.get_history(prompt_id)) or []:
+                    events.put_nowait(event)
+                continue
+
+            if not isinstance(message, dict):
+                continue
+
+            data = message.get('data', {})
+            if message['type'] == 'executed':
+                outputs[data['node']] = data.get('output') or {}
+            elif message['type'] == 'executing' and data.get('node') is None:
+                return outputs
+            elif message['type'] == 'execution_error':
+                logging.error(
+                    f"Prompt {prompt_id} failed in node {data.get('node_id')} "
+                    f"({data.get('node_type')}): {data.get('exception_message')}"
+                )
+                return None
+            elif message['type'] == 'execution_interrupted':
+                logging.error(f"Prompt {prompt_id} was interrupted")
+                return None
+
+    # -- execution -----------------------------------------------------------
+
+    async def execute_workflow(self, workflow: Dict[Any, Any], output_dir: str = "outputs") -> Optional[WorkflowResult]:
+        """Execute a workflow and download every image it produces"""
+        async with self.semaphore:
+            try:
+                await self._ensure_ws()
+
+                prompt_id = await self.queue_prompt(workflow)
+                if not prompt_id:
+                    return None
+
+                events: "asyncio.Queue[Event]" = asyncio.Queue()
+                for event in self._orphans.pop(prompt_id, []):
+                    events.put_nowait(event)
+                self._subscribers[prompt_id] = events
+                try:
+                    outputs = await self._wait_for_prompt(events, prompt_id)
+                finally:
+                    self._subscribers.pop(prompt_id, None)
+                if outputs is None:
+                    return None
+
+                if not outputs:
+                    history = await self.get_history(prompt_id)
+                    if not history or 'outputs' not in history:
+                        return None
+                    outputs = history['outputs']
+
+                return await self.download_outputs(prompt_id, outputs, output_dir)
+
+            except Exception as e:
+                logging.error(f"Error executing workflow: {str(e)}")
+                return None
+
+    async def execute_many(self, workflows: Iterable[Dict[Any, Any]]) -> List[Optional[WorkflowResult]]:
+        """
+        Execute several workflows concurrently, bounded by max_concurrency
+
+        Args:
+            workflows: Workflows to execute
+
+        Returns:
+            One WorkflowResult (or None for failures) per workflow, in input order
+        """
+        return await asyncio.gather(*(self.execute_workflow(workflow) for workflow in workflows))
@@ -0,0 +1,235 @@
+import re
+import threading
+from decimal import Decimal
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+from json_handler import JsonHandler
+from workflow_graph import is_link
+from workflow_validator import ValidationError
+
+# Output slot of each link type on the checkpoint loaders
+CHECKPOINT_OUTPUT_SLOTS: Dict[str, Dict[str, int]] = {
+    'CheckpointLoaderSimple': {'MODEL': 0, 'CLIP': 1, 'VAE': 2},
+    'CheckpointLoader': {'MODEL': 0, 'CLIP': 1, 'VAE': 2},
+}
+
+_INT_TEXT = re.compile(r"^-?\d+$")
+_FLOAT_TEXT = re.compile(r"^\s*-?(?:\d+\.?\d*|\.\d+)(?:[eE]-?\d+)?\s*$")
+
+# Repair rules take the workflow and its current errors, fix it in place and return the number of changes
+RepairRule = Callable[[Dict[str, Any], List[ValidationError]], int]
+
+
+def _iter_inputs(workflow: Dict[str, Any]):
+    """Yield (target node ID, inputs dict) for node inputs and the connections section"""
+    for node_id, node in workflow['nodes'].items():
+        if isinstance(node, dict) and isinstance(node.get('inputs'), dict):
+            yield node_id, node['inputs']
+    connections = workflow.get('connections')
+    if isinstance(connections, dict):
+        for target_id, info in connections.items():
+            if isinstance(info, dict) and isinstance(info.get('inputs'), dict):
+                yield target_id, info['inputs']
+
+
+def _expected_type(class_type: str, name: str) -> Optional[type]:
+    """Python type an input literal should have, from the schema registry or the requirement tables"""
+    registry = JsonHandler.schema_registry
+    schema = registry.get(class_type) if registry is not None else None
+    if schema is not None:
+        spec = schema.required.get(name) or schema.optional.get(name)
+        return {'INT': int, 'FLOAT': float, 'STRING': str, 'BOOLEAN': bool}.get(spec.type) if spec else None
+    spec = JsonHandler.NODE_INPUT_REQUIREMENTS.get(class_type, {}).get('required_inputs', {}).get(name)
+    if spec is int or spec is str:
+        return spec
+    if isinstance(spec, tuple) and float in spec:
+        return float
+    return None
+
+
+def fix_node_list(workflow: Dict[str, Any], errors: List[ValidationError]) -> int:
+    """Turn a list of nodes carrying an 'id' field into the expected ID-keyed dictionary"""
+    nodes = workflow.get('nodes')
+    if not isinstance(nodes, list) or not all(isinstance(node, dict) and 'id' in node for node in nodes):
+        return 0
+    workflow['nodes'] = {str(node['id']): {k: v for k, v in node.items() if k != 'id'} for node in nodes}
+    return 1
+
+
+def add_missing_connections(workflow: Dict[str, Any], errors: List[ValidationError]) -> int:
+    """Add the empty 'connections' section (or replace an empty list); links inside node inputs are enough"""
+    if not isinstance(workflow.get('nodes'), dict) or ('connections' in workflow and workflow['connections'] != []):
+        return 0
+    workflow['connections'] = {}
+    return 1
+
+
+def normalize_ids(workflow: Dict[str, Any], errors: List[ValidationError]) -> int:
+    """Make node IDs strings and link output indices ints: {4: ...} / [4, "1"] -> {"4": ...} / ["4", 1]"""
+    if not isinstance(workflow.get('nodes'), dict):
+        return 0
+    changes = 0
+    for section in ('nodes', 'connections'):
+        entries = workflow.get(section)
+        if isinstance(entries, dict) and any(not isinstance(key, str) for key in entries):
+            workflow[section] = {str(key): value for key, value in entries.items()}
+            changes += 1
+
+    for _, inputs in _iter_inputs(workflow):
+        for name, value in inputs.items():
+            if not isinstance(value, list) or len(value) != 2 or not isinstance(value[0], (str, int)):
+                continue
+            source_id, index = value
+            if isinstance(index, str) and index.strip().isdigit():
+                index = int(index)
+            elif isinstance(index, float) and index.is_integer():
+                index = int(index)
+            if isinstance(source_id, int) and not isinstance(source_id, bool):
+                source_id = str(source_id)
+            if [source_id, index] != value or type(index) is not type(value[1]):
+                inputs[name] = [source_id, index]
+                changes += 1
+    return changes
+
+
+def rewire_checkpoint_slots(workflow: Dict[str, Any], errors: List[ValidationError]) -> int:
+    """Point model/clip/vae inputs at the matching CheckpointLoaderSimple output slot"""
+    nodes = workflow.get('nodes')
+    if not isinstance(nodes, dict):
+        return 0
+    registry = JsonHandler.schema_registry
+    changes = 0
+    for target_id, inputs in _iter_inputs(workflow):
+        target = nodes.get(target_id)
+        target_schema = registry.get(target.get('class_type')) if registry is not None and isinstance(target, dict) else None
+        for name, value in inputs.items():
+            if not is_link(value):
+                continue
+            source = nodes.get(str(value[0]))
+            slots = CHECKPOINT_OUTPUT_SLOTS.get(source.get('class_type')) if isinstance(source, dict) else None
+            if slots is None:
+                continue
+            spec = (target_schema.required.get(name) or target_schema.optional.get(name)) if target_schema else None
+            wanted = slots.get(spec.type if spec is not None else name.upper())
+            if wanted is not None and value[1] != wanted:
+                inputs[name] = [value[0], wanted]
+                changes += 1
+    return changes
+
+
+def _int_from_text(text: str) -> Optional[int]:
+    """Exact integer written in text ("20", "20.0", "2e3"), or None; large seeds must not go through float"""
+    text = text.strip()
+    if _INT_TEXT.match(text):
+        return int(text) if len(text) <= 64 else None
+    if not _FLOAT_TEXT.match(text):
+        return None
+    number = Decimal(text)
+    # Rejects fractions, and exponents too large to be a real input value
+    if number != number.to_integral_value() or number.adjusted() > 64:
+        return None
+    return int(number)
+
+
+def coerce_types(workflow: Dict[str, Any], errors: List[ValidationError]) -> int:
+    """Convert literals flagged as bad_type when it is lossless, e.g. 20.0 or "20" -> 20 for steps"""
+    nodes = workflow.get('nodes')
+    if not isinstance(nodes, dict):
+        return 0
+    changes = 0
+    for error in errors:
+        if error.code != 'bad_type' or error.node_id not in nodes:
+            continue
+        node = nodes[error.node_id]
+        inputs = node.get('inputs')
+        if not isinstance(inputs, dict) or error.input_name not in inputs:
+            continue
+        value = inputs[error.input_name]
+        expected = _expected_type(node.get('class_type'), error.input_name)
+        coerced = None
+        if expected is int:
+            if isinstance(value, float) and value.is_integer():
+                coerced = int(value)
+            elif isinstance(value, str):
+                coerced = _int_from_text(value)
+        elif expected is float:
+            if isinstance(value, str) and _FLOAT_TEXT.match(value):
+                coerced = float(value)
+        elif expected is str:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                coerced = str(value)
+        elif expected is bool:
+            if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+                coerced = value.strip().lower() == 'true'
+        if coerced is not None:
+            inputs[error.input_name] = coerced
+            changes += 1
+    return changes
+
+
+# Rules that act on the error list and need it to be current when they run
+ERROR_DRIVEN_RULES = frozenset({'coerce_types'})
+
+DEFAULT_RULES: Tuple[Tuple[str, RepairRule], ...] = (
+    ('fix_node_list', fix_node_list),
+    ('add_missing_connections', add_missing_connections),
+    ('normalize_ids', normalize_ids),
+    ('rewire_checkpoint_slots', rewire_checkpoint_slots),
+    ('coerce_types', coerce_types),
+)
+
+
+class AutoRepair:
+    """
+    Deterministic fixes for mechanical workflow errors, tried before asking the LLM
+
+    Rules run in order on the parsed workflow and edit it in place. The
+    workflow is revalidated only before an error-driven rule that follows a
+    change, and once at the end, so a repair costs a couple of validation
+    passes. Per-rule counters record how often a
+    rule fired and how many LLM refine calls it saved, i.e. how often the
+    rules it took part in left the workflow with no errors at all.
+    """
+
+    def __init__(self, rules: Tuple[Tuple[str, RepairRule], ...] = DEFAULT_RULES):
+        self.rules = rules
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {name: {"fixes": 0, "llm_calls_saved": 0} for name, _ in rules}
+        self.llm_calls_saved = 0
+
+    def repair(self, workflow: Dict[str, Any],
+               errors: Optional[List[ValidationError]] = None) -> Tuple[List[ValidationError], Dict[str, int]]:
+        """
+        Apply every rule to a workflow
+
+        Args:
+            workflow: Parsed workflow; modified in place
+            errors: Its current errors, if already known
+
+        Returns:
+            Tuple of (remaining errors, number of changes per rule that fired)
+        """
+        if errors is None:
+            errors = JsonHandler.collect_errors(workflow)
+        had_errors = bool(errors)
+        applied: Dict[str, int] = {}
+        stale = False
+        for name, rule in self.rules:
+            if stale and name in ERROR_DRIVEN_RULES:
+                errors = JsonHandler.collect_errors(workflow)
+                stale = False
+            changes = rule(workflow, errors)
+            if changes:
+                applied[name] = changes
+                stale = True
+        if stale:
+            errors = JsonHandler.collect_errors(workflow)
+
+        with self._lock:
+            for name, changes in applied.items():
+                self.stats[name]["fixes"] += changes
+            if applied and had_errors and not errors:
+                self.llm_calls_saved += 1
+                for name in applied:
+                    self.stats[name]["llm_calls_saved"] += 1
+        return errors, applied
@@ -0,0 +1,247 @@
+import csv
+import json
+import os
+import queue
+import threading
+import time
+from typing import Dict, Any, List, Optional, Callable, Iterable, Union
+
+from affinity_scheduler import AffinityScheduler
+from claude_client import ClaudeClient
+from comfyui_client import ComfyUIClient
+from comfyui_pool import ComfyUIPool
+from json_feedback import RefineBudget, RefineEngine
+from json_handler import JsonHandler, WorkflowValidationError
+from output_writer import OutputWriteError
+import tracing
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+def load_descriptions(path: str) -> List[str]:
+    """
+    Read workflow descriptions from a JSONL or CSV file
+
+    JSONL lines may be plain JSON strings or objects with a "description" key.
+    CSV files use the "description" column, or the first column if there is none.
+
+    Args:
+        path: Path to a .jsonl/.ndjson or .csv file
+
+    Returns:
+        List of non-empty descriptions in file order
+    """
+    ext = os.path.splitext(path)[1].lower()
+    descriptions: List[str] = []
+    with open(path, newline='', encoding='utf-8') as f:
+        if ext in ('.jsonl', '.ndjson'):
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if isinstance(entry, dict):
+                    if 'description' not in entry:
+                        raise ValueError(f"{path}:{line_number}: object has no 'description' key")
+                    entry = entry['description']
+                descriptions.append(str(entry).strip())
+        elif ext == '.csv':
+            rows = list(csv.reader(f))
+            if rows and 'description' in [cell.strip().lower() for cell in rows[0]]:
+                column = [cell.strip().lower() for cell in rows[0]].index('description')
+                rows = rows[1:]
+            else:
+                column = 0
+            descriptions = [row[column].strip() for row in rows if len(row) > column]
+        else:
+            raise ValueError(f"Unsupported batch file type '{ext}': use .jsonl or .csv")
+    return [description for description in descriptions if description]
+
+
+class BatchItem:
+    """State of one description as it moves through the pipeline"""
+
+    def __init__(self, index: int, description: str):
+        self.index = index
+        self.description = description
+        self.workflow_json: Optional[str] = None
+        self.workflow: Optional[Dict[str, Any]] = None
+        self.raw_json_path: Optional[str] = None
+        self.workflow_path: Optional[str] = None
+        self.images: List[str] = []
+        self.failed_stage: Optional[str] = None
+        self.error: Optional[str] = None
+        self.durations: Dict[str, float] = {}
+        self.refine_rounds: List[Dict[str, Any]] = []
+        self.repairs: Dict[str, int] = {}
+
+    def to_manifest(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "description": self.description,
+            "status": "failed" if self.error else "ok",
+            "failed_stage": self.failed_stage,
+            "error": self.error,
+            "raw_json_path": self.raw_json_path,
+            "workflow_path": self.workflow_path,
+            "images": self.images,
+            "durations": {stage: round(seconds, 4) for stage, seconds in self.durations.items()},
+            "refine_rounds": self.refine_rounds,
+            "repairs": self.repairs,
+        }
+
+
+class BatchPipeline:
+    """
+    Runs many descriptions through generate -> validate/refine -> save -> execute
+
+    Every stage has its own pool of worker threads, and stages are connected
+    by bounded queues, so LLM calls for later items overlap with ComfyUI
+    execution of earlier ones while memory stays bounded. A failing item is
+    recorded in the manifest and skips its remaining stages; the rest of the
+    batch carries on.
+    """
+
+    def __init__(self, claude_client: ClaudeClient,
+                 comfyui_client: Optional[Union[ComfyUIClient, ComfyUIPool, AffinityScheduler]] = None,
+                 generate_workers: int = 4, refine_workers: int = 4, save_workers: int = 1,
+                 execute_workers: int = 2, queue_size: int = 16, refine_budget: Optional[RefineBudget] = None):
+        self.claude_client = claude_client
+        self.refine_engine = RefineEngine(claude_client, refine_budget)
+        self.comfyui_client = comfyui_client
+        self.queue_size = queue_size
+        self.stages: List[tuple] = [
+            ("generate", self._generate, generate_workers),
+            ("validate", self._validate, refine_workers),
+            ("save", self._save, save_workers),
+        ]
+        if comfyui_client is not None:
+            self.stages.append(("execute", self._execute, execute_workers))
+
+    # -- stages --------------------------------------------------------------
+
+    def _generate(self, item: BatchItem) -> None:
+        item.workflow, item.workflow_json = self.claude_client.generate_workflow_stream(item.description)
+        item.raw_json_path = JsonHandler.save_raw_workflow(item.workflow_json, item.description)
+
+    def _validate(self, item: BatchItem) -> None:
+        # The dict parsed while streaming is handed over, not parsed again
+        result = self.refine_engine.refine(item.workflow, owned=True)
+        item.refine_rounds = [refine_round.to_dict() for refine_round in result.rounds]
+        item.repairs = result.repairs
+        if not result.valid:
+            raise WorkflowValidationError(result.errors)
+        item.workflow = result.workflow
+
+    def _save(self, item: BatchItem) -> None:
+        item.workflow_path = JsonHandler.save_workflow(item.workflow, item.description)
+
+    def _execute(self, item: BatchItem) -> None:
+        result = self.comfyui_client.execute_workflow(item.workflow)
+        if not result or not result.paths:
+            raise RuntimeError("ComfyUI execution failed")
+        item.images = result.paths
+
+    @staticmethod
+    def _check_saved(item: BatchItem) -> None:
+        """Fail an item whose workflow files the (possibly background) output writer could not write"""
+        if item.error:
+            return
+        for path in (item.raw_json_path, item.workflow_path):
+            if path is None:
+                continue
+            try:
+                JsonHandler.output_writer.wait(path)
+            except OutputWriteError as e:
+                item.failed_stage = "save"
+                item.error = str(e)
+                return
+
+    # -- plumbing ------------------------------------------------------------
+
+    def _stage_worker(self, name: str, func: Callable[[BatchItem], None], inbox: "queue.Queue",
+                      outbox: "queue.Queue", done: "queue.Queue", finished: List[int], workers: int,
+                      lock: threading.Lock, next_workers: int) -> None:
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            start = time.perf_counter()
+            try:
+                with tracing.job(item.index):
+                    func(item)
+            except Exception as e:
+                item.failed_stage = name
+                item.error = str(e)
+            item.durations[name] = time.perf_counter() - start
+            # Failed items go straight to the manifest
+            (done if item.error else outbox).put(item)
+
+        # The last worker of a stage closes the next stage's input
+        with lock:
+            finished[0] += 1
+            last = finished[0] == workers
+        if last:
+            for _ in range(next_workers):
+                outbox.put(_DONE)
+
+    def run(self, descriptions: Iterable[str], manifest_path: str,
+            on_item: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Process every description and write one manifest line per item
+
+        Args:
+            descriptions: Workflow descriptions to process
+            manifest_path: JSONL file receiving one result record per item,
+                written as items complete
+            on_item: Optional callback invoked with each manifest record
+
+        Returns:
+            Manifest records ordered by input index
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        # Completed and failed items; unbounded so workers never block on the writer
+        done: "queue.Queue" = queue.Queue()
+        threads: List[threading.Thread] = []
+
+        for position, (name, func, workers) in enumerate(self.stages):
+            last_stage = position == len(self.stages) - 1
+            outbox = done if last_stage else queues[position + 1]
+            next_workers = 1 if last_stage else self.stages[position + 1][2]
+            finished, lock = [0], threading.Lock()
+            for n in range(workers):
+                thread = threading.Thread(
+                    target=self._stage_worker, name=f"batch-{name}-{n}", daemon=True,
+                    args=(name, func, queues[position], outbox, done, finished, workers, lock, next_workers),
+                )
+                thread.start()
+                threads.append(thread)
+
+        def feed():
+            for index, description in enumerate(descriptions):
+                queues[0].put(BatchItem(index, description))
+            for _ in range(self.stages[0][2]):
+                queues[0].put(_DONE)
+
+        feeder = threading.Thread(target=feed, name="batch-feed", daemon=True)
+        feeder.start()
+
+        records: List[Dict[str, Any]] = []
+        os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+        with open(manifest_path, 'w') as manifest:
+            while True:
+                item = done.get()
+                if item is _DONE:
+                    break
+                self._check_saved(item)
+                record = item.to_manifest()
+                manifest.write(json.dumps(record) + "\n")
+                manifest.flush()
+                records.append(record)
+                if on_item is not None:
+                    on_item(record)
+
+        feeder.join()
+        for thread in threads:
+            thread.join()
+        return sorted(records, key=lambda record: record["index"])
@@ -0,0 +1,58 @@
+"""
+Throughput of AsyncComfyUIClient at increasing concurrency.
+
+Each level submits the same workflow --jobs times against a local mock
+ComfyUI server with --workers execution slots and reports jobs per second.
+Concurrency 1 is equivalent to driving the synchronous client in a loop.
+
+Run from the repository root:
+    python -m benchmarks.bench_async_throughput
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from async_comfyui_client import AsyncComfyUIClient
+from mock_comfyui_server import MockComfyUIServer
+
+WORKFLOW_PATH = "outputs/workflow_20250124_211718_create_a_simple_worflow_that_g.json"
+
+
+async def measure(server: MockComfyUIServer, workflow: dict, jobs: int, concurrency: int) -> float:
+    async with AsyncComfyUIClient(host=server.host, port=server.port, max_concurrency=concurrency) as client:
+        # Warm up the pool and the WebSocket outside the timed region
+        await client.execute_workflow(workflow)
+        start = time.perf_counter()
+        results = await client.execute_many([workflow] * jobs)
+        elapsed = time.perf_counter() - start
+    failed = sum(1 for result in results if result is None)
+    if failed:
+        print(f"  warning: {failed} of {jobs} jobs failed")
+    return jobs / elapsed
+
+
+def run(jobs: int, levels: list, node_delay: float, workers: int) -> None:
+    with open(WORKFLOW_PATH) as f:
+        workflow = json.load(f)
+    # Downloaded images land in ./outputs; keep them out of the repository
+    os.chdir(tempfile.mkdtemp(prefix="comfyui_bench_"))
+
+    with MockComfyUIServer(node_delay=node_delay, workers=workers) as server:
+        print(f"{jobs} jobs, node delay {node_delay * 1000:.1f} ms, {workers} server workers")
+        print(f"{'concurrency':>12} {'jobs/s':>10}")
+        for concurrency in levels:
+            rate = asyncio.run(measure(server, workflow, jobs, concurrency))
+            print(f"{concurrency:>12} {rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--node-delay', type=float, default=0.001)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+    run(args.jobs, args.levels, args.node_delay, args.workers)
@@ -0,0 +1,81 @@
+"""
+Latency of ComfyUIClient.execute_workflow on a shared, busy server.
+
+Competing clients keep submitting prompts while ours runs. The client now
+returns as soon as its own prompt finishes; the old behaviour (waiting for
+queue_remaining == 0) is shown as the time the whole queue took to drain.
+
+Run from the repository root:
+    python -m benchmarks.bench_completion_latency
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from urllib import request
+
+from comfyui_client import ComfyUIClient
+from mock_comfyui_server import MockComfyUIServer
+from workflow_format import to_api_prompt
+
+WORKFLOW_PATH = "outputs/workflow_20250124_211718_create_a_simple_worflow_that_g.json"
+
+
+# The competing prompts come from another client, so their events never reach ours
+COMPETITOR_ID = str(uuid.uuid4())
+
+
+def _submit(base_url: str, workflow: dict) -> None:
+    data = json.dumps({"prompt": to_api_prompt(workflow), "client_id": COMPETITOR_ID}).encode('utf-8')
+    req = request.Request(f"{base_url}/prompt", data=data, headers={'Content-Type': 'application/json'})
+    with request.urlopen(req) as response:
+        response.read()
+
+
+def run(competing: int, node_delay: float) -> None:
+    with open(WORKFLOW_PATH) as f:
+        workflow = json.load(f)
+    # Downloaded images land in ./outputs; keep them out of the repository
+    os.chdir(tempfile.mkdtemp(prefix="comfyui_bench_"))
+
+    with MockComfyUIServer(node_delay=node_delay) as server:
+        client = ComfyUIClient(host=server.host, port=server.port)
+
+        # Half of the competing prompts are ahead of ours, half arrive while ours runs
+        ahead = competing // 2
+        for _ in range(ahead):
+            _submit(client.base_url, workflow)
+
+        def flood():
+            time.sleep(node_delay)
+            for _ in range(competing - ahead):
+                _submit(client.base_url, workflow)
+
+        flooder = threading.Thread(target=flood)
+        start = time.perf_counter()
+        flooder.start()
+        result = client.execute_workflow(workflow)
+        latency = time.perf_counter() - start
+        flooder.join()
+        client.close()
+
+        while server.queue_remaining:
+            time.sleep(node_delay / 4)
+        drained = time.perf_counter() - start
+
+    per_prompt = node_delay * len(workflow["nodes"])
+    print(f"competing prompts:        {competing} ({ahead} ahead of ours)")
+    print(f"per-prompt execution:     {per_prompt * 1000:.1f} ms")
+    print(f"our prompt latency:       {latency * 1000:.1f} ms  (result: {result})")
+    print(f"queue drain (old wait):   {drained * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--competing', type=int, default=8)
+    parser.add_argument('--node-delay', type=float, default=0.01)
+    args = parser.parse_args()
+    run(args.competing, args.node_delay)
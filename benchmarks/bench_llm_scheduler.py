@@ -0,0 +1,65 @@
+"""
+Generation throughput of AsyncClaudeClient against a rate-limited stub.
+
+A local MockAnthropicServer enforces --server-rpm requests per minute over a
+rolling --window seconds and answers after --latency seconds. Each configuration generates --requests
+workflows and reports wall time, requests per second, 429s received and
+retries. "sequential" is one request at a time (like ClaudeClient),
+"unpaced" runs concurrently with the client's limits far above the server's
+(so only retry-after backoff keeps it going), and "paced" sizes the
+scheduler to the server's limit.
+
+Run from the repository root:
+    python -m benchmarks.bench_llm_scheduler
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from async_claude_client import AsyncClaudeClient
+from mock_anthropic_server import MockAnthropicServer
+
+
+async def measure(base_url: str, requests: int, rpm: float, concurrency: int, window: float) -> dict:
+    async with AsyncClaudeClient("sk-bench", requests_per_minute=rpm, tokens_per_minute=10 ** 9,
+                                 max_concurrency=concurrency, base_delay=0.05, max_retries=20,
+                                 base_url=base_url, use_templates=False) as client:
+        # Same burst allowance as the server's window
+        client.scheduler.requests.capacity = client.scheduler.requests.level = max(1, rpm * window / 60)
+        start = time.perf_counter()
+        results = await client.generate_many([f"workflow {index}" for index in range(requests)])
+        elapsed = time.perf_counter() - start
+        stats = client.stats
+    stats["failed"] = sum(1 for result in results if isinstance(result, Exception))
+    stats["elapsed"] = elapsed
+    return stats
+
+
+def run(requests: int, server_rpm: int, latency: float, concurrency: int, window: float) -> None:
+    # Retry warnings would drown the table
+    logging.getLogger().setLevel(logging.ERROR)
+    configs = [
+        ("sequential", server_rpm, 1),
+        ("unpaced", 10 ** 6, concurrency),
+        ("paced", server_rpm, concurrency),
+    ]
+    print(f"{requests} requests, server limit {server_rpm} rpm, latency {latency * 1000:.0f} ms")
+    print(f"{'mode':>12} {'seconds':>9} {'req/s':>8} {'429s':>6} {'retries':>8} {'failed':>7}")
+    for name, rpm, workers in configs:
+        # A fresh server per mode so every run starts with an empty rate window
+        with MockAnthropicServer(latency=latency, requests_per_minute=server_rpm, window=window) as server:
+            stats = asyncio.run(measure(server.base_url, requests, rpm, workers, window))
+        print(f"{name:>12} {stats['elapsed']:>9.2f} {requests / stats['elapsed']:>8.1f} "
+              f"{stats['rate_limited']:>6} {stats['retries']:>8} {stats['failed']:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--server-rpm', type=int, default=600)
+    parser.add_argument('--window', type=float, default=2.0)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+    run(args.requests, args.server_rpm, args.latency, args.concurrency, args.window)
@@ -0,0 +1,98 @@
+"""
+Model swaps and wall time of input-order versus affinity-ordered execution.
+
+The workload is --jobs copies of the test workflow spread round-robin (or
+in random order with --shuffle) over --models checkpoint/LoRA
+combinations, the worst case for input order. A local mock ComfyUI server
+charges --swap-delay seconds whenever a prompt needs other models than the
+previous one, and counts those swaps.
+
+"input order" pipelines the batch with ComfyUIClient.execute_batch, as
+before. "affinity" submits the same batch through AffinityScheduler with
+--max-wait. The report shows the swaps the server counted, the wall time,
+and for affinity the longest a job was held back (what --max-wait bounds)
+and how many swaps it forced.
+
+Run from the repository root:
+    python -m benchmarks.bench_model_affinity
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from affinity_scheduler import AffinityScheduler, count_swaps, model_signature
+from comfyui_client import ComfyUIClient
+from mock_comfyui_server import MockComfyUIServer
+
+WORKFLOW_PATH = "outputs/workflow_20250124_211718_create_a_simple_worflow_that_g.json"
+
+
+def workload(jobs: int, models: int, shuffle: bool) -> list:
+    with open(WORKFLOW_PATH) as f:
+        base = json.load(f)
+    workflows = []
+    for index in range(jobs):
+        workflow = json.loads(json.dumps(base))
+        for node in workflow["nodes"].values():
+            if "ckpt_name" in node["inputs"]:
+                node["inputs"]["ckpt_name"] = f"model_{index % models // 2}.safetensors"
+        # Odd models also apply a LoRA on top of the checkpoint
+        if index % models % 2:
+            workflow["nodes"]["lora"] = {"class_type": "LoraLoader",
+                                         "inputs": {"lora_name": "detail.safetensors", "strength_model": 1.0}}
+        workflows.append(workflow)
+    if shuffle:
+        random.Random(0).shuffle(workflows)
+    return workflows
+
+
+def input_order(server: MockComfyUIServer, workflows: list) -> tuple:
+    """Seconds to finish the batch, and how many jobs failed"""
+    with ComfyUIClient(server.host, server.port) as client:
+        start = time.perf_counter()
+        results = client.execute_batch(workflows, max_in_flight=2)
+        elapsed = time.perf_counter() - start
+    return elapsed, sum(result is None for result in results)
+
+
+def affinity(server: MockComfyUIServer, workflows: list, max_wait: float) -> tuple:
+    """Seconds to finish the batch, failures, longest hold and jobs queued early by max_wait"""
+    with ComfyUIClient(server.host, server.port) as client:
+        scheduler = AffinityScheduler(client, max_wait=max_wait)
+        start = time.perf_counter()
+        results = scheduler.execute_many(workflows)
+        elapsed = time.perf_counter() - start
+        scheduler.close()
+    return elapsed, sum(result is None for result in results), scheduler.max_held, scheduler.forced
+
+
+def run(jobs: int, models: int, swap_delay: float, node_delay: float, max_wait: float, shuffle: bool) -> None:
+    workflows = workload(jobs, models, shuffle)
+    # Downloaded images land in ./outputs; keep them out of the repository
+    os.chdir(tempfile.mkdtemp(prefix="comfyui_bench_"))
+    print(f"{jobs} jobs over {models} model sets, swap {swap_delay * 1000:.0f} ms, node {node_delay * 1000:.0f} ms; "
+          f"swaps needed: {count_swaps(model_signature(w) for w in workflows)} in input order, "
+          f"{models} grouped")
+    print(f"{'order':>12} {'swaps':>6} {'seconds':>8} {'failed':>7} {'max held':>9} {'forced':>7}")
+
+    with MockComfyUIServer(node_delay=node_delay, model_swap_delay=swap_delay) as server:
+        elapsed, failed = input_order(server, workflows)
+        print(f"{'input order':>12} {server.stats['model_swaps']:>6} {elapsed:>8.2f} {failed:>7} {'-':>9} {'-':>7}")
+    with MockComfyUIServer(node_delay=node_delay, model_swap_delay=swap_delay) as server:
+        elapsed, failed, held, forced = affinity(server, workflows, max_wait)
+        print(f"{'affinity':>12} {server.stats['model_swaps']:>6} {elapsed:>8.2f} {failed:>7} {held:>9.2f} {forced:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=60)
+    parser.add_argument('--models', type=int, default=4, help='Distinct checkpoint/LoRA combinations')
+    parser.add_argument('--swap-delay', type=float, default=0.1)
+    parser.add_argument('--node-delay', type=float, default=0.002)
+    parser.add_argument('--max-wait', type=float, default=60.0)
+    parser.add_argument('--shuffle', action='store_true')
+    args = parser.parse_args()
+    run(args.jobs, args.models, args.swap_delay, args.node_delay, args.max_wait, args.shuffle)
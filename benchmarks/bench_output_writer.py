@@ -0,0 +1,75 @@
+"""
+Caller-side cost of saving workflow JSON, before and after OutputWriter.
+
+Every mode saves --saves copies of the test workflow into a temporary
+directory. "makedirs+dump" is the previous JsonHandler.save_workflow
+(makedirs and json.dump with indent=2 on every call, no fsync).
+"foreground" writes through OutputWriter in the caller (atomic rename,
+fsync) with the default compact encoding; the background modes queue the
+write and return, and the worker fsyncs each directory once per batch.
+JSON is serialized in the caller in every mode, which is why "pretty"
+(indent=2) costs the caller more than the old save.
+
+The report shows microseconds the caller spends per save, the seconds
+until every file is on disk (flush included), the batches the worker
+needed and the bytes written.
+
+Run from the repository root:
+    python -m benchmarks.bench_output_writer
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from output_writer import OutputWriter
+
+WORKFLOW_PATH = "outputs/workflow_20250124_211718_create_a_simple_worflow_that_g.json"
+
+
+def directory_bytes(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def old_save(directory: str, name: str, workflow: dict) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.json")
+    with open(path, 'w') as f:
+        json.dump(workflow, f, indent=2)
+    return path
+
+
+def run(saves: int) -> None:
+    with open(WORKFLOW_PATH) as f:
+        workflow = json.load(f)
+    root = tempfile.mkdtemp(prefix="comfyui_bench_")
+    print(f"{saves} saves of {WORKFLOW_PATH}")
+    print(f"{'mode':>18} {'us/save':>9} {'seconds':>8} {'batches':>8} {'bytes':>10}")
+
+    modes = [("makedirs+dump", None), ("foreground", ("compact", False)), ("background", ("compact", True)),
+             ("background pretty", ("pretty", True)), ("background gzip", ("gzip", True))]
+    for label, options in modes:
+        directory = os.path.join(root, label.replace(' ', '_').replace('+', '_'))
+        writer = OutputWriter(options[0], background=options[1]) if options else None
+        start = time.perf_counter()
+        for index in range(saves):
+            # Distinct names, as the old save overwrote files sharing a timestamp
+            name = f"workflow_{index}"
+            if writer is None:
+                old_save(directory, name, workflow)
+            else:
+                writer.write(directory, name, workflow)
+        caller = time.perf_counter() - start
+        if writer is not None:
+            writer.close()
+        elapsed = time.perf_counter() - start
+        batches = writer.batches if writer is not None else '-'
+        print(f"{label:>18} {caller / saves * 1e6:>9.1f} {elapsed:>8.2f} {batches:>8} {directory_bytes(directory):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--saves', type=int, default=500)
+    args = parser.parse_args()
+    run(args.saves)
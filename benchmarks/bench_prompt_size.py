@@ -0,0 +1,119 @@
+"""
+Input tokens and latency of generate and refine requests, before and after prompt trimming.
+
+"before" rebuilds the old prompts: the static instructions inline in the user
+message, and the full workflow serialized with indent=2 for refinement.
+"after" uses ClaudeClient's prompts: the node reference and instructions in
+cacheable system blocks (long enough to pass the 1024-token caching
+minimum), and a compact excerpt around the failing nodes for refinement.
+Each request is sent --repeat times, so prompt-cache reads show up from
+the second call on.
+
+By default requests go to a local MockAnthropicServer, which estimates
+tokens at four characters each and imitates the prompt cache, and latency
+is only the stub's. With --live they go to the real API (ANTHROPIC_API_KEY),
+and the usage and latency are what the API reports.
+
+Run from the repository root:
+    python -m benchmarks.bench_prompt_size [--live]
+"""
+import argparse
+import json
+import os
+import time
+
+import anthropic
+
+from claude_client import ClaudeClient, GENERATE_INSTRUCTIONS, REFINE_INSTRUCTIONS
+from json_feedback import RefineEngine
+from json_handler import JsonHandler
+from mock_anthropic_server import MockAnthropicServer
+from workflow_templates import WorkflowTemplates
+
+DESCRIPTION = "a watercolor painting of a lighthouse at dusk"
+
+
+def legacy_generate(description: str) -> dict:
+    prompt = GENERATE_INSTRUCTIONS.replace("for the description you are given",
+                                           f"for this description: {description}")
+    return {"messages": [{"role": "user", "content": prompt}]}
+
+
+def current_generate(description: str) -> dict:
+    return {"system": ClaudeClient.system_blocks(GENERATE_INSTRUCTIONS),
+            "messages": [{"role": "user", "content": ClaudeClient.build_generate_prompt(description)}]}
+
+
+def legacy_refine(workflow: dict, error_log: str) -> dict:
+    prompt = (
+        "You previously generated a ComfyUI workflow JSON, but it contains some errors. "
+        "Here is the workflow JSON:\n\n"
+        f"{json.dumps(workflow, indent=2)}\n\n"
+        "And here are the errors:\n\n"
+        f"{error_log}\n\n"
+        "Please correct the errors and provide a refined JSON workflow. "
+        "IMPORTANT: Your response must contain ONLY the JSON object with no additional text, markdown formatting, or explanations."
+    )
+    return {"messages": [{"role": "user", "content": prompt}]}
+
+
+def current_refine(workflow: dict, error_log: str, errors: list) -> dict:
+    prompt, _ = ClaudeClient.prepare_refinement(workflow, error_log, RefineEngine.focus(workflow, errors))
+    return {"system": ClaudeClient.system_blocks(REFINE_INSTRUCTIONS),
+            "messages": [{"role": "user", "content": prompt}]}
+
+
+def broken_workflow(class_type: str, name: str, value) -> tuple:
+    """The template workflow with one bad input, and its validation errors"""
+    workflow = WorkflowTemplates.build(DESCRIPTION)
+    for node in workflow["nodes"].values():
+        if node["class_type"] == class_type:
+            node["inputs"][name] = value
+            break
+    errors = JsonHandler.collect_errors(workflow)
+    return workflow, "\n".join(str(error) for error in errors), errors
+
+
+def scenarios() -> list:
+    refine_cases = [
+        ("refine KSampler", broken_workflow("KSampler", "steps", "twenty")),
+        ("refine CLIPTextEncode", broken_workflow("CLIPTextEncode", "text", 42)),
+    ]
+    cases = [("generate", legacy_generate(DESCRIPTION), current_generate(DESCRIPTION))]
+    for name, (workflow, error_log, errors) in refine_cases:
+        cases.append((name, legacy_refine(workflow, error_log), current_refine(workflow, error_log, errors)))
+    return cases
+
+
+def send(client: anthropic.Anthropic, request: dict) -> dict:
+    start = time.perf_counter()
+    response = client.messages.create(model=ClaudeClient.MODEL, max_tokens=4096, temperature=0, **request)
+    usage = ClaudeClient.response_usage(response)
+    usage["latency"] = time.perf_counter() - start
+    return usage
+
+
+def run(client: anthropic.Anthropic, repeat: int) -> None:
+    print(f"{'request':>22} {'prompt':>7} {'call':>4} {'input':>7} {'cache rd':>9} {'cache wr':>9} "
+          f"{'output':>7} {'seconds':>8}")
+    for name, before, after in scenarios():
+        for label, request in (("before", before), ("after", after)):
+            for call in range(1, repeat + 1):
+                usage = send(client, request)
+                print(f"{name:>22} {label:>7} {call:>4} {usage['input_tokens']:>7} "
+                      f"{usage['cache_read_input_tokens']:>9} {usage['cache_creation_input_tokens']:>9} "
+                      f"{usage['output_tokens']:>7} {usage['latency']:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--live', action='store_true', help='Measure against the real API')
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--min-cache-tokens', type=int, default=1024,
+                        help="Stub's minimum cacheable prefix (the API's is 1024 or 2048 depending on the model)")
+    args = parser.parse_args()
+    if args.live:
+        run(anthropic.Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"]), args.repeat)
+    else:
+        with MockAnthropicServer(latency=0.0, min_cache_tokens=args.min_cache_tokens) as server:
+            run(anthropic.Anthropic(api_key="sk-bench", base_url=server.base_url, max_retries=0), args.repeat)
@@ -0,0 +1,103 @@
+"""
+Time to first error and parse cost of streamed versus buffered generation.
+
+A local MockAnthropicServer produces the reply at --chunk-size characters
+every --chunk-delay seconds, like a model generating tokens. "buffered" is
+the old path: wait for the whole message, extract the JSON (one parse) and
+validate it with JsonHandler (a second parse). "streamed" feeds the SSE
+stream to StreamingWorkflowParser, which checks each node as it completes
+and hangs up at the first structural error. The bad reply has a node
+without class_type near the start; the good reply is the template workflow.
+
+A second table times extraction alone on an in-memory response, without
+the network.
+
+Run from the repository root:
+    python -m benchmarks.bench_stream_extraction
+"""
+import argparse
+import json
+import time
+
+import anthropic
+
+from claude_client import ClaudeClient
+from json_handler import JsonHandler
+from mock_anthropic_server import MockAnthropicServer
+from streaming_json import parse_workflow_stream
+from workflow_templates import WorkflowTemplates
+
+
+def good_reply() -> str:
+    return json.dumps(WorkflowTemplates.build("an image of a lighthouse at dusk"), indent=2)
+
+
+def bad_reply() -> str:
+    workflow = WorkflowTemplates.build("an image of a lighthouse at dusk")
+    first = next(iter(workflow["nodes"]))
+    del workflow["nodes"][first]["class_type"]
+    return json.dumps(workflow, indent=2)
+
+
+def buffered(client: anthropic.Anthropic) -> tuple:
+    """Seconds until the errors are known, and how many were found"""
+    start = time.perf_counter()
+    response = client.messages.create(model=ClaudeClient.MODEL, max_tokens=4096,
+                                      messages=[{"role": "user", "content": "workflow"}])
+    workflow_json = ClaudeClient.extract_json_from_response(response.content[0].text)
+    errors = JsonHandler.collect_errors(workflow_json)
+    return time.perf_counter() - start, len(errors)
+
+
+def streamed(client: anthropic.Anthropic) -> tuple:
+    start = time.perf_counter()
+    with client.messages.stream(model=ClaudeClient.MODEL, max_tokens=4096,
+                                messages=[{"role": "user", "content": "workflow"}]) as stream:
+        parser = parse_workflow_stream(stream.text_stream)
+    elapsed = time.perf_counter() - start
+    if parser.fatal is None:
+        # A complete response still gets the whole-graph checks, on the dict already parsed
+        errors = JsonHandler.collect_errors(parser.result)
+        return time.perf_counter() - start, len(errors)
+    return elapsed, len(parser.errors)
+
+
+def extraction(text: str, repeat: int) -> tuple:
+    """Microseconds per response: extract + validate from text, versus parse once + validate the dict"""
+    response = "Here is the workflow:\n" + text
+    start = time.perf_counter()
+    for _ in range(repeat):
+        JsonHandler.collect_errors(ClaudeClient.extract_json_from_response(response))
+    old = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parser = parse_workflow_stream(response[i:i + 16] for i in range(0, len(response), 16))
+        JsonHandler.collect_errors(parser.result)
+    new = (time.perf_counter() - start) / repeat
+    return old * 1e6, new * 1e6
+
+
+def run(chunk_size: int, chunk_delay: float, latency: float, repeat: int) -> None:
+    print(f"reply generated at {chunk_size} chars / {chunk_delay * 1000:.0f} ms, first byte after "
+          f"{latency * 1000:.0f} ms")
+    print(f"{'reply':>6} {'mode':>9} {'seconds':>9} {'errors':>7}")
+    for name, body in (("bad", bad_reply()), ("good", good_reply())):
+        with MockAnthropicServer(latency=latency, body=body, chunk_size=chunk_size,
+                                 chunk_delay=chunk_delay) as server:
+            client = anthropic.Anthropic(api_key="sk-bench", base_url=server.base_url, max_retries=0)
+            for mode, measure in (("buffered", buffered), ("streamed", streamed)):
+                seconds, errors = measure(client)
+                print(f"{name:>6} {mode:>9} {seconds:>9.3f} {errors:>7}")
+
+    old, new = extraction(good_reply(), repeat)
+    print(f"\nextract + validate, good reply: buffered {old:.0f} us, streamed (16-char chunks) {new:.0f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunk-size', type=int, default=16)
+    parser.add_argument('--chunk-delay', type=float, default=0.02)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+    run(args.chunk_size, args.chunk_delay, args.latency, args.repeat)
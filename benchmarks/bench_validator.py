@@ -0,0 +1,65 @@
+"""
+Per-node cost of JsonHandler's compiled single-pass validator on large graphs.
+
+Graphs are built by tiling the seven-node text-to-image workflow until the
+requested node count is reached; every tile is wired through connections so
+the connection checks run too.
+
+Run from the repository root:
+    python -m benchmarks.bench_validator
+"""
+import argparse
+import json
+import time
+
+from json_handler import JsonHandler
+from workflow_templates import WorkflowTemplates
+
+
+def build_graph(node_count: int) -> dict:
+    tile = WorkflowTemplates.build("a photo of a lighthouse at dusk")["nodes"]
+    nodes, connections = {}, {}
+    offset = 0
+    while len(nodes) < node_count:
+        mapping = {node_id: str(int(node_id) + offset) for node_id in tile}
+        for node_id, node in tile.items():
+            inputs = {
+                name: [mapping[value[0]], value[1]] if isinstance(value, list) else value
+                for name, value in node["inputs"].items()
+            }
+            nodes[mapping[node_id]] = {"class_type": node["class_type"], "inputs": inputs}
+            links = {name: value for name, value in inputs.items() if isinstance(value, list)}
+            if links:
+                connections[mapping[node_id]] = {"inputs": links}
+        offset += 100
+    return {"nodes": nodes, "connections": connections}
+
+
+def measure(workflow, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        errors = JsonHandler.collect_errors(workflow)
+        best = min(best, time.perf_counter() - start)
+    assert not errors, errors[:3]
+    return best
+
+
+def run(sizes: list, repeat: int) -> None:
+    print(f"{'nodes':>8} {'dict total':>12} {'per node':>10} {'json total':>12} {'per node':>10}")
+    for size in sizes:
+        workflow = build_graph(size)
+        as_json = json.dumps(workflow)
+        count = len(workflow["nodes"])
+        from_dict = measure(workflow, repeat)
+        from_json = measure(as_json, repeat)
+        print(f"{count:>8} {from_dict * 1e3:>10.2f}ms {from_dict / count * 1e6:>8.2f}us "
+              f"{from_json * 1e3:>10.2f}ms {from_json / count * 1e6:>8.2f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2500, 5000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
@@ -0,0 +1,184 @@
+"""
+Load test of the sync and concurrent ComfyUI client paths against the mock server.
+
+The mock ComfyUI server runs in its own process (python -m
+mock_comfyui_server), so the client's memory is measured on its own, and
+each mode runs in a fresh child process for the same reason:
+
+    sync   --clients threads, each calling ComfyUIClient.execute_workflow
+           in a loop (one shared client, like batch_runner)
+    async  one AsyncComfyUIClient with max_concurrency=--clients
+
+Every mode submits --jobs prompts and reports completed jobs/s,
+submissions/s as seen by the server (/mock/stats), end-to-end latency
+percentiles per job (submit to images on disk) and client memory: the
+tracemalloc peak of Python allocations (only with --tracemalloc, which
+slows the client down) and the growth of the process's peak RSS.
+
+Server behaviour is set with the mock's own options (--node-delay,
+--workers, --failure-rate, --http-error-rate, --image-bytes); failed jobs
+are counted and left out of the latency figures.
+
+Run from the repository root:
+    python -m benchmarks.load_test [--modes sync async] [--clients 16]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from urllib.request import urlopen
+
+from async_comfyui_client import AsyncComfyUIClient
+from comfyui_client import ComfyUIClient
+from tracing import percentile
+
+WORKFLOW_PATH = "outputs/workflow_20250124_211718_create_a_simple_worflow_that_g.json"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(args: argparse.Namespace) -> tuple:
+    """Start the mock in a subprocess; returns (process, host, port)"""
+    command = [sys.executable, "-m", "mock_comfyui_server", "--port", "0",
+               "--node-delay", str(args.node_delay), "--workers", str(args.workers),
+               "--failure-rate", str(args.failure_rate), "--http-error-rate", str(args.http_error_rate),
+               "--image-bytes", str(args.image_bytes), "--seed", "0"]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        raise RuntimeError("Mock ComfyUI server did not start")
+    host, port = line.strip().rsplit("//", 1)[1].rsplit(":", 1)
+    return process, host, int(port)
+
+
+def server_stats(host: str, port: int) -> dict:
+    with urlopen(f"http://{host}:{port}/mock/stats") as response:
+        return json.load(response)
+
+
+def rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_sync(host: str, port: int, workflow: dict, jobs: int, clients: int) -> list:
+    """Latency in seconds of every job (None if it failed)"""
+    latencies = []
+    remaining = iter(range(jobs))
+    lock = threading.Lock()
+
+    with ComfyUIClient(host=host, port=port) as client:
+        client.execute_workflow(workflow)
+
+        def worker() -> None:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                start = time.perf_counter()
+                result = client.execute_workflow(workflow)
+                latencies.append(time.perf_counter() - start if result is not None else None)
+
+        threads = [threading.Thread(target=worker) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return latencies
+
+
+async def run_async(host: str, port: int, workflow: dict, jobs: int, clients: int) -> list:
+    latencies = []
+    remaining = iter(range(jobs))
+
+    async with AsyncComfyUIClient(host=host, port=port, max_concurrency=clients) as client:
+        await client.execute_workflow(workflow)
+
+        # Same shape as the sync run, so latency excludes time spent waiting for a slot
+        async def worker() -> None:
+            while next(remaining, None) is not None:
+                start = time.perf_counter()
+                result = await client.execute_workflow(workflow)
+                latencies.append(time.perf_counter() - start if result is not None else None)
+
+        await asyncio.gather(*(worker() for _ in range(clients)))
+    return latencies
+
+
+def measure(mode: str, host: str, port: int, jobs: int, clients: int, trace_memory: bool) -> dict:
+    """Run one mode in this (child) process and return its figures"""
+    with open(os.path.join(REPO_ROOT, WORKFLOW_PATH)) as f:
+        workflow = json.load(f)
+    # Downloaded images land in ./outputs; keep them out of the repository
+    os.chdir(tempfile.mkdtemp(prefix="comfyui_load_"))
+
+    rss_before = rss_mb()
+    if trace_memory:
+        tracemalloc.start()
+    before = server_stats(host, port)
+    start = time.perf_counter()
+    if mode == "sync":
+        latencies = run_sync(host, port, workflow, jobs, clients)
+    else:
+        latencies = asyncio.run(run_async(host, port, workflow, jobs, clients))
+    elapsed = time.perf_counter() - start
+    after = server_stats(host, port)
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20 if trace_memory else None
+    tracemalloc.stop()
+
+    done = [latency for latency in latencies if latency is not None]
+    submitted = after["submitted"] - before["submitted"]
+    return {
+        "mode": mode,
+        "completed": len(done),
+        "failed": len(latencies) - len(done),
+        "jobs_per_s": len(done) / elapsed,
+        "submits_per_s": submitted / elapsed,
+        "p50": percentile(done, 0.50) if done else float("nan"),
+        "p95": percentile(done, 0.95) if done else float("nan"),
+        "p99": percentile(done, 0.99) if done else float("nan"),
+        "tracemalloc_mb": peak,
+        "rss_growth_mb": rss_mb() - rss_before,
+    }
+
+
+def run(args: argparse.Namespace) -> None:
+    process, host, port = start_server(args)
+    try:
+        print(f"{args.jobs} jobs, {args.clients} clients, node delay {args.node_delay * 1000:.1f} ms, "
+              f"{args.workers} server workers, {args.image_bytes} byte images")
+        print(f"{'mode':>6} {'done':>6} {'failed':>6} {'jobs/s':>8} {'submit/s':>9} {'p50 ms':>8} "
+              f"{'p95 ms':>8} {'p99 ms':>8} {'heap MB':>8} {'RSS +MB':>8}")
+        for mode in args.modes:
+            # A fresh interpreter per mode so peak RSS is not inherited from the previous one
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                r = pool.submit(measure, mode, host, port, args.jobs, args.clients, args.tracemalloc).result()
+            heap = f"{r['tracemalloc_mb']:.1f}" if r["tracemalloc_mb"] is not None else "-"
+            print(f"{r['mode']:>6} {r['completed']:>6} {r['failed']:>6} {r['jobs_per_s']:>8.1f} "
+                  f"{r['submits_per_s']:>9.1f} {r['p50'] * 1000:>8.1f} {r['p95'] * 1000:>8.1f} "
+                  f"{r['p99'] * 1000:>8.1f} {heap:>8} {r['rss_growth_mb']:>8.1f}")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=['sync', 'async'], default=['sync', 'async'])
+    parser.add_argument('--jobs', type=int, default=300)
+    parser.add_argument('--clients', type=int, default=16, help='Threads (sync) or max_concurrency (async)')
+    parser.add_argument('--tracemalloc', action='store_true', help='Also report the Python heap peak')
+    parser.add_argument('--node-delay', type=float, default=0.001)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--http-error-rate', type=float, default=0.0)
+    parser.add_argument('--image-bytes', type=int, default=64 * 1024)
+    run(parser.parse_args())
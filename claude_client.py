@@ -1,14 +1,197 @@
 import anthropic
-from typing import Dict, Any
+import hashlib
+import logging
+from typing import Dict, Any, Iterable, List, Optional, Tuple, Union
 import json
 import os
+from json_handler import WorkflowValidationError
+from streaming_json import parse_workflow_stream
+import tracing
+from workflow_cache import WorkflowCache
+from workflow_graph import WorkflowGraph, merge_excerpt
+from workflow_templates import WorkflowTemplates
+
+# Example shown in the generation instructions (a plain string, not an f-string)
+_EXAMPLE_WORKFLOW = '''
+{
+    "nodes": {
+        "1": {
+            "class_type": "CLIPTextEncode",
+            "inputs": {
+                "text": "mountain landscape",
+                "clip": ["4", 1]
+            }
+        }
+    },
+    "connections": {
+        "3": {
+            "inputs": {
+                "positive": ["1", 0]
+            }
+        }
+    }
+}'''
+
+# A complete text-to-image graph, shown in the node reference
+_COMPLETE_WORKFLOW = '''
+{
+    "nodes": {
+        "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "v1-5-pruned-emaonly.safetensors"}},
+        "6": {"class_type": "CLIPTextEncode", "inputs": {"text": "a lighthouse at dusk, watercolor", "clip": ["4", 1]}},
+        "7": {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry, low quality, distorted", "clip": ["4", 1]}},
+        "5": {"class_type": "EmptyLatentImage", "inputs": {"width": 512, "height": 512, "batch_size": 1}},
+        "3": {
+            "class_type": "KSampler",
+            "inputs": {
+                "seed": 156680208700286,
+                "steps": 20,
+                "cfg": 8.0,
+                "sampler_name": "euler",
+                "scheduler": "normal",
+                "denoise": 1.0,
+                "model": ["4", 0],
+                "positive": ["6", 0],
+                "negative": ["7", 0],
+                "latent_image": ["5", 0]
+            }
+        },
+        "8": {"class_type": "VAEDecode", "inputs": {"samples": ["3", 0], "vae": ["4", 2]}},
+        "10": {"class_type": "ImageScaleBy", "inputs": {"image": ["8", 0], "upscale_method": "bicubic", "scale_by": 2.0}},
+        "9": {"class_type": "SaveImage", "inputs": {"images": ["10", 0], "filename_prefix": "ComfyUI"}}
+    },
+    "connections": {}
+}'''
+
+# Reference for the common core nodes, shared by the generate and refine system prompts. Besides
+# helping the model get types and output indices right, it makes the static prefix long enough
+# (over 1024 tokens) for the provider to cache it.
+NODE_REFERENCE = (
+    "ComfyUI core node reference. Every input is either a literal value of the listed type or a link "
+    "[source_node_id, output_index] to an output of the listed type. Output indices start at 0, in the "
+    "order given for each node.\n\n"
+    "CheckpointLoaderSimple\n"
+    "  inputs: ckpt_name (checkpoint file name, e.g. \"v1-5-pruned-emaonly.safetensors\")\n"
+    "  outputs: 0 MODEL, 1 CLIP, 2 VAE\n"
+    "CLIPTextEncode\n"
+    "  inputs: text (STRING, the prompt), clip (link to CLIP)\n"
+    "  outputs: 0 CONDITIONING\n"
+    "EmptyLatentImage\n"
+    "  inputs: width (INT 16-16384, multiple of 8, default 512), height (INT 16-16384, multiple of 8, "
+    "default 512), batch_size (INT 1-4096, default 1)\n"
+    "  outputs: 0 LATENT\n"
+    "KSampler\n"
+    "  inputs: model (link to MODEL), positive (link to CONDITIONING), negative (link to CONDITIONING), "
+    "latent_image (link to LATENT), seed (INT 0-18446744073709551615), steps (INT 1-10000, default 20), "
+    "cfg (FLOAT 0.0-100.0, default 8.0), sampler_name (one of the sampler names below), scheduler (one of "
+    "the scheduler names below), denoise (FLOAT 0.0-1.0, 1.0 for text-to-image, lower to keep more of an "
+    "input latent)\n"
+    "  outputs: 0 LATENT\n"
+    "VAEDecode\n"
+    "  inputs: samples (link to LATENT), vae (link to VAE)\n"
+    "  outputs: 0 IMAGE\n"
+    "VAEEncode\n"
+    "  inputs: pixels (link to IMAGE), vae (link to VAE)\n"
+    "  outputs: 0 LATENT\n"
+    "VAELoader\n"
+    "  inputs: vae_name (VAE file name)\n"
+    "  outputs: 0 VAE\n"
+    "LoraLoader\n"
+    "  inputs: model (link to MODEL), clip (link to CLIP), lora_name (LoRA file name), strength_model "
+    "(FLOAT -100.0-100.0, default 1.0), strength_clip (FLOAT -100.0-100.0, default 1.0)\n"
+    "  outputs: 0 MODEL, 1 CLIP (feed these to KSampler and CLIPTextEncode instead of the checkpoint's)\n"
+    "LoadImage\n"
+    "  inputs: image (file name in the ComfyUI input folder)\n"
+    "  outputs: 0 IMAGE, 1 MASK\n"
+    "ImageScale\n"
+    "  inputs: image (link to IMAGE), upscale_method (one of nearest-exact, bilinear, area, bicubic, "
+    "lanczos), width (INT 0-16384), height (INT 0-16384), crop (disabled or center)\n"
+    "  outputs: 0 IMAGE\n"
+    "ImageScaleBy\n"
+    "  inputs: image (link to IMAGE), upscale_method (as for ImageScale), scale_by (FLOAT 0.01-8.0)\n"
+    "  outputs: 0 IMAGE\n"
+    "SaveImage\n"
+    "  inputs: images (link to IMAGE), filename_prefix (STRING, optional, default \"ComfyUI\")\n"
+    "  outputs: none; this is an output node, and a workflow needs at least one to execute\n"
+    "PreviewImage\n"
+    "  inputs: images (link to IMAGE)\n"
+    "  outputs: none; an output node that keeps the images in the temp folder\n\n"
+    "Sampler names: euler, euler_cfg_pp, euler_ancestral, euler_ancestral_cfg_pp, heun, heunpp2, dpm_2, "
+    "dpm_2_ancestral, lms, dpm_fast, dpm_adaptive, dpmpp_2s_ancestral, dpmpp_sde, dpmpp_2m, dpmpp_2m_sde, "
+    "dpmpp_3m_sde, ddpm, lcm, ddim, uni_pc, uni_pc_bh2.\n"
+    "Scheduler names: normal, karras, exponential, sgm_uniform, simple, ddim_uniform, beta.\n\n"
+    "Common mistakes to avoid: linking CLIPTextEncode.clip to output 0 of the checkpoint loader (that is "
+    "MODEL; CLIP is output 1), linking VAEDecode.vae to output 1 (VAE is output 2), passing numbers as "
+    "strings (\"20\" instead of 20), leaving out the negative prompt, width or height that are not "
+    "multiples of 8, and referring to node IDs that do not exist.\n\n"
+    f"A complete text-to-image workflow with a 2x upscale:\n{_COMPLETE_WORKFLOW}"
+)
+
+# Static generation instructions, sent as a cacheable system block
+GENERATE_INSTRUCTIONS = (
+    "You are a ComfyUI workflow generator. Generate a valid JSON workflow for the description you are given.\n\n"
+    "IMPORTANT: Your response must contain ONLY the JSON object with no additional text, markdown formatting, or explanations.\n\n"
+    "The workflow MUST include these required node types with their mandatory inputs:\n\n"
+    "1. CLIPTextEncode:\n"
+    '   - inputs: {\n'
+    '       "text": "prompt text" (string),\n'
+    '       "clip": [node_id, output_index] (list)\n'
+    '   }\n\n'
+    "2. KSampler:\n"
+    '   - inputs: {\n'
+    '       "seed": (integer),\n'
+    '       "steps": (integer),\n'
+    '       "cfg": (number),\n'
+    '       "sampler_name": (string),\n'
+    '       "scheduler": (string),\n'
+    '       "denoise": (number between 0-1),\n'
+    '       "model": [node_id, output_index],\n'
+    '       "positive": [node_id, output_index],\n'
+    '       "negative": [node_id, output_index],\n'
+    '       "latent_image": [node_id, output_index]\n'
+    '   }\n\n'
+    "3. VAEDecode:\n"
+    '   - inputs: {\n'
+    '       "samples": [node_id, output_index],\n'
+    '       "vae": [node_id, output_index]\n'
+    '   }\n\n'
+    "4. SaveImage:\n"
+    '   - inputs: {\n'
+    '       "images": [node_id, output_index],\n'
+    '       "filename_prefix": (string, optional)\n'
+    '   }\n\n'
+    "All node connections must use the format: [source_node_id, output_index]\n"
+    "Each node must have a unique numeric ID and include class_type and inputs fields.\n\n"
+    f"Example workflow structure:\n{_EXAMPLE_WORKFLOW}\n\n"
+    "Remember: Return ONLY the JSON object with no additional text."
+)
+
+# Static refine instructions, sent as a cacheable system block
+REFINE_INSTRUCTIONS = (
+    "You previously generated a ComfyUI workflow JSON, but it contains some errors. "
+    "You will be given the workflow JSON and the errors. "
+    "Please correct the errors and provide a refined JSON workflow. "
+    "If you are given an excerpt of the workflow (only the nodes with errors and the nodes linked to them), "
+    "return the corrected excerpt in the same structure; you may add nodes, and every node you leave out "
+    "is kept unchanged. "
+    "IMPORTANT: Your response must contain ONLY the JSON object with no additional text, markdown formatting, or explanations."
+)
+
 
 class ClaudeClient:
-    def __init__(self, api_key: str):
-        self.client = anthropic.Client(api_key=api_key)
+    MODEL = "claude-3-opus-20240229"
+
+    def __init__(self, api_key: str, cache: Optional[WorkflowCache] = None, use_templates: bool = True,
+                 base_url: Optional[str] = None):
+        self.client = anthropic.Client(api_key=api_key, base_url=base_url)
         self.api_key = api_key
+        self.cache = cache
+        # Build known text-to-image intents locally and only call the API as a fallback
+        self.use_templates = use_templates
+        # Identifies the generation prompt so template edits invalidate cached workflows
+        self.template_fingerprint = self.prompt_fingerprint()
 
-    def _extract_json_from_response(self, text: str) -> str:
+    @staticmethod
+    def extract_json_from_response(text: str) -> str:
         """Extract JSON from Claude's response by looking for the first { and last }"""
         try:
             start = text.find('{')
@@ -20,166 +203,290 @@ class ClaudeClient:
             json.loads(json_str)
             return json_str
         except Exception as e:
-            print(f"Failed to extract JSON: {str(e)}")
-            print(f"Response text: {text[:200]}...")  # Print first 200 chars
+            logging.error(f"Failed to extract JSON: {str(e)}")
+            logging.debug(f"Response text: {text[:200]}...")  # First 200 chars only
             raise ValueError("Could not extract valid JSON from response")
 
-    def generate_workflow(self, description: str) -> str:
+    @staticmethod
+    def prompt_fingerprint() -> str:
+        """Hash of the generation prompt, so prompt edits invalidate cached workflows"""
+        template = NODE_REFERENCE + GENERATE_INSTRUCTIONS + ClaudeClient.build_generate_prompt("")
+        return hashlib.sha256(template.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def system_blocks(instructions: str) -> List[Dict[str, Any]]:
+        """
+        Node reference and static instructions as system blocks marked for prompt caching
+
+        Both blocks are identical on every call and together exceed the
+        1024-token minimum for caching, so from the second call on the
+        provider serves them from its prompt cache instead of processing
+        them again; only the per-request user message is new.
+        """
+        return [{"type": "text", "text": NODE_REFERENCE},
+                {"type": "text", "text": instructions, "cache_control": {"type": "ephemeral"}}]
+
+    @staticmethod
+    def build_generate_prompt(description: str) -> str:
+        """Build the per-request part of the generation prompt (the rest is GENERATE_INSTRUCTIONS)"""
+        return f"Generate a valid JSON workflow for this description: {description}"
+
+    def generate_workflow(self, description: str, use_cache: bool = True) -> str:
         """
         Generate a ComfyUI workflow JSON based on the provided description
 
         Args:
             description: User's description of the desired workflow
+            use_cache: Look up and store the result in the workflow cache, if
+                one is configured; False forces a fresh API call
 
         Returns:
             str: JSON string containing the generated workflow
         """
-        print(f"\nGenerating workflow for description: {description}")
+        logging.info(f"Generating workflow for description: {description}")
 
-        # Create the prompt template without f-strings
-        example_workflow = '''
-{
-    "nodes": {
-        "1": {
-            "class_type": "CLIPTextEncode",
-            "inputs": {
-                "text": "mountain landscape",
-                "clip": ["4", 1]
-            }
-        }
-    },
-    "connections": {
-        "3": {
-            "inputs": {
-                "positive": ["1", 0]
-            }
-        }
-    }
-}'''
+        if self.use_templates:
+            workflow = WorkflowTemplates.build(description)
+            if workflow is not None:
+                logging.info("Built workflow from local template")
+                return json.dumps(workflow)
 
-        # Build the prompt with proper string formatting
-        prompt = (
-            f"You are a ComfyUI workflow generator. Generate a valid JSON workflow for this description: {description}\n\n"
-            "IMPORTANT: Your response must contain ONLY the JSON object with no additional text, markdown formatting, or explanations.\n\n"
-            "The workflow MUST include these required node types with their mandatory inputs:\n\n"
-            "1. CLIPTextEncode:\n"
-            '   - inputs: {\n'
-            '       "text": "prompt text" (string),\n'
-            '       "clip": [node_id, output_index] (list)\n'
-            '   }\n\n'
-            "2. KSampler:\n"
-            '   - inputs: {\n'
-            '       "seed": (integer),\n'
-            '       "steps": (integer),\n'
-            '       "cfg": (number),\n'
-            '       "sampler_name": (string),\n'
-            '       "scheduler": (string),\n'
-            '       "denoise": (number between 0-1),\n'
-            '       "model": [node_id, output_index],\n'
-            '       "positive": [node_id, output_index],\n'
-            '       "negative": [node_id, output_index],\n'
-            '       "latent_image": [node_id, output_index]\n'
-            '   }\n\n'
-            "3. VAEDecode:\n"
-            '   - inputs: {\n'
-            '       "samples": [node_id, output_index],\n'
-            '       "vae": [node_id, output_index]\n'
-            '   }\n\n'
-            "4. SaveImage:\n"
-            '   - inputs: {\n'
-            '       "images": [node_id, output_index],\n'
-            '       "filename_prefix": (string, optional)\n'
-            '   }\n\n'
-            "All node connections must use the format: [source_node_id, output_index]\n"
-            "Each node must have a unique numeric ID and include class_type and inputs fields.\n\n"
-            f"Example workflow structure:\n{example_workflow}\n\n"
-            "Remember: Return ONLY the JSON object with no additional text."
-        )
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = WorkflowCache.make_key(description, self.MODEL, self.template_fingerprint)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logging.info("Using cached workflow")
+                return cached
+
+        prompt = self.build_generate_prompt(description)
 
         try:
-            print(f"Using API key in generate_workflow: {self.api_key[:4]}...{self.api_key[-4:]}")
-            print("Sending [RAW PROMPT] request to Claude API...")
-            response = self.client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=4096,
-                temperature=0,
-                messages=[{
-                    "role": "user",
-                    "content": prompt
-                }],
-                timeout=30
-            )
+            logging.debug(f"Using API key in generate_workflow: {self.api_key[:4]}...{self.api_key[-4:]}")
+            logging.debug("Sending [RAW PROMPT] request to Claude API...")
+            with tracing.span("generate") as span:
+                response = self.client.messages.create(
+                    model=self.MODEL,
+                    max_tokens=4096,
+                    temperature=0,
+                    system=self.system_blocks(GENERATE_INSTRUCTIONS),
+                    messages=[{
+                        "role": "user",
+                        "content": prompt
+                    }],
+                    timeout=30
+                )
+                span.set(**self.response_usage(response))
 
-            print("Received response from Claude API")
+            logging.debug("Received response from Claude API")
 
             if not response.content or not response.content[0].text:
                 raise Exception("Empty response received from Claude API")
 
             # Extract and validate JSON from the response
-            workflow_json = self._extract_json_from_response(response.content[0].text)
+            with tracing.span("extract"):
+                workflow_json = self.extract_json_from_response(response.content[0].text)
+
+            if cache_key is not None:
+                self.cache.put(cache_key, workflow_json)
 
             return workflow_json
 
         except anthropic.APIError as e:
-            print(f"Claude API Error: {str(e)}")
+            logging.error(f"Claude API Error: {str(e)}")
             if "rate limit" in str(e).lower():
                 raise Exception("Rate limit exceeded. Please try again in a few minutes.")
             raise Exception(f"Error calling Claude API: {str(e)}")
         except Exception as e:
-            print(f"Unexpected error: {str(e)}")
+            logging.error(f"Unexpected error: {str(e)}")
             raise Exception(f"Unexpected error while generating workflow: {str(e)}")
 
-    def refine_workflow_with_claude(self, workflow: Dict[str, Any], error_log: str) -> Dict[str, Any]:
+    def generate_workflow_stream(self, description: str, use_cache: bool = True,
+                                 max_attempts: int = 2) -> Tuple[Dict[str, Any], str]:
         """
-        Refine the workflow JSON using Claude based on the provided error log.
+        Generate a workflow, parsing and checking the response while it streams
+
+        Each node is validated as soon as its JSON is complete. A structural
+        error (broken JSON, a node without class_type, ...) stops the
+        generation at once and starts a new attempt, instead of waiting for
+        the rest of a response that is bound to fail. Input-level errors are
+        left for auto-repair and refine.
 
         Args:
-            workflow: Dictionary containing the workflow JSON
-            error_log: String containing validation errors
+            description: User's description of the desired workflow
+            use_cache: Look up and store the result in the workflow cache
+            max_attempts: Generations to try before giving up on structural errors
 
         Returns:
-            Dict containing the refined JSON
+            Tuple of (parsed workflow dict, its JSON text); pass the dict on
+            so it is not parsed again
+
+        Raises:
+            WorkflowValidationError: If every attempt hit a structural error
+        """
+        logging.info(f"Generating workflow for description: {description}")
+
+        if self.use_templates:
+            workflow = WorkflowTemplates.build(description)
+            if workflow is not None:
+                logging.info("Built workflow from local template")
+                return workflow, json.dumps(workflow)
+
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = WorkflowCache.make_key(description, self.MODEL, self.template_fingerprint)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logging.info("Using cached workflow")
+                return json.loads(cached), cached
+
+        prompt = self.build_generate_prompt(description)
+
+        for attempt in range(1, max_attempts + 1):
+            try:
+                logging.debug("Streaming [RAW PROMPT] request to Claude API...")
+                with tracing.span("generate", attempt=attempt, stream=True) as span, self.client.messages.stream(
+                    model=self.MODEL,
+                    max_tokens=4096,
+                    temperature=0,
+                    system=self.system_blocks(GENERATE_INSTRUCTIONS),
+                    messages=[{
+                        "role": "user",
+                        "content": prompt
+                    }],
+                    timeout=30
+                ) as stream:
+                    # Leaving the block early closes the connection and ends the generation
+                    parser = parse_workflow_stream(stream.text_stream)
+                    span.set(nodes=parser.node_count, aborted=parser.fatal is not None)
+                # Parsing is interleaved with generation; this is the time spent parsing
+                tracing.record("extract", parser.parse_seconds, nodes=parser.node_count)
+            except anthropic.APIError as e:
+                logging.error(f"Claude API Error: {str(e)}")
+                if "rate limit" in str(e).lower():
+                    raise Exception("Rate limit exceeded. Please try again in a few minutes.")
+                raise Exception(f"Error calling Claude API: {str(e)}")
+
+            if parser.fatal is None:
+                logging.debug(f"Received {parser.node_count} node(s) from Claude API")
+                if cache_key is not None:
+                    self.cache.put(cache_key, parser.text)
+                return parser.result, parser.text
+
+            logging.warning(f"Generation attempt {attempt} stopped after {parser.first_error_at:.2f}s "
+                            f"({parser.node_count} node(s)): {parser.fatal}")
+
+        raise WorkflowValidationError(parser.errors)
+
+    @staticmethod
+    def build_refine_prompt(workflow: Union[str, Dict[str, Any]], error_log: str, excerpt: bool = False) -> str:
+        """Build the per-request part of the refine prompt; workflow may be raw text if it did not parse"""
+        # Compact separators: indentation costs tokens and tells the model nothing
+        workflow_text = workflow if isinstance(workflow, str) else json.dumps(workflow, separators=(',', ':'))
+        if excerpt:
+            header = "Here is an excerpt of the workflow JSON (the nodes with errors and the nodes linked to them):"
+        else:
+            header = "Here is the workflow JSON:"
+        return f"{header}\n\n{workflow_text}\n\nAnd here are the errors:\n\n{error_log}"
+
+    @staticmethod
+    def prepare_refinement(workflow: Union[str, Dict[str, Any]], error_log: str,
+                            focus: Optional[Iterable[str]] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
         """
-        prompt = (
-            "You previously generated a ComfyUI workflow JSON, but it contains some errors. "
-            "Here is the workflow JSON:\n\n"
-            f"{json.dumps(workflow, indent=2)}\n\n"
-            "And here are the errors:\n\n"
-            f"{error_log}\n\n"
-            "Please correct the errors and provide a refined JSON workflow. "
-            "IMPORTANT: Your response must contain ONLY the JSON object with no additional text, markdown formatting, or explanations."
-        )
+        Build the refine prompt, sending only the neighbourhood of the focus nodes when that is smaller
+
+        Returns:
+            Tuple of (prompt, the full workflow the reply must be merged
+            into, or None if the whole workflow was sent)
+        """
+        if focus is not None and isinstance(workflow, dict) and isinstance(workflow.get('nodes'), dict):
+            focus = set(focus)
+            nodes = workflow['nodes']
+            if focus and focus.issubset(nodes):
+                graph = WorkflowGraph(nodes, workflow.get('connections') if isinstance(
+                    workflow.get('connections'), dict) else None)
+                if len(graph.neighbourhood(focus)) < len(nodes):
+                    return ClaudeClient.build_refine_prompt(graph.excerpt(workflow, focus), error_log, True), workflow
+        return ClaudeClient.build_refine_prompt(workflow, error_log), None
+
+    @staticmethod
+    def finish_refinement(text: str, base: Optional[Dict[str, Any]]) -> str:
+        """Extract the refined JSON from a reply, merging an excerpt back into the full workflow"""
+        workflow_json = ClaudeClient.extract_json_from_response(text)
+        if base is None:
+            return workflow_json
+        return json.dumps(merge_excerpt(base, json.loads(workflow_json)), separators=(',', ':'))
+
+    @staticmethod
+    def response_usage(response: Any) -> Dict[str, int]:
+        """Token usage of a response, including prompt-cache reads and writes"""
+        usage = getattr(response, 'usage', None)
+        return {
+            name: getattr(usage, name, 0) or 0
+            for name in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+        }
+
+    def request_refinement(self, workflow: Union[str, Dict[str, Any]], error_log: str,
+                           timeout: float = 30, focus: Optional[Iterable[str]] = None) -> Tuple[str, Dict[str, int]]:
+        """
+        Send one refine request to Claude
+
+        Args:
+            workflow: Workflow dict, or the raw text if it is not valid JSON
+            error_log: Validation errors to fix
+            timeout: Request timeout in seconds
+            focus: IDs of the nodes the errors are about; if given, only those
+                nodes and their direct neighbours are sent, and the reply is
+                merged back into the full workflow
+
+        Returns:
+            Tuple of (refined workflow JSON string, token usage with
+            input_tokens, output_tokens, cache_read_input_tokens and
+            cache_creation_input_tokens)
+        """
+        prompt, base = self.prepare_refinement(workflow, error_log, focus)
 
         try:
-            print(f"Using API key in refine_workflow_with_claude: {self.api_key[:4]}...{self.api_key[-4:]}")
-            print("Sending [REFINE] request to Claude API...")
+            logging.debug("Sending [REFINE] request to Claude API...")
             response = self.client.messages.create(
-                model="claude-3-opus-20240229",
+                model=self.MODEL,
                 max_tokens=4096,
                 temperature=0,
+                system=self.system_blocks(REFINE_INSTRUCTIONS),
                 messages=[{
                     "role": "user",
                     "content": prompt
                 }],
-                timeout=30
+                timeout=timeout
             )
 
-            print("Received response from Claude API")
+            logging.debug("Received response from Claude API")
 
             if not response.content or not response.content[0].text:
                 raise Exception("Empty response received from Claude API")
 
             # Extract and validate JSON from the response
-            refined_workflow_json = self._extract_json_from_response(response.content[0].text)
-            refined_workflow = json.loads(refined_workflow_json)
-
-            return refined_workflow
+            return self.finish_refinement(response.content[0].text, base), self.response_usage(response)
 
         except anthropic.APIError as e:
-            print(f"Claude API Error: {str(e)}")
+            logging.error(f"Claude API Error: {str(e)}")
             if "rate limit" in str(e).lower():
                 raise Exception("Rate limit exceeded. Please try again in a few minutes.")
             raise Exception(f"Error calling Claude API: {str(e)}")
         except Exception as e:
-            print(f"Unexpected error: {str(e)}")
-            raise Exception(f"Unexpected error while refining workflow: {str(e)}")
\ No newline at end of file
+            logging.error(f"Unexpected error: {str(e)}")
+            raise Exception(f"Unexpected error while refining workflow: {str(e)}")
+
+    def refine_workflow_with_claude(self, workflow: Dict[str, Any], error_log: str) -> Dict[str, Any]:
+        """
+        Refine the workflow JSON using Claude based on the provided error log.
+
+        Args:
+            workflow: Dictionary containing the workflow JSON
+            error_log: String containing validation errors
+
+        Returns:
+            Dict containing the refined JSON
+        """
+        refined_workflow_json, _ = self.request_refinement(workflow, error_log)
+        return json.loads(refined_workflow_json)
@@ -1,172 +1,703 @@
+import collections
 import logging
+import queue
 import requests
 import json
-import websocket
-from typing import Dict, Any, Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Callable, BinaryIO, Iterable, Tuple, Union
 import uuid
 import os
-import socket
-from urllib import request
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from comfyui_session import WebSocketSession, history_events, parse_image_frame
+from result_store import ResultStore
+from workflow_format import to_api_prompt, graph_hash
+import tracing
+
+# Bytes read from the socket per write when streaming a download to disk
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class WorkflowResult:
+    """Outcome of executing one workflow in ComfyUI"""
+    prompt_id: str
+    # Raw per-node outputs as reported by ComfyUI
+    outputs: Dict[str, Any]
+    # Local paths of every image saved, in output-node order
+    paths: List[str] = field(default_factory=list)
+    # Image descriptors ({filename, subfolder, type}) that could not be downloaded
+    failed: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def image_path(self) -> Optional[str]:
+        """Path of the first saved image, if any"""
+        return self.paths[0] if self.paths else None
+
+
+# Called with (prompt_id, node_id, image format, image bytes) for every preview frame
+PreviewCallback = Callable[[str, Optional[str], str, bytes], None]
+
+
+class PendingPrompt:
+    """A queued prompt whose events are being buffered until it is collected"""
+
+    __slots__ = ('prompt_id', 'events', 'websocket_nodes', 'on_preview')
+
+    def __init__(self, prompt_id: str, events: "queue.Queue", websocket_nodes: set,
+                 on_preview: Optional[PreviewCallback]):
+        self.prompt_id = prompt_id
+        self.events = events
+        self.websocket_nodes = websocket_nodes
+        self.on_preview = on_preview
+
+
+def iter_output_images(outputs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """List every image descriptor across all output nodes"""
+    return [image for node_output in outputs.values() for image in (node_output.get('images') or [])]
+
+
+def local_image_name(prompt_id: str, image: Dict[str, Any]) -> str:
+    """
+    File name an output image is saved under locally
+
+    ComfyUI only keeps file names unique within one subfolder and type of
+    one server, so the name also carries the prompt ID, the type (unless
+    'output') and the subfolder. Concurrent downloads from several prompts
+    or backends into one directory then never overwrite each other.
+
+    Args:
+        prompt_id: Prompt that produced the image
+        image: Image descriptor with filename, subfolder and type
+
+    Returns:
+        Name such as comfyui_<prompt_id>_temp_<subfolder>_<filename>
+    """
+    parts = [prompt_id]
+    if image.get('type', 'output') != 'output':
+        parts.append(image['type'])
+    if image.get('subfolder'):
+        parts.append(image['subfolder'])
+    parts.append(image['filename'])
+    # Subfolders may be nested; keep every name inside the output directory
+    return "comfyui_" + "_".join(parts).replace('/', '_').replace('\\', '_')
+
+
+class ResultClaim:
+    """
+    A workflow's place in a ResultStore, from claim_result()
+
+    When leader is False the result already exists or another caller is
+    producing it: wait() returns it. When leader is True the caller must
+    execute the workflow and pass its result to complete() (None on
+    failure), which stores it and wakes everyone waiting on the same graph.
+    """
+
+    __slots__ = ('store', 'key', 'leader', 'future')
+
+    def __init__(self, store: Optional[ResultStore], key: Optional[str], future: "Future[Optional[WorkflowResult]]",
+                 leader: bool):
+        self.store = store
+        self.key = key
+        self.leader = leader
+        self.future = future
+
+    def wait(self) -> Optional[WorkflowResult]:
+        if not self.future.done():
+            logging.info("Waiting for an identical workflow that is already executing")
+        return self.future.result()
+
+    def complete(self, result: Optional[WorkflowResult]) -> None:
+        if not self.leader or self.future.done():
+            return
+        if self.key is None:
+            self.future.set_result(result)
+            return
+        try:
+            if result is not None and result.paths and not result.failed:
+                self.store.put(self.key, result.prompt_id, result.outputs, result.paths)
+        finally:
+            self.store.release(self.key, result)
+
+
+def claim_result(store: Optional[ResultStore], workflow: Dict[Any, Any],
+                 sink: Optional[Callable[[Dict[str, Any]], BinaryIO]] = None) -> ResultClaim:
+    """
+    Find a workflow's result in a store, or claim the right to produce it
+
+    Returns a finished claim for a graph whose images are still on disk,
+    one following the run in progress for an identical graph, or a leader
+    claim. Without a store, or with a sink (images not kept on disk), every
+    workflow leads and nothing is stored.
+    """
+    key = None
+    if store is not None and sink is None:
+        try:
+            key = graph_hash(workflow)
+        except ValueError:
+            # Not a valid workflow; queue_prompt reports why
+            pass
+    if key is None:
+        return ResultClaim(None, None, Future(), True)
+
+    future, leader = store.claim(key)
+    if not leader:
+        return ResultClaim(store, key, future, False)
+    # Looked up while holding the claim, so a run finishing meanwhile cannot be missed
+    entry = store.get(key)
+    if entry is not None:
+        logging.info(f"Reusing images of an identical workflow (prompt {entry['prompt_id']})")
+        store.release(key, WorkflowResult(prompt_id=entry['prompt_id'], outputs=entry['outputs'], paths=entry['paths']))
+        return ResultClaim(store, key, future, False)
+    return ResultClaim(store, key, future, True)
+
 
 class ComfyUIClient:
-    def __init__(self, host: str = "127.0.0.1", port: int = 8188, use_preloaded_json: bool = False, preloaded_json_path: str = "outputs/working_scale.json"):
+    # (connect, read) timeouts in seconds per REST endpoint
+    DEFAULT_TIMEOUTS = {
+        'check': (3.05, 5),
+        'prompt': (3.05, 30),
+        'history': (3.05, 5),
+        'view': (3.05, 60),
+        'object_info': (3.05, 30),
+    }
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8188, use_preloaded_json: bool = False, preloaded_json_path: str = "outputs/working_scale.json",
+                 ws_idle_timeout: float = 30.0, pool_size: int = 32, max_retries: int = 3,
+                 backoff_factor: float = 0.2, timeouts: Optional[Dict[str, Any]] = None,
+                 download_workers: int = 8, result_store: Optional[ResultStore] = None):
         self.base_url = f"http://{host}:{port}"
         self.ws_url = f"ws://{host}:{port}/ws"
         self.client_id = str(uuid.uuid4())
         self.use_preloaded_json = use_preloaded_json
         self.preloaded_json_path = preloaded_json_path
+        # Seconds without any event for a prompt before /history is checked directly
+        self.ws_idle_timeout = ws_idle_timeout
+
+        self.timeouts = {**self.DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.http = self._create_http_session(pool_size, max_retries, backoff_factor)
+        self.download_workers = download_workers
+        self._download_pool: Optional[ThreadPoolExecutor] = None
+
+        self._session: Optional[WebSocketSession] = None
+        self._session_lock = threading.Lock()
+
+        # Images of earlier runs by graph hash, and the executions identical submissions wait for
+        self.result_store = result_store
+
+    @staticmethod
+    def _create_http_session(pool_size: int, max_retries: int, backoff_factor: float) -> requests.Session:
+        """
+        Build the keep-alive connection pool shared by all REST calls
+
+        Idempotent GETs are retried with exponential backoff on connection
+        errors, resets and 5xx responses. POST /prompt is only retried when the
+        connection could not be established, so a prompt is never queued twice.
+        """
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        http = requests.Session()
+        http.mount("http://", adapter)
+        http.mount("https://", adapter)
+        return http
+
+    @property
+    def session(self) -> WebSocketSession:
+        """Shared WebSocket session, connected on first use"""
+        with self._session_lock:
+            if self._session is None:
+                session = WebSocketSession(self.ws_url, self.client_id, self.base_url, self.get_history)
+                session.start()
+                self._session = session
+            return self._session
+
+    def close(self) -> None:
+        """Close the shared WebSocket session and the HTTP connection pool"""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            if self._download_pool is not None:
+                self._download_pool.shutdown(wait=True)
+                self._download_pool = None
+        self.http.close()
+
+    def __enter__(self) -> "ComfyUIClient":
+        return self
 
-        self.server_address = "127.0.0.1:8188"
+    def __exit__(self, *exc) -> None:
+        self.close()
 
     def check_connection(self) -> tuple[bool, str]:
         """Check if ComfyUI is accessible"""
         try:
-            requests.get(f"{self.base_url}/history", timeout=5)
+            self.http.get(f"{self.base_url}/history", timeout=self.timeouts['check'])
             return True, "ComfyUI is running and accessible"
         except requests.exceptions.ConnectionError:
             return False, "Could not connect to ComfyUI. Please ensure ComfyUI is running on port 8188"
         except Exception as e:
             return False, f"Error connecting to ComfyUI: {str(e)}"
 
+    @property
+    def queue_remaining(self) -> Optional[int]:
+        """Prompts queued or running on the server as last reported over the WebSocket (None before the first report)"""
+        session = self._session
+        return session.queue_remaining if session is not None else None
+
+    def get_queue_remaining(self) -> Optional[int]:
+        """Ask the server for its queue length (GET /prompt); None if it cannot be reached"""
+        try:
+            response = self.http.get(f"{self.base_url}/prompt", timeout=self.timeouts['check'])
+            if response.status_code != 200:
+                return None
+            return response.json()['exec_info']['queue_remaining']
+        except Exception as e:
+            logging.debug(f"Error reading queue length from {self.base_url}: {str(e)}")
+            return None
+
+    def abort_pending(self, reason: str) -> int:
+        """Fail every prompt being waited for (e.g. because the server died); returns how many"""
+        session = self._session
+        return session.abort_all(reason) if session is not None else 0
+
     def queue_prompt(self, prompt: Dict[Any,Any]) -> Optional[str]:
-        """Queue a prompt for execution in ComfyUI"""
+        """Queue a prompt for execution in ComfyUI (nodes/connections workflows are converted to API format)"""
         try:
-            p = {"prompt": prompt}
-            data = json.dumps(p).encode('utf-8')
-            print("\ndata",type(data), data)
-            req = request.Request(f"{self.base_url}/prompt", data=data, headers={'Content-Type': 'application/json'})
-            with request.urlopen(req) as response:
-                if response.status == 200:
-                    print("successfully")
-                    response_data = json.loads(response.read().decode('utf-8'))
-                    return response_data.get('prompt_id')
-                else:
-                    print(f"Error: Received non-200 status code: {response.status}")
-                    print(f"Response headers: {response.headers}")
-                    print(f"Response content: {response.read().decode('utf-8')}")
-                    return None
+            # client_id routes the execution messages for this prompt to our WebSocket
+            with tracing.span("queue") as span:
+                p = {"prompt": to_api_prompt(prompt), "client_id": self.client_id}
+                data = json.dumps(p).encode('utf-8')
+                response = self.http.post(f"{self.base_url}/prompt", data=data,
+                                          headers={'Content-Type': 'application/json'},
+                                          timeout=self.timeouts['prompt'])
+                span.set(bytes=len(data), status=response.status_code)
+            if response.status_code == 200:
+                logging.debug("Prompt queued successfully")
+                return response.json().get('prompt_id')
+            else:
+                logging.error(f"Error: Received non-200 status code: {response.status_code}")
+                logging.debug(f"Response headers: {response.headers}")
+                # Error bodies can echo the whole prompt back
+                logging.debug(f"Response content: {response.text[:500]}")
+                return None
         except Exception as e:
-            print(f"Error queueing prompt: {str(e)}")
+            logging.error(f"Error queueing prompt: {str(e)}")
             return None
 
     def get_history(self, prompt_id: str) -> Optional[Dict[str, Any]]:
         """Get execution history for a prompt"""
         try:
-            response = requests.get(f"{self.base_url}/history/{prompt_id}", timeout=5)
+            response = self.http.get(f"{self.base_url}/history/{prompt_id}", timeout=self.timeouts['history'])
             return response.json().get(prompt_id) if response.status_code == 200 else None
         except Exception as e:
-            print(f"Error getting history: {str(e)}")
+            logging.error(f"Error getting history: {str(e)}")
             return None
 
+    def get_object_info(self, etag: Optional[str] = None) -> Tuple[Optional[int], Optional[str], Optional[bytes]]:
+        """
+        Fetch the node definitions from /object_info
+
+        Args:
+            etag: ETag of a previously fetched copy; sent as If-None-Match
+
+        Returns:
+            (status code, ETag, raw body) - the body is None on 304 or on error
+        """
+        try:
+            headers = {"If-None-Match": etag} if etag else {}
+            response = self.http.get(f"{self.base_url}/object_info", headers=headers,
+                                     timeout=self.timeouts['object_info'])
+            body = response.content if response.status_code == 200 else None
+            return response.status_code, response.headers.get("ETag"), body
+        except Exception as e:
+            logging.error(f"Error fetching object info: {str(e)}")
+            return None, None, None
+
     def get_image(self, filename: str, subfolder: str = "", folder_type: str = "output") -> Optional[bytes]:
         """Download an image from ComfyUI"""
         try:
             params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
-            response = requests.get(f"{self.base_url}/view", params=params, timeout=10)
+            response = self.http.get(f"{self.base_url}/view", params=params, timeout=self.timeouts['view'])
             return response.content if response.status_code == 200 else None
         except Exception as e:
-            print(f"Error downloading image: {str(e)}")
+            logging.error(f"Error downloading image: {str(e)}")
             return None
 
-    def execute_workflow(self, workflow: Dict[Any, Any], preloaded: bool = False) -> Optional[str]:
-        """Execute a workflow and return the path to the generated image"""
+    def download_image(self, image: Dict[str, Any], destination: Union[str, BinaryIO]) -> bool:
+        """
+        Stream one image from /view to a file without buffering it in memory
+
+        Args:
+            image: Image descriptor from a node output ({filename, subfolder, type})
+            destination: File path, or a writable binary file-like object
+
+        Returns:
+            True if the whole image was written
+        """
+        params = {
+            "filename": image['filename'],
+            "subfolder": image.get('subfolder', ''),
+            "type": image.get('type', 'output'),
+        }
         try:
-            os.makedirs("outputs", exist_ok=True)
+            with self.http.get(f"{self.base_url}/view", params=params,
+                               timeout=self.timeouts['view'], stream=True) as response:
+                if response.status_code != 200:
+                    logging.error(f"Error downloading image {image['filename']}: HTTP {response.status_code}")
+                    return False
+                if not isinstance(destination, str):
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        destination.write(chunk)
+                    return True
+                try:
+                    with open(destination, 'wb') as f:
+                        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                except BaseException:
+                    # Never leave a truncated image behind
+                    if os.path.exists(destination):
+                        os.remove(destination)
+                    raise
+                return True
+        except Exception as e:
+            logging.error(f"Error downloading image {image['filename']}: {str(e)}")
+            return False
+
+    def download_outputs(self, prompt_id: str, outputs: Dict[str, Any], output_dir: str = "outputs",
+                         sink: Optional[Callable[[Dict[str, Any]], BinaryIO]] = None) -> WorkflowResult:
+        """
+        Download every image in a prompt's outputs concurrently
+
+        Args:
+            prompt_id: Prompt the outputs belong to
+            outputs: Mapping of node ID to node output, as in history['outputs']
+            output_dir: Directory images are saved into when no sink is given
+            sink: Optional callable returning a writable binary file object per
+                image descriptor; the caller owns (and closes) those objects
 
-            # Create a socket connection
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((self.base_url.split("//")[1].split(":")[0], int(self.base_url.split(":")[-1])))
+        Returns:
+            WorkflowResult listing every saved path and every failed image
+        """
+        result = WorkflowResult(prompt_id=prompt_id, outputs=outputs)
+        images = iter_output_images(outputs)
+        if not images:
+            return result
 
-            # Create a dummy environ and rfile
-            environ = {}
-            rfile = sock.makefile('rb', -1)
+        if sink is not None:
+            destinations: List[Union[str, BinaryIO]] = [sink(image) for image in images]
+        else:
+            os.makedirs(output_dir, exist_ok=True)
+            destinations = [os.path.join(output_dir, local_image_name(prompt_id, image)) for image in images]
 
-            # Connect to WebSocket with headers
-            ws = websocket.WebSocket()
-            ws.connect(f"{self.ws_url}?clientId={self.client_id}", header={"Origin": self.base_url})
+        with self._session_lock:
+            if self._download_pool is None:
+                self._download_pool = ThreadPoolExecutor(self.download_workers, thread_name_prefix="comfyui-download")
+            pool = self._download_pool
 
-            # Convert workflow dictionary to JSON string
-            workflow_json = json.dumps(workflow)
+        with tracing.span("download", images=len(images)):
+            for image, destination, ok in zip(images, destinations,
+                                              pool.map(self.download_image, images, destinations)):
+                if not ok:
+                    result.failed.append(image)
+                elif isinstance(destination, str):
+                    result.paths.append(destination)
+        return result
 
-            print("workflow json\n", workflow_json)
+    def _wait_for_prompt(self, events: "queue.Queue", prompt_id: str,
+                         on_image: Optional[Callable[[Optional[str], str, bytes], None]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Block until the given prompt has finished executing
 
-            # Queue the prompt
-            # workflow json returns a Error:500 internal server, shou
-            prompt_id = self.queue_prompt(workflow)
-            if not prompt_id:
-                print("RETURNED NONE")
+        Completion is keyed to our own prompt_id via the executing/executed/
+        execution_error messages, so other clients' queued prompts on a shared
+        server do not delay us.
+
+        Args:
+            events: Queue returned by WebSocketSession.subscribe for this prompt
+            prompt_id: ID returned by queue_prompt
+            on_image: Called with (node_id, format, bytes) for every binary image
+                frame, node_id being the node executing when it arrived
+
+        Returns:
+            Dict mapping output node IDs to their outputs (possibly empty), or
+            None if the prompt failed
+        """
+        outputs: Dict[str, Any] = {}
+        current_node: Optional[str] = None
+        while True:
+            try:
+                message = events.get(timeout=self.ws_idle_timeout)
+            except queue.Empty:
+                # Quiet for a while: a missed completion shows up in /history
+                replay = history_events(prompt_id, self.get_history(prompt_id))
+                for event in replay or []:
+                    events.put(event)
+                continue
+
+            if not isinstance(message, dict):
+                frame = parse_image_frame(message) if on_image is not None else None
+                if frame is not None:
+                    on_image(current_node, *frame)
+                continue
+
+            data = message.get('data', {})
+            if message['type'] == 'executed':
+                outputs[data['node']] = data.get('output') or {}
+            elif message['type'] == 'executing':
+                current_node = data.get('node')
+                if current_node is None:
+                    return outputs
+            elif message['type'] == 'execution_error':
+                logging.error(
+                    f"Prompt {prompt_id} failed in node {data.get('node_id')} "
+                    f"({data.get('node_type')}): {data.get('exception_message')}"
+                )
+                return None
+            elif message['type'] == 'execution_interrupted':
+                logging.error(f"Prompt {prompt_id} was interrupted")
                 return None
 
-            # Wait for execution to complete
-            while True:
-                print("\n...")
-                try:
-                    out = ws.recv()
-                    if isinstance(out, str):
-                        print("\nReceived WebSocket message:", out)
-                        message = json.loads(out)
-                        if message['type'] == 'status':
-                            queue_remaining = message['data']['status']['exec_info']['queue_remaining']
-                            print(f"Queue remaining: {queue_remaining}")
-                            if queue_remaining == 0:
-                                print("\nExecution completed")
-                                break
-                except Exception as e:
-                    logging.error(f"Error receiving WebSocket message: {str(e)}")
-                    continue
-
-            print("\nExecution completed")
-
-            # Get results
+    @staticmethod
+    def use_websocket_outputs(workflow: Dict[Any, Any]) -> Dict[Any, Any]:
+        """
+        Return a copy of the workflow whose SaveImage nodes are SaveImageWebsocket
+
+        SaveImageWebsocket sends the encoded image over the WebSocket instead of
+        writing it to ComfyUI's output folder, which removes the server-side disk
+        write and the /history + /view round trips. The input workflow is not
+        modified.
+        """
+        nodes = workflow.get('nodes', workflow)
+        converted = {}
+        for node_id, node in nodes.items():
+            if isinstance(node, dict) and node.get('class_type') == 'SaveImage':
+                inputs = {name: value for name, value in node.get('inputs', {}).items() if name != 'filename_prefix'}
+                node = {**node, 'class_type': 'SaveImageWebsocket', 'inputs': inputs}
+            converted[node_id] = node
+        return {**workflow, 'nodes': converted} if 'nodes' in workflow else converted
+
+    def _save_websocket_images(self, result: WorkflowResult, images: List[tuple], output_dir: str,
+                               sink: Optional[Callable[[Dict[str, Any]], BinaryIO]]) -> None:
+        """Write images received as SaveImageWebsocket frames and record them in result"""
+        if sink is None:
+            os.makedirs(output_dir, exist_ok=True)
+        for index, (node_id, image_format, data) in enumerate(images):
+            ext = 'jpg' if image_format == 'jpeg' else image_format
+            image = {"filename": f"{node_id}_{index:05d}.{ext}", "subfolder": "", "type": "websocket", "node": node_id}
+            if sink is not None:
+                sink(image).write(data)
+                continue
+            output_path = os.path.join(output_dir, local_image_name(result.prompt_id, image))
+            with open(output_path, 'wb') as f:
+                f.write(data)
+            result.paths.append(output_path)
+
+    def submit(self, workflow: Dict[Any, Any], websocket_outputs: bool = False,
+               on_preview: Optional[PreviewCallback] = None) -> Optional["PendingPrompt"]:
+        """
+        Queue a workflow and subscribe to its events, without waiting for it
+
+        The two-step form of execute_workflow for schedulers that queue and
+        collect on different threads; pair it with finish(), and with
+        claim_result() to reuse stored and in-flight results.
+
+        Returns:
+            PendingPrompt to pass to finish(), or None if it could not be queued
+        """
+        if websocket_outputs:
+            workflow = self.use_websocket_outputs(workflow)
+        websocket_nodes = {
+            node_id for node_id, node in workflow.get('nodes', workflow).items()
+            if isinstance(node, dict) and node.get('class_type') == 'SaveImageWebsocket'
+        }
+
+        # The shared session must be connected before queueing so no event is missed
+        session = self.session
+
+        prompt_id = self.queue_prompt(workflow)
+        if not prompt_id:
+            return None
+        return PendingPrompt(prompt_id, session.subscribe(prompt_id), websocket_nodes, on_preview)
+
+    def finish(self, pending: PendingPrompt, output_dir: str = "outputs",
+               sink: Optional[Callable[[Dict[str, Any]], BinaryIO]] = None) -> Optional[WorkflowResult]:
+        """Wait for a submitted prompt and download its images"""
+        prompt_id = pending.prompt_id
+        websocket_images: List[tuple] = []
+
+        def on_image(node_id: Optional[str], image_format: str, data: bytes) -> None:
+            if node_id in pending.websocket_nodes:
+                websocket_images.append((node_id, image_format, data))
+            elif pending.on_preview is not None:
+                pending.on_preview(prompt_id, node_id, image_format, data)
+
+        try:
+            with tracing.span("wait", prompt_id=prompt_id):
+                outputs = self._wait_for_prompt(pending.events, prompt_id,
+                                                on_image if pending.websocket_nodes or pending.on_preview else None)
+        finally:
+            self.session.unsubscribe(prompt_id)
+        if outputs is None:
+            return None
+
+        if pending.websocket_nodes:
+            result = self.download_outputs(prompt_id, outputs, output_dir, sink)
+            self._save_websocket_images(result, websocket_images, output_dir, sink)
+            return result
+
+        # Outputs reported over the WebSocket are authoritative; fall back to
+        # /history only when none were received (e.g. fully cached prompts)
+        if not outputs:
             history = self.get_history(prompt_id)
             if not history or 'outputs' not in history:
                 return None
+            outputs = history['outputs']
 
-            # Find and save the first image output
-            for node_output in history['outputs'].values():
-                print("\nNODE OUTPUT", node_output)
-                if 'images' in node_output and node_output['images']:
-                    image = node_output['images'][0]
-                    image_data = self.get_image(
-                        filename=image['filename'],
-                        subfolder=image.get('subfolder', ''),
-                        folder_type=image.get('type', 'output')
-                    )
-
-                    if image_data:
-                        output_path = f"outputs/comfyui_{image['filename']}"
-                        with open(output_path, 'wb') as f:
-                            f.write(image_data)
-                        return output_path
+        return self.download_outputs(prompt_id, outputs, output_dir, sink)
 
-            return None
+    def claim_result(self, workflow: Dict[Any, Any],
+                     sink: Optional[Callable[[Dict[str, Any]], BinaryIO]] = None) -> "ResultClaim":
+        """Look a workflow up in this client's result_store, see claim_result()"""
+        return claim_result(self.result_store, workflow, sink)
+
+    def execute_workflow(self, workflow: Dict[Any, Any], preloaded: bool = False, output_dir: str = "outputs",
+                         sink: Optional[Callable[[Dict[str, Any]], BinaryIO]] = None,
+                         websocket_outputs: bool = False,
+                         on_preview: Optional[PreviewCallback] = None) -> Optional[WorkflowResult]:
+        """
+        Execute a workflow and download every image it produces
+
+        With a result_store, a workflow whose canonical graph (same nodes and
+        inputs, seed included, whatever the node IDs) already produced images
+        that are still on disk is not queued again: the stored paths are
+        returned. Identical workflows submitted while one is executing wait
+        for it and share its result.
+
+        Args:
+            workflow: Workflow to queue
+            output_dir: Directory images are saved into
+            sink: Optional per-image file object factory, see download_outputs
+                (results written to a sink are never stored or reused)
+            websocket_outputs: Receive final images straight from the WebSocket
+                binary stream (see use_websocket_outputs) instead of /view
+            on_preview: Optional callback streaming sampler preview frames as
+                they arrive, for low-latency UIs
+
+        Returns:
+            WorkflowResult with every saved image path, or None if the prompt
+            could not be queued or failed to execute
+        """
+        claim = self.claim_result(workflow, sink)
+        if not claim.leader:
+            return claim.wait()
+        result = None
+        try:
+            result = self._execute_workflow(workflow, output_dir, sink, websocket_outputs, on_preview)
+        finally:
+            claim.complete(result)
+        return result
+
+    def _execute_workflow(self, workflow: Dict[Any, Any], output_dir: str,
+                          sink: Optional[Callable[[Dict[str, Any]], BinaryIO]], websocket_outputs: bool,
+                          on_preview: Optional[PreviewCallback]) -> Optional[WorkflowResult]:
+        try:
+            pending = self.submit(workflow, websocket_outputs, on_preview)
+            if pending is None:
+                logging.error("Workflow could not be queued")
+                return None
+            result = self.finish(pending, output_dir, sink)
+            if result is not None:
+                logging.info("Execution completed")
+            return result
 
         except Exception as e:
             logging.error(f"Error executing workflow: {str(e)}")
             return None
-        finally:
-            if 'ws' in locals():
-                try:
-                    ws.close()
-                except Exception as e:
-                    logging.error(f"Error closing WebSocket: {str(e)}")
-            if 'sock' in locals():
-                try:
-                    sock.close()
-                except Exception as e:
-                    logging.error(f"Error closing socket: {str(e)}")
+
+    def execute_batch(self, workflows: Iterable[Dict[Any, Any]], output_dir: str = "outputs",
+                      sink: Optional[Callable[[Dict[str, Any]], BinaryIO]] = None,
+                      websocket_outputs: bool = False, max_in_flight: int = 64) -> List[Optional[WorkflowResult]]:
+        """
+        Queue many workflows back to back and collect their results
+
+        Up to max_in_flight prompts are queued ahead of the one being waited
+        for, so ComfyUI never idles between prompts while the client downloads
+        images. Every prompt is subscribed as soon as it is queued, so no event
+        is lost while earlier prompts are being collected.
+
+        Args:
+            workflows: Workflows to execute, in submission order
+            output_dir: Directory images are saved into
+            sink: Optional per-image file object factory, see download_outputs
+            websocket_outputs: See execute_workflow
+            max_in_flight: Maximum number of queued but uncollected prompts
+
+        With a result_store, stored results are reused as in execute_workflow
+        and repeats of a workflow within the batch are queued only once.
+
+        Returns:
+            One WorkflowResult (or None on failure) per workflow, in input order
+        """
+        results: List[Optional[WorkflowResult]] = []
+        in_flight: "collections.deque" = collections.deque()
+        # Stored results, repeats and runs of other callers; resolved once our own prompts are collected
+        joined: List[Tuple[int, ResultClaim]] = []
+
+        def collect_oldest() -> None:
+            index, pending, claim = in_flight.popleft()
+            try:
+                results[index] = self.finish(pending, output_dir, sink)
+            except Exception as e:
+                logging.error(f"Error executing workflow {index}: {str(e)}")
+            finally:
+                claim.complete(results[index])
+
+        for workflow in workflows:
+            results.append(None)
+            index = len(results) - 1
+            claim = self.claim_result(workflow, sink)
+            if not claim.leader:
+                joined.append((index, claim))
+                continue
+            try:
+                pending = self.submit(workflow, websocket_outputs)
+            except Exception as e:
+                logging.error(f"Error queueing workflow {index}: {str(e)}")
+                pending = None
+            if pending is None:
+                claim.complete(None)
+                continue
+            in_flight.append((index, pending, claim))
+            if len(in_flight) >= max_in_flight:
+                collect_oldest()
+        while in_flight:
+            collect_oldest()
+        for index, claim in joined:
+            results[index] = claim.wait()
+        return results
 
     def test_preloaded_json(self) -> None:
         """Test the ComfyUI API calls with a preloaded JSON"""
         if self.use_preloaded_json and self.preloaded_json_path:
-            print("Testing ComfyUI with preloaded JSON...")
+            logging.info("Testing ComfyUI with preloaded JSON...")
             try:
                 with open(self.preloaded_json_path, 'r') as f:
                     workflow = json.load(f)
                 result = self.execute_workflow(workflow)
-                if result:
-                    print(f"Preloaded JSON test successful. Image saved at: {result}")
+                if result and result.paths:
+                    logging.info(f"Preloaded JSON test successful. Images saved at: {', '.join(result.paths)}")
                 else:
-                    print("Preloaded JSON test failed.")
+                    logging.error("Preloaded JSON test failed.")
             except Exception as e:
-                print(f"Error testing preloaded JSON: {str(e)}")
\ No newline at end of file
+                logging.error(f"Error testing preloaded JSON: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,272 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Callable, BinaryIO, Iterable, Tuple, Union
+
+from affinity_scheduler import ModelSignature, model_signature
+from comfyui_client import ComfyUIClient, WorkflowResult, PreviewCallback, claim_result
+from result_store import ResultStore
+import tracing
+
+
+def parse_backend(address: str) -> Tuple[str, int]:
+    """Split "host:port" (port defaults to ComfyUI's 8188)"""
+    host, _, port = address.rpartition(':')
+    if not host:
+        return address, 8188
+    return host, int(port)
+
+
+class Backend:
+    """One ComfyUI server in a pool and what the pool knows about it"""
+
+    def __init__(self, client: ComfyUIClient):
+        self.client = client
+        self.address = client.base_url
+        self.healthy = True
+        # Prompts this pool has dispatched and not yet collected
+        self.in_flight = 0
+        # Queue length from the last health check, used until the WebSocket reports one
+        self.checked_queue: Optional[int] = None
+        # Models of the last workflow dispatched here: loaded once the queue reaches it
+        self.models: ModelSignature = ()
+        self.dispatched = 0
+        self.failed_over = 0
+
+    @property
+    def load(self) -> int:
+        """Prompts ahead of a new one: the server's live queue, or at least what we sent it"""
+        queue_remaining = self.client.queue_remaining
+        if queue_remaining is None:
+            queue_remaining = self.checked_queue or 0
+        return max(queue_remaining, self.in_flight)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"address": self.address, "healthy": self.healthy, "load": self.load, "in_flight": self.in_flight,
+                "dispatched": self.dispatched, "failed_over": self.failed_over,
+                "models": [file for _, file in self.models]}
+
+
+class ComfyUIPool:
+    """
+    Dispatches workflows across several ComfyUI servers
+
+    Each workflow goes to the healthy backend with the fewest prompts ahead
+    of it, read live from that server's WebSocket status messages (and our
+    own in-flight count, which covers prompts sent since the last status).
+    A backend that last ran the same checkpoint/LoRA/VAE files is preferred
+    as long as it is at most affinity_slack prompts busier than the
+    least-loaded one, so the models do not have to be loaded again elsewhere.
+
+    A background thread checks every backend each health_interval seconds
+    (GET /prompt). When one stops answering, the prompts waiting on it are
+    failed and resubmitted to another backend, up to max_attempts backends
+    per workflow. A prompt the dead server had in fact finished may
+    therefore run twice.
+
+    With a result_store, workflows whose images were already produced, or
+    are being produced on any backend, are not dispatched again.
+
+    Exposes execute_workflow, check_connection, get_object_info and close,
+    so it can stand in for a single ComfyUIClient (e.g. in BatchPipeline).
+    """
+
+    def __init__(self, backends: Iterable[Union[str, ComfyUIClient]], health_interval: float = 2.0,
+                 max_attempts: int = 3, affinity_slack: int = 2, result_store: Optional[ResultStore] = None,
+                 **client_options: Any):
+        """
+        Args:
+            backends: "host:port" addresses or ready ComfyUIClient instances
+            health_interval: Seconds between health checks of every backend
+            max_attempts: Backends tried per workflow before giving up
+            affinity_slack: Extra load accepted to reuse loaded models
+            result_store: Earlier results to reuse, see ComfyUIClient.execute_workflow
+            client_options: Passed to ComfyUIClient for address backends
+        """
+        self.backends: List[Backend] = []
+        for backend in backends:
+            if isinstance(backend, str):
+                host, port = parse_backend(backend)
+                backend = ComfyUIClient(host, port, **client_options)
+            self.backends.append(Backend(backend))
+        if not self.backends:
+            raise ValueError("ComfyUIPool needs at least one backend")
+        self.health_interval = health_interval
+        self.max_attempts = max_attempts
+        self.affinity_slack = affinity_slack
+        self.result_store = result_store
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = threading.Thread(target=self._health_loop, name="comfyui-pool-health", daemon=True)
+        self._health_thread.start()
+
+    def close(self) -> None:
+        """Stop health checks and close every backend client"""
+        self._stop.set()
+        self._health_thread.join(timeout=5)
+        for backend in self.backends:
+            backend.client.close()
+
+    def __enter__(self) -> "ComfyUIPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [backend.to_dict() for backend in self.backends]
+
+    # -- health --------------------------------------------------------------
+
+    def _health_loop(self) -> None:
+        while not self._stop.wait(self.health_interval):
+            for backend in self.backends:
+                self._check(backend)
+
+    def _check(self, backend: Backend) -> bool:
+        """Probe one backend; on a healthy -> down transition fail its waiting prompts so they move elsewhere"""
+        queue_remaining = backend.client.get_queue_remaining()
+        healthy = queue_remaining is not None
+        with self._lock:
+            was_healthy, backend.healthy = backend.healthy, healthy
+            if healthy:
+                backend.checked_queue = queue_remaining
+        if was_healthy and not healthy:
+            aborted = backend.client.abort_pending(f"ComfyUI backend {backend.address} is unreachable")
+            logging.warning(f"ComfyUI backend {backend.address} is down; failing over {aborted} prompt(s)")
+        elif healthy and not was_healthy:
+            logging.info(f"ComfyUI backend {backend.address} is back")
+        return healthy
+
+    def check_connection(self) -> tuple[bool, str]:
+        """Check every backend; connected if at least one is reachable"""
+        reachable = sum(1 for backend in self.backends if self._check(backend))
+        message = f"{reachable} of {len(self.backends)} ComfyUI backends reachable"
+        return reachable > 0, message
+
+    def get_object_info(self, etag: Optional[str] = None) -> Tuple[Optional[int], Optional[str], Optional[bytes]]:
+        """/object_info from the first healthy backend (the farm is assumed to run the same nodes)"""
+        for backend in self.backends:
+            if backend.healthy:
+                return backend.client.get_object_info(etag)
+        return None, None, None
+
+    # -- dispatch ------------------------------------------------------------
+
+    def _pick(self, models: ModelSignature, exclude: set) -> Optional[Backend]:
+        """Reserve the backend for the next prompt, or None if every healthy one was tried"""
+        with self._lock:
+            candidates = [backend for backend in self.backends if backend.healthy and backend not in exclude]
+            if not candidates:
+                return None
+            loads = {backend: backend.load for backend in candidates}
+            least = min(loads.values())
+            if models:
+                warm = [backend for backend in candidates
+                        if backend.models == models and loads[backend] <= least + self.affinity_slack]
+                candidates = warm or candidates
+            # Ties go to the backend used least so far, so an idle farm is filled evenly
+            backend = min(candidates, key=lambda b: (loads[b], b.dispatched))
+            backend.in_flight += 1
+            backend.dispatched += 1
+            if models:
+                backend.models = models
+            return backend
+
+    def _run(self, backend: Backend, workflow: Dict[Any, Any], output_dir: str,
+             sink: Optional[Callable[[Dict[str, Any]], BinaryIO]], websocket_outputs: bool,
+             on_preview: Optional[PreviewCallback]) -> Tuple[Optional[WorkflowResult], bool]:
+        """Execute on one backend; returns (result, whether to try another backend)"""
+        client = backend.client
+        try:
+            pending = client.submit(workflow, websocket_outputs, on_preview)
+        except Exception as e:
+            logging.error(f"Error queueing workflow on {backend.address}: {str(e)}")
+            pending = None
+        if pending is None:
+            # Never queued, so it is safe to send elsewhere
+            self._check(backend)
+            return None, True
+        try:
+            result = client.finish(pending, output_dir, sink)
+        except Exception as e:
+            logging.error(f"Error collecting prompt {pending.prompt_id} from {backend.address}: {str(e)}")
+            result = None
+        if result is None and (not backend.healthy or not self._check(backend)):
+            return None, True
+        return result, False
+
+    def execute_workflow(self, workflow: Dict[Any, Any], output_dir: str = "outputs",
+                         sink: Optional[Callable[[Dict[str, Any]], BinaryIO]] = None,
+                         websocket_outputs: bool = False,
+                         on_preview: Optional[PreviewCallback] = None) -> Optional[WorkflowResult]:
+        """
+        Execute a workflow on the best backend, failing over if it dies
+
+        Args:
+            workflow: Workflow to queue
+            output_dir: Directory images are saved into
+            sink: See ComfyUIClient.execute_workflow
+            websocket_outputs: See ComfyUIClient.execute_workflow
+            on_preview: See ComfyUIClient.execute_workflow
+
+        Returns:
+            WorkflowResult, or None if the workflow failed or no backend
+            could run it
+        """
+        claim = claim_result(self.result_store, workflow, sink)
+        if not claim.leader:
+            return claim.wait()
+        result = None
+        try:
+            result = self._dispatch(workflow, output_dir, sink, websocket_outputs, on_preview)
+        finally:
+            claim.complete(result)
+        return result
+
+    def _dispatch(self, workflow: Dict[Any, Any], output_dir: str,
+                  sink: Optional[Callable[[Dict[str, Any]], BinaryIO]], websocket_outputs: bool,
+                  on_preview: Optional[PreviewCallback]) -> Optional[WorkflowResult]:
+        """Run a workflow on up to max_attempts backends"""
+        models = model_signature(workflow)
+        tried: set = set()
+        for _ in range(self.max_attempts):
+            backend = self._pick(models, tried)
+            if backend is None:
+                break
+            tried.add(backend)
+            logging.debug(f"Dispatching workflow to {backend.address} (load {backend.load})")
+            try:
+                with tracing.span("dispatch", backend=backend.address):
+                    result, retry = self._run(backend, workflow, output_dir, sink, websocket_outputs, on_preview)
+            finally:
+                with self._lock:
+                    backend.in_flight -= 1
+            if not retry:
+                if result is not None:
+                    logging.info(f"Execution completed on {backend.address}")
+                return result
+            with self._lock:
+                backend.failed_over += 1
+            logging.warning(f"Workflow failed on {backend.address}; trying another backend")
+        logging.error("Workflow could not be executed on any ComfyUI backend")
+        return None
+
+    def execute_many(self, workflows: Iterable[Dict[Any, Any]], output_dir: str = "outputs",
+                     max_workers: Optional[int] = None) -> List[Optional[WorkflowResult]]:
+        """
+        Execute many workflows concurrently across the pool
+
+        Args:
+            workflows: Workflows to execute
+            output_dir: Directory images are saved into
+            max_workers: Workflows in flight at once (default 4 per backend)
+
+        Returns:
+            One WorkflowResult (or None on failure) per workflow, in input order
+        """
+        with ThreadPoolExecutor(max_workers or 4 * len(self.backends)) as executor:
+            return list(executor.map(lambda workflow: self.execute_workflow(workflow, output_dir), workflows))
@@ -0,0 +1,264 @@
+import json
+import logging
+import queue
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, List, Union, Tuple
+
+import websocket
+
+# Events delivered to subscribers: parsed JSON messages, or raw bytes for binary frames
+Event = Union[Dict[str, Any], bytes]
+
+# Binary frame event types sent by ComfyUI (server.BinaryEventTypes)
+PREVIEW_IMAGE = 1
+UNENCODED_PREVIEW_IMAGE = 2
+
+IMAGE_FORMATS = {1: 'jpeg', 2: 'png'}
+
+
+def parse_image_frame(frame: bytes) -> Optional[Tuple[str, bytes]]:
+    """
+    Decode a binary WebSocket frame carrying an image
+
+    ComfyUI prefixes image frames with a big-endian uint32 event type and a
+    uint32 image format, followed by the encoded image. This is how both
+    sampler previews and SaveImageWebsocket outputs arrive.
+
+    Returns:
+        (format, image bytes) tuple, or None if the frame is not an image
+    """
+    if len(frame) < 8:
+        return None
+    event_type, image_format = struct.unpack(">II", frame[:8])
+    if event_type not in (PREVIEW_IMAGE, UNENCODED_PREVIEW_IMAGE):
+        return None
+    return IMAGE_FORMATS.get(image_format, 'png'), frame[8:]
+
+
+def history_events(prompt_id: str, history: Optional[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Translate a /history entry into the WebSocket messages it stands for
+
+    Args:
+        prompt_id: Prompt the history entry belongs to
+        history: Entry returned by ComfyUIClient.get_history
+
+    Returns:
+        List of synthetic messages ending in a terminal event, or None if the
+        prompt has not finished yet
+    """
+    if not history:
+        return None
+    status = history.get('status') or {}
+    if status.get('status_str') == 'error':
+        return [{"type": "execution_error", "data": {"prompt_id": prompt_id, "exception_message": "failed (from /history)"}}]
+    if not status.get('completed', 'outputs' in history):
+        return None
+    events: List[Dict[str, Any]] = [
+        {"type": "executed", "data": {"node": node_id, "output": output, "prompt_id": prompt_id}}
+        for node_id, output in (history.get('outputs') or {}).items()
+    ]
+    events.append({"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+    return events
+
+
+class WebSocketSession:
+    """
+    Long-lived WebSocket connection shared by every prompt of one ComfyUIClient
+
+    A single reader thread receives all messages for the client_id and routes
+    them to per-prompt_id queues. Binary frames carry no prompt_id, so they are
+    attributed to the prompt that is currently executing. Messages for prompts
+    nobody has subscribed to yet are buffered, so subscribing right after
+    queue_prompt returns never misses events.
+
+    When the connection drops it is re-established under the same client_id
+    and every outstanding prompt is re-synced through /history.
+    """
+
+    MAX_ORPHANED_PROMPTS = 1024
+
+    def __init__(self, ws_url: str, client_id: str, origin: str,
+                 history_fetcher: Callable[[str], Optional[Dict[str, Any]]],
+                 reconnect_delay: float = 0.5, max_reconnect_delay: float = 10.0,
+                 connect_timeout: float = 10.0):
+        self.ws_url = ws_url
+        self.client_id = client_id
+        self.origin = origin
+        self.history_fetcher = history_fetcher
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connect_timeout = connect_timeout
+
+        self.queue_remaining: Optional[int] = None
+        self.reconnects = 0
+
+        self._ws: Optional[websocket.WebSocket] = None
+        self._subscribers: Dict[str, "queue.Queue[Event]"] = {}
+        self._orphans: "OrderedDict[str, List[Event]]" = OrderedDict()
+        self._current_prompt: Optional[str] = None
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def start(self) -> None:
+        """Connect and start the reader thread; blocks until the first connection is up"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._closing = False
+            self._connect()
+            self._thread = threading.Thread(target=self._run, name=f"comfyui-ws-{self.client_id[:8]}", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        """Close the connection and stop the reader thread"""
+        self._closing = True
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception as e:
+                logging.error(f"Error closing WebSocket: {str(e)}")
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def _connect(self) -> None:
+        self._ws = websocket.create_connection(
+            f"{self.ws_url}?clientId={self.client_id}",
+            header={"Origin": self.origin},
+            timeout=self.connect_timeout,
+            enable_multithread=True,
+        )
+        # The reader blocks indefinitely; liveness is detected by the socket closing
+        self._ws.settimeout(None)
+        self._connected.set()
+
+    def _reconnect(self) -> None:
+        self._connected.clear()
+        delay = self.reconnect_delay
+        while not self._closing:
+            try:
+                self._connect()
+                self.reconnects += 1
+                logging.warning(f"WebSocket reconnected after drop (reconnect #{self.reconnects})")
+                self._resync()
+                return
+            except Exception as e:
+                logging.error(f"WebSocket reconnect failed: {str(e)}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _resync(self) -> None:
+        """Replay completion of prompts that finished while we were disconnected"""
+        with self._lock:
+            outstanding = list(self._subscribers)
+        for prompt_id in outstanding:
+            try:
+                events = history_events(prompt_id, self.history_fetcher(prompt_id))
+            except Exception as e:
+                logging.error(f"Error re-syncing prompt {prompt_id}: {str(e)}")
+                continue
+            for event in events or []:
+                self._dispatch(prompt_id, event)
+
+    # -- subscriptions -------------------------------------------------------
+
+    def subscribe(self, prompt_id: str) -> "queue.Queue[Event]":
+        """
+        Register interest in a prompt's events
+
+        Args:
+            prompt_id: ID returned by queue_prompt
+
+        Returns:
+            Queue receiving the prompt's messages in arrival order
+        """
+        events: "queue.Queue[Event]" = queue.Queue()
+        with self._lock:
+            for event in self._orphans.pop(prompt_id, []):
+                events.put(event)
+            self._subscribers[prompt_id] = events
+        return events
+
+    def unsubscribe(self, prompt_id: str) -> None:
+        with self._lock:
+            self._subscribers.pop(prompt_id, None)
+
+    def abort_all(self, reason: str) -> int:
+        """Deliver an execution_error to every subscribed prompt so its waiter gives up; returns how many"""
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for prompt_id, events in subscribers:
+            events.put({"type": "execution_error", "data": {"prompt_id": prompt_id, "exception_message": reason}})
+        return len(subscribers)
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    # -- reader --------------------------------------------------------------
+
+    def _dispatch(self, prompt_id: Optional[str], event: Event) -> None:
+        if prompt_id is None:
+            return
+        with self._lock:
+            subscriber = self._subscribers.get(prompt_id)
+            if subscriber is None:
+                self._orphans.setdefault(prompt_id, []).append(event)
+                self._orphans.move_to_end(prompt_id)
+                while len(self._orphans) > self.MAX_ORPHANED_PROMPTS:
+                    self._orphans.popitem(last=False)
+                return
+        subscriber.put(event)
+
+    def _handle(self, out: Union[str, bytes]) -> None:
+        if not isinstance(out, str):
+            self._dispatch(self._current_prompt, out)
+            return
+
+        message = json.loads(out)
+        data = message.get('data') or {}
+        if message.get('type') == 'status':
+            exec_info = (data.get('status') or {}).get('exec_info') or {}
+            self.queue_remaining = exec_info.get('queue_remaining', self.queue_remaining)
+            return
+
+        prompt_id = data.get('prompt_id')
+        if message.get('type') == 'executing':
+            self._current_prompt = prompt_id if data.get('node') is not None else None
+        self._dispatch(prompt_id, message)
+
+    def _run(self) -> None:
+        while not self._closing:
+            try:
+                out = self._ws.recv()
+            except Exception as e:
+                if self._closing:
+                    break
+                logging.error(f"WebSocket connection lost: {str(e)}")
+                self._current_prompt = None
+                self._reconnect()
+                continue
+            if not out and not self._ws.connected:
+                if self._closing:
+                    break
+                self._reconnect()
+                continue
+            try:
+                self._handle(out)
+            except Exception as e:
+                logging.error(f"Error handling WebSocket message: {str(e)}")
+        self._connected.clear()
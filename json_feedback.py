@@ -1,102 +1,220 @@
+import copy
 import json
-from typing import Dict, Any, Optional
-from json_handler import JsonHandler
+import logging
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, List, Optional, Union
+from json_handler import JsonHandler, WorkflowValidationError
+from auto_repair import AutoRepair
+from workflow_format import is_api_prompt, from_api_prompt
+from workflow_validator import ValidationError
 from claude_client import ClaudeClient
 from config import Config
+import tracing
 
-def validate_and_refine_workflow(workflow_json: str) -> Dict[str, Any]:
-    """
-    Validate the workflow JSON and refine it if necessary.
+# Errors that can only be fixed with the whole graph in view
+WHOLE_GRAPH_CODES = frozenset({'cycle', 'no_output', 'missing_node_type'})
 
-    Args:
-        workflow_json: JSON string to validate and refine
 
-    Returns:
-        Dict containing the refined JSON
+@dataclass
+class RefineBudget:
+    """Limits on how much repair work one workflow may use; None means unlimited"""
+    max_rounds: int = 3
+    # Input plus output tokens across all rounds
+    max_tokens: Optional[int] = None
+    # Wall-clock seconds across all rounds
+    max_seconds: Optional[float] = None
+
+
+@dataclass
+class RefineRound:
+    """Measurements of one refine request"""
+    round: int
+    latency: float
+    input_tokens: int
+    output_tokens: int
+    errors_before: int
+    errors_after: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = asdict(self)
+        record["latency"] = round(self.latency, 4)
+        return record
+
+
+@dataclass
+class RefineResult:
+    """Outcome of validate-and-refine for one workflow"""
+    # Parsed workflow; None if the last version is not even valid JSON
+    workflow: Optional[Dict[str, Any]]
+    errors: List[ValidationError]
+    # 'valid', 'max_rounds', 'token_budget' or 'time_budget'
+    stop_reason: str
+    rounds: List[RefineRound] = field(default_factory=list)
+    # Local fixes applied, by auto-repair rule name
+    repairs: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(r.input_tokens + r.output_tokens for r in self.rounds)
+
+    @property
+    def total_latency(self) -> float:
+        return sum(r.latency for r in self.rounds)
+
+
+class RefineEngine:
     """
-    error_log: Optional[str] = None
-
-    print(f"\nREFINING_IN_JSONFEEDBACK")
-
-    try:
-        # Validate the workflow JSON
-        workflow = JsonHandler.validate_workflow_json(workflow_json)
-        return workflow
-    except ValueError as e:
-        error_log = str(e)
-        print(f"Validation error: {error_log}")
-
-    # If validation fails, refine the workflow
-    try:
-        workflow = json.loads(workflow_json)
-        
-        # Retrieve the API key using Config
-        config = Config()
-        api_key = config.get_api_key()
-        
-        # Initialize ClaudeClient with the API key
-        claude_client = ClaudeClient(api_key)
-        
-        refined_workflow = refine_workflow(workflow, error_log, claude_client)
-        return refined_workflow
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON format: {str(e)}")
-
-def refine_workflow(workflow: Dict[str, Any], error_log: Optional[str], claude_client: ClaudeClient) -> Dict[str, Any]:
+    Validate a workflow and ask Claude to repair it until it passes or the budget runs out
+
+    After every refine round the new workflow is validated again, and the
+    full error list is sent back in the next round. Before each LLM call the
+    AutoRepair rules fix whatever is mechanical, so Claude is only asked
+    about the errors they cannot fix. The engine holds one ClaudeClient for
+    all calls and is safe to share between threads.
+    """
+
+    def __init__(self, claude_client: Optional[ClaudeClient] = None, budget: Optional[RefineBudget] = None,
+                 use_auto_repair: bool = True):
+        self._claude_client = claude_client
+        self._client_lock = threading.Lock()
+        self.budget = budget or RefineBudget()
+        self.auto_repair: Optional[AutoRepair] = AutoRepair() if use_auto_repair else None
+
+    @property
+    def claude_client(self) -> ClaudeClient:
+        """Client used for refine calls, created from Config on first use if none was given"""
+        with self._client_lock:
+            if self._claude_client is None:
+                self._claude_client = ClaudeClient(Config().get_api_key())
+            return self._claude_client
+
+    def _validate(self, workflow: Union[str, Dict[str, Any]], repairs: Dict[str, int], owned: bool = False):
+        """Parse, auto-repair and validate; returns (parsed workflow or None, errors)"""
+        with tracing.span("validate") as span:
+            if isinstance(workflow, (str, bytes)):
+                try:
+                    workflow = json.loads(workflow)
+                except json.JSONDecodeError as e:
+                    return None, [ValidationError('invalid_json', f"Invalid JSON format: {str(e)}")]
+            elif self.auto_repair is not None and not owned:
+                # Repairs edit in place; leave the caller's dict alone
+                workflow = copy.deepcopy(workflow)
+            if is_api_prompt(workflow):
+                workflow = from_api_prompt(workflow)
+            errors = JsonHandler.collect_errors(workflow)
+            if self.auto_repair is not None and isinstance(workflow, dict):
+                errors, applied = self.auto_repair.repair(workflow, errors)
+                if applied:
+                    logging.info(f"Auto-repair applied {', '.join(f'{name} x{count}' for name, count in applied.items())}")
+                    for name, count in applied.items():
+                        repairs[name] = repairs.get(name, 0) + count
+            span.set(errors=len(errors))
+            return workflow, errors
+
+    def _stop_reason(self, rounds: List[RefineRound], started: float) -> Optional[str]:
+        budget = self.budget
+        if len(rounds) >= budget.max_rounds:
+            return 'max_rounds'
+        if budget.max_tokens is not None and sum(r.input_tokens + r.output_tokens for r in rounds) >= budget.max_tokens:
+            return 'token_budget'
+        if budget.max_seconds is not None and time.perf_counter() - started >= budget.max_seconds:
+            return 'time_budget'
+        return None
+
+    @staticmethod
+    def focus(workflow: Optional[Dict[str, Any]], errors: List[ValidationError]) -> Optional[set]:
+        """Nodes to send Claude an excerpt around, or None if the errors need the whole workflow"""
+        if workflow is None or any(error.node_id is None or error.code in WHOLE_GRAPH_CODES for error in errors):
+            return None
+        return {str(error.node_id) for error in errors}
+
+    def refine(self, workflow_json: Union[str, Dict[str, Any]], owned: bool = False) -> RefineResult:
+        """
+        Validate a workflow and refine it within the budget
+
+        Args:
+            workflow_json: Generated workflow as a JSON string or dict
+            owned: The dict is the caller's to give away (e.g. freshly parsed
+                from a stream), so auto-repair may edit it without a copy
+
+        Returns:
+            RefineResult with the final workflow, its remaining errors, why
+            the loop stopped and the per-round measurements
+        """
+        started = time.perf_counter()
+        current: Union[str, Dict[str, Any]] = workflow_json
+        repairs: Dict[str, int] = {}
+        workflow, errors = self._validate(current, repairs, owned)
+        rounds: List[RefineRound] = []
+
+        while errors:
+            stop_reason = self._stop_reason(rounds, started)
+            if stop_reason is not None:
+                return RefineResult(workflow, errors, stop_reason, rounds, repairs)
+
+            timeout = 30.0
+            if self.budget.max_seconds is not None:
+                timeout = max(1.0, min(timeout, self.budget.max_seconds - (time.perf_counter() - started)))
+
+            error_log = "\n".join(str(error) for error in errors)
+            logging.info(f"Refining workflow (round {len(rounds) + 1}) based on {len(errors)} error(s)")
+            logging.debug(error_log)
+            round_started = time.perf_counter()
+            with tracing.span("refine", round=len(rounds) + 1, errors=len(errors)) as span:
+                current, usage = self.claude_client.request_refinement(
+                    workflow if workflow is not None else current, error_log, timeout=timeout,
+                    focus=self.focus(workflow, errors)
+                )
+                span.set(**usage)
+            latency = time.perf_counter() - round_started
+
+            errors_before = len(errors)
+            workflow, errors = self._validate(current, repairs)
+            rounds.append(RefineRound(len(rounds) + 1, latency, usage["input_tokens"], usage["output_tokens"],
+                                      errors_before, len(errors)))
+            logging.info(f"Refine round {len(rounds)}: {len(errors)} error(s) left "
+                         f"({latency:.2f}s, {usage['input_tokens'] + usage['output_tokens']} tokens)")
+
+        return RefineResult(workflow, errors, 'valid', rounds, repairs)
+
+
+_default_engine: Optional[RefineEngine] = None
+_default_engine_lock = threading.Lock()
+
+
+def validate_and_refine_workflow(workflow_json: Union[str, Dict[str, Any]],
+                                 engine: Optional[RefineEngine] = None, owned: bool = False) -> Dict[str, Any]:
     """
-    Refine the workflow JSON to correct validation errors.
+    Validate the workflow JSON and refine it if necessary.
 
     Args:
-        workflow: Dictionary containing the workflow JSON
-        error_log: String containing validation errors
-        claude_client: Instance of ClaudeClient
+        workflow_json: JSON string (or parsed dict) to validate and refine
+        engine: Refine engine to use; defaults to a shared engine with the
+            default budget
+        owned: See RefineEngine.refine
 
     Returns:
-        Dict containing the refined JSON
+        Dict containing the validated (and possibly refined) workflow
+
+    Raises:
+        WorkflowValidationError: If the workflow is still invalid when the
+            refine budget is exhausted
     """
-    if error_log:
-        print(f"\nRefining workflow based on errors: {error_log}")
-        
-        prompt = (
-            "You previously generated a ComfyUI workflow JSON, but it contains some errors. "
-            "Here is the workflow JSON:\n\n"
-            f"{json.dumps(workflow, indent=2)}\n\n"
-            "And here are the errors:\n\n"
-            f"{error_log}\n\n"
-            "Please correct the errors and provide a refined JSON workflow. "
-            "IMPORTANT: Your response must contain ONLY the JSON object with no additional text, markdown formatting, or explanations."
-        )
-
-        try:
-            print("Sending [REFINE] request to Claude API...")
-            response = claude_client.client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=4096,
-                temperature=0,
-                messages=[{
-                    "role": "user",
-                    "content": prompt
-                }],
-                timeout=30
-            )
-
-            print("Received response from Claude API")
-
-            if not response.content or not response.content[0].text:
-                raise Exception("Empty response received from Claude API")
-
-            # Extract and validate JSON from the response
-            refined_workflow_json = claude_client._extract_json_from_response(response.content[0].text)
-            refined_workflow = json.loads(refined_workflow_json)
-            return refined_workflow
-
-        except anthropic.APIError as e:
-            print(f"Claude API Error: {str(e)}")
-            if "rate limit" in str(e).lower():
-                raise Exception("Rate limit exceeded. Please try again in a few minutes.")
-            raise Exception(f"Error calling Claude API: {str(e)}")
-        except Exception as e:
-            print(f"Unexpected error: {str(e)}")
-            raise Exception(f"Unexpected error while generating workflow: {str(e)}")
-
-    return workflow
+    global _default_engine
+    if engine is None:
+        with _default_engine_lock:
+            if _default_engine is None:
+                _default_engine = RefineEngine()
+            engine = _default_engine
+
+    result = engine.refine(workflow_json, owned)
+    if not result.valid:
+        logging.warning(f"Refinement stopped ({result.stop_reason}) after {len(result.rounds)} round(s)")
+        raise WorkflowValidationError(result.errors)
+    return result.workflow
@@ -1,7 +1,22 @@
 import json
-from typing import Dict, Any, List
+import logging
+from typing import Dict, Any, List, Optional, Union
 from datetime import datetime
-import os
+from workflow_validator import WorkflowValidator, ValidationError
+from workflow_graph import WorkflowGraph, OUTPUT_ARITY, OUTPUT_NODE_TYPES
+from node_schema import NodeSchemaRegistry
+from output_writer import OutputWriter
+from workflow_format import is_api_prompt, from_api_prompt
+import tracing
+
+
+class WorkflowValidationError(ValueError):
+    """Raised when a workflow fails validation; carries every error found"""
+
+    def __init__(self, errors: List[ValidationError]):
+        super().__init__("\n".join(str(error) for error in errors))
+        self.errors = errors
+
 
 class JsonHandler:
     # Required node types for text-to-image workflow
@@ -47,124 +62,173 @@ class JsonHandler:
         }
     }
 
+    # Output slot count per node type, used to check [node_id, output_index] links
+    NODE_OUTPUT_ARITY = OUTPUT_ARITY
+
+    # Node types that make ComfyUI execute a graph
+    OUTPUT_NODE_TYPES = OUTPUT_NODE_TYPES
+
     # Basic schema for node structure
     NODE_SCHEMA = {
         'required_fields': {'class_type', 'inputs'},
         'optional_fields': {'id', 'type'}
     }
 
+    _validator: Optional[WorkflowValidator] = None
+    # Schemas from the connected ComfyUI; when set they replace the hand-written input checks
+    schema_registry: Optional[NodeSchemaRegistry] = None
+    # Writes saved workflows; synchronous until use_output_writer installs another
+    output_writer: OutputWriter = OutputWriter()
+
+    @classmethod
+    def get_validator(cls) -> WorkflowValidator:
+        """Validator compiled once from the requirement tables above"""
+        if cls._validator is None:
+            cls._validator = WorkflowValidator(
+                cls.NODE_INPUT_REQUIREMENTS, cls.REQUIRED_NODE_TYPES, cls.NODE_SCHEMA['required_fields']
+            )
+        return cls._validator
+
     @staticmethod
     def validate_node_inputs(node_id: str, node: Dict[str, Any]) -> None:
         """Validate inputs for specific node types"""
-        node_type = node['class_type']
-        if node_type in JsonHandler.NODE_INPUT_REQUIREMENTS:
-            requirements = JsonHandler.NODE_INPUT_REQUIREMENTS[node_type]
-            required_inputs = requirements['required_inputs']
-
-            for input_name, expected_type in required_inputs.items():
-                if input_name not in node['inputs']:
-                    raise ValueError(f"Node {node_id} ({node_type}) missing required input: {input_name}")
-
-                input_value = node['inputs'][input_name]
-
-                # Handle multiple allowed types
-                if isinstance(expected_type, tuple):
-                    if not any(isinstance(input_value, t) for t in expected_type):
-                        raise ValueError(
-                            f"Node {node_id} ({node_type}) input '{input_name}' "
-                            f"must be one of types {expected_type}, got {type(input_value)}"
-                        )
-                elif not isinstance(input_value, expected_type):
-                    raise ValueError(
-                        f"Node {node_id} ({node_type}) input '{input_name}' "
-                        f"must be of type {expected_type}, got {type(input_value)}"
-                    )
+        checker = JsonHandler.get_validator().checkers.get(node['class_type'])
+        if checker is not None:
+            errors: List[ValidationError] = []
+            checker.check(node_id, node['inputs'], errors)
+            if errors:
+                raise WorkflowValidationError(errors)
 
     @staticmethod
     def validate_connections(nodes: Dict[str, Any], connections: Dict[str, Any]) -> None:
         """Validate that connections reference valid nodes and outputs"""
-        for target_id, connection_info in connections.items():
-            if target_id not in nodes:
-                raise ValueError(f"Connection references non-existent target node: {target_id}")
-
-            if not isinstance(connection_info, dict) or 'inputs' not in connection_info:
-                raise ValueError(f"Invalid connection structure for node {target_id}")
-
-            for input_name, connection in connection_info['inputs'].items():
-                if not isinstance(connection, list) or len(connection) != 2:
-                    raise ValueError(
-                        f"Invalid connection format for node {target_id}, "
-                        f"input {input_name}: expected [node_id, output_index]"
-                    )
-                source_id, output_index = connection
-                if str(source_id) not in nodes:
-                    raise ValueError(
-                        f"Connection from non-existent source node {source_id} "
-                        f"to node {target_id}"
-                    )
+        errors: List[ValidationError] = []
+        WorkflowValidator.check_connections(nodes, connections, errors)
+        errors.extend(JsonHandler.build_graph({'nodes': nodes, 'connections': connections}).link_errors())
+        if errors:
+            raise WorkflowValidationError(errors)
 
     @staticmethod
-    def validate_workflow_json(workflow_json: str) -> Dict[Any, Any]:
+    def build_graph(workflow: Dict[str, Any]) -> WorkflowGraph:
         """
-        Validate the workflow JSON string against ComfyUI schema requirements
+        Build the adjacency-indexed graph of a workflow
 
         Args:
-            workflow_json: JSON string to validate
+            workflow: Workflow dict in nodes/connections format
 
         Returns:
-            Dict containing the parsed JSON
+            WorkflowGraph offering topological order, cycle detection,
+            link checks and dead-node pruning
+        """
+        connections = workflow.get('connections')
+        return WorkflowGraph(
+            workflow['nodes'],
+            connections if isinstance(connections, dict) else None,
+            JsonHandler.NODE_OUTPUT_ARITY,
+            JsonHandler.OUTPUT_NODE_TYPES,
+        )
 
-        Raises:
-            ValueError: If JSON is invalid or doesn't meet schema requirements
+    @staticmethod
+    def prune_dead_nodes(workflow: Dict[str, Any]) -> Dict[str, Any]:
+        """Return a copy of the workflow without nodes that never reach an output"""
+        return JsonHandler.build_graph(workflow).pruned(workflow)
+
+    @classmethod
+    def use_schema_registry(cls, registry: Optional[NodeSchemaRegistry]) -> None:
         """
-        try:
-            workflow = json.loads(workflow_json)
+        Validate against node schemas fetched from ComfyUI instead of the tables above
 
-            # Basic structure validation
-            if not isinstance(workflow, dict):
-                raise ValueError("Workflow must be a JSON object")
+        Node types the registry knows get full type, enum, range and link-type
+        checks; the requirement tables still apply to any other type. Pass None
+        to go back to the tables alone.
+        """
+        cls.schema_registry = registry if registry is not None and len(registry) else None
 
-            required_keys = ["nodes", "connections"]
-            missing_keys = [key for key in required_keys if key not in workflow]
-            if missing_keys:
-                raise ValueError(f"Workflow missing required keys: {missing_keys}")
+    @classmethod
+    def use_output_writer(cls, writer: OutputWriter) -> OutputWriter:
+        """
+        Save workflows through another writer (e.g. a background one)
 
-            # Validate nodes
-            nodes = workflow['nodes']
-            if not isinstance(nodes, dict):
-                raise ValueError("'nodes' must be a dictionary")
+        Returns:
+            The writer used until now, so the caller can restore it
+        """
+        previous, cls.output_writer = cls.output_writer, writer
+        return previous
 
-            # Check for required node types
-            found_node_types = set()
-            for node_id, node in nodes.items():
-                # Validate node structure
-                missing_fields = JsonHandler.NODE_SCHEMA['required_fields'] - set(node.keys())
-                if missing_fields:
-                    raise ValueError(f"Node {node_id} missing required fields: {missing_fields}")
+    @staticmethod
+    def _collect_errors(workflow: Any) -> List[ValidationError]:
+        registry = JsonHandler.schema_registry
+        skip_inputs = registry.class_types if registry is not None else frozenset()
+        errors = JsonHandler.get_validator().validate(workflow, skip_inputs)
+        # Graph checks need a well-formed node map; the validator has reported it otherwise
+        if isinstance(workflow, dict) and isinstance(workflow.get('nodes'), dict) and all(
+                isinstance(node, dict) for node in workflow['nodes'].values()):
+            errors.extend(JsonHandler.build_graph(workflow).errors())
+            if registry is not None:
+                # Both the graph and the schema check output indices; report each problem once
+                seen = {(error.code, error.node_id, error.input_name) for error in errors}
+                errors.extend(error for error in registry.validate(workflow)
+                              if (error.code, error.node_id, error.input_name) not in seen)
+        return errors
 
-                found_node_types.add(node['class_type'])
+    @staticmethod
+    def collect_errors(workflow: Union[str, Dict[str, Any]]) -> List[ValidationError]:
+        """
+        Validate a workflow and return every error instead of raising
 
-                # Validate node-specific inputs
-                JsonHandler.validate_node_inputs(node_id, node)
+        Args:
+            workflow: Workflow dict or JSON string, in nodes/connections or
+                API prompt format
 
-            missing_types = JsonHandler.REQUIRED_NODE_TYPES - found_node_types
-            if missing_types:
-                raise ValueError(f"Workflow missing required node types: {missing_types}")
+        Returns:
+            List of structured errors; empty if the workflow is valid
+        """
+        if isinstance(workflow, (str, bytes)):
+            try:
+                workflow = json.loads(workflow)
+            except json.JSONDecodeError as e:
+                return [ValidationError('invalid_json', f"Invalid JSON format: {str(e)}")]
+        if is_api_prompt(workflow):
+            workflow = from_api_prompt(workflow)
+        return JsonHandler._collect_errors(workflow)
 
-            # Validate connections
-            connections = workflow['connections']
-            if not isinstance(connections, dict):
-                raise ValueError("'connections' must be a dictionary")
+    @staticmethod
+    def validate_workflow_json(workflow_json: Union[str, Dict[str, Any]]) -> Dict[Any, Any]:
+        """
+        Validate the workflow JSON string against ComfyUI schema requirements
 
-            JsonHandler.validate_connections(nodes, connections)
+        Args:
+            workflow_json: JSON string (or already parsed dict) to validate
 
-            return workflow
+        Returns:
+            Dict containing the parsed JSON
 
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON format: {str(e)}")
+        Raises:
+            WorkflowValidationError: If JSON is invalid or doesn't meet schema
+                requirements; the message lists every error, one per line
+        """
+        workflow = workflow_json
+        if isinstance(workflow_json, (str, bytes)):
+            try:
+                workflow = json.loads(workflow_json)
+            except json.JSONDecodeError as e:
+                raise WorkflowValidationError([ValidationError('invalid_json', f"Invalid JSON format: {str(e)}")])
+        # API-format prompts (e.g. exported from ComfyUI) are accepted as they are
+        if is_api_prompt(workflow):
+            workflow = from_api_prompt(workflow)
+        errors = JsonHandler._collect_errors(workflow)
+        if errors:
+            raise WorkflowValidationError(errors)
+        return workflow
 
     @staticmethod
-    def save_workflow(workflow: Dict[Any, Any], description: str) -> str:
+    def safe_name(description: str, length: Optional[int] = 30) -> str:
+        """Filename-safe form of a description: letters, digits, '-' and '_' only"""
+        text = description[:length] if length else description
+        return "".join(c for c in text if c.isalnum() or c in (' ', '-', '_')).strip().replace(' ', '_')
+
+    @classmethod
+    def save_workflow(cls, workflow: Dict[Any, Any], description: str) -> str:
         """
         Save the workflow to a JSON file with a timestamp-based filename
 
@@ -173,28 +237,31 @@ class JsonHandler:
             description: Original workflow description for the filename
 
         Returns:
-            Path to the saved file
+            Path to the saved file (a numeric suffix is added if the name is
+            taken); with a background output_writer the file appears shortly
+            after, see OutputWriter.wait
         """
-        # Create a filename-safe version of the description
-        safe_description = "".join(c for c in description[:30] if c.isalnum() or c in (' ', '-', '_')).strip()
-        safe_description = safe_description.replace(' ', '_')
-
-        # Create timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        # Create filename
-        filename = f"workflow_{timestamp}_{safe_description}.json"
-
-        # Ensure the output directory exists with proper permissions
-        os.makedirs("outputs", exist_ok=True)
-        filepath = os.path.join("outputs", filename)
-
-        # Save the file with pretty printing for better readability
+        filename = f"workflow_{timestamp}_{cls.safe_name(description)}"
         try:
-            with open(filepath, 'w') as f:
-                json.dump(workflow, f, indent=2)
-            print(f"\nWorkflow JSON saved successfully to: {filepath}")
+            with tracing.span("save"):
+                filepath = cls.output_writer.write("outputs", filename, workflow)
+            logging.debug(f"Workflow JSON saved successfully to: {filepath}")
             return filepath
         except Exception as e:
-            print(f"\nError saving workflow JSON: {str(e)}")
-            raise
\ No newline at end of file
+            logging.error(f"Error saving workflow JSON: {str(e)}")
+            raise
+
+    @classmethod
+    def save_raw_workflow(cls, workflow_json: str, description: str) -> str:
+        """
+        Save the unvalidated workflow JSON as returned by Claude to raw_jsons/
+
+        Args:
+            workflow_json: Raw JSON string from the generator
+            description: Original workflow description for the filename
+
+        Returns:
+            Path to the saved file (a numeric suffix is added if the name is taken)
+        """
+        return cls.output_writer.write("raw_jsons", cls.safe_name(description, None) or "workflow", workflow_json)
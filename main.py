@@ -1,121 +1,295 @@
+import atexit
 import json
+import logging
 import sys
 import argparse
+import uuid
+from typing import List, Optional
 from config import Config
 from claude_client import ClaudeClient
 from json_handler import JsonHandler
-from json_feedback import validate_and_refine_workflow
+from json_feedback import validate_and_refine_workflow, RefineBudget, RefineEngine
 from comfyui_client import ComfyUIClient
+from comfyui_pool import ComfyUIPool
+from result_store import ResultStore
+from affinity_scheduler import AffinityScheduler
+from batch_runner import BatchPipeline, load_descriptions
+from datetime import datetime
+from workflow_cache import WorkflowCache
+from node_schema import NodeSchemaRegistry
+from output_writer import OutputWriter, OutputWriteError, ENCODINGS
+import tracing
 
 import os
 
 os.environ["ANTHROPIC_API_KEY"] = "sk-ant-REDACTED"
 
 
-def process_workflow(description: str) -> None:
+def load_schema_registry(comfyui_client: ComfyUIClient, is_connected: bool, snapshot_path: Optional[str]) -> None:
+    """Refresh the node-schema snapshot from ComfyUI (or use the cached one) for validation"""
+    if not snapshot_path:
+        return
+    registry = NodeSchemaRegistry(snapshot_path)
+    if is_connected:
+        try:
+            if registry.refresh(comfyui_client):
+                logging.info(f"✓ Node schemas updated ({len(registry)} node types)")
+        except (RuntimeError, ValueError) as e:
+            logging.warning(f"Warning: Could not refresh node schemas: {str(e)}")
+    if len(registry):
+        JsonHandler.use_schema_registry(registry)
+
+
+def process_workflow(description: str, cache: Optional[WorkflowCache] = None, use_templates: bool = True,
+                     schema_path: Optional[str] = NodeSchemaRegistry.DEFAULT_PATH,
+                     refine_budget: Optional[RefineBudget] = None,
+                     result_store: Optional[ResultStore] = None) -> None:
     """Process a single workflow description and generate the JSON file"""
     try:
         config = Config()
         if not config.validate():
-            print("Error: Configuration is invalid. Please check your environment variables.")
+            logging.error("Error: Configuration is invalid. Please check your environment variables.")
             sys.exit(1)
 
         # Initialize clients
-        claude_client = ClaudeClient(config.get_api_key())
-        comfyui_client = ComfyUIClient()
-
-        # Check ComfyUI connection first
-        is_connected, message = comfyui_client.check_connection()
-        if not is_connected:
-            print(f"\nWarning: {message}")
-            print("\nTo use ComfyUI:")
-            print("1. Download and run ComfyUI locally from: https://github.com/comfyanonymous/ComfyUI")
-            print("2. Ensure ComfyUI is running on port 8188")
-            print("\nWill generate and save the workflow JSON, but cannot execute it in ComfyUI.")
-        else:
-            print("\nComfyUI connection successful!")
-
-        print("\nGenerating workflow...")
-        workflow_json = claude_client.generate_workflow(description)
-
-        # Save the raw workflow JSON to the raw_jsons folder
-        os.makedirs("raw_jsons", exist_ok=True)
-        raw_json_path = os.path.join("raw_jsons", f"{description.replace(' ', '_')}.json")
-        with open(raw_json_path, 'w') as f:
-            f.write(workflow_json)
-        print(f"✓ Raw workflow JSON saved to: {raw_json_path}")
-
-        # Validate the generated JSON
-        print("\nValidating and refinining workflow JSON...")
-        workflow = validate_and_refine_workflow(workflow_json)
-        print("✓ JSON validation successful")
-
-        # Save the workflow
-        print("\nSaving workflow...")
-        filepath = JsonHandler.save_workflow(workflow, description)
-        print(f"✓ Workflow saved to: {filepath}")
-
-        # Only try to execute if ComfyUI is available
-        if is_connected:
-            print("\nExecuting workflow in ComfyUI...")
-            
-            output_path = comfyui_client.execute_workflow(workflow)
-
-            if output_path:
-                print(f"✓ Generated image saved to: {output_path}")
+        claude_client = ClaudeClient(config.get_api_key(), cache=cache, use_templates=use_templates)
+        # Closing the client also stops its WebSocket session and thread
+        with ComfyUIClient(result_store=result_store) as comfyui_client:
+
+            # Check ComfyUI connection first
+            is_connected, message = comfyui_client.check_connection()
+            if not is_connected:
+                logging.warning(f"Warning: {message}")
+                logging.info("To use ComfyUI:")
+                logging.info("1. Download and run ComfyUI locally from: https://github.com/comfyanonymous/ComfyUI")
+                logging.info("2. Ensure ComfyUI is running on port 8188")
+                logging.info("Will generate and save the workflow JSON, but cannot execute it in ComfyUI.")
             else:
-                print("\nWarning: Failed to execute workflow in ComfyUI. The workflow JSON has been saved and can be imported manually.")
+                logging.info("ComfyUI connection successful!")
+            load_schema_registry(comfyui_client, is_connected, schema_path)
+
+            with tracing.job(uuid.uuid4().hex[:8]), tracing.span("job"):
+                logging.info("Generating workflow...")
+                workflow, workflow_json = claude_client.generate_workflow_stream(description)
+
+                # Save the raw workflow JSON to the raw_jsons folder
+                raw_json_path = JsonHandler.save_raw_workflow(workflow_json, description)
+                logging.info(f"✓ Raw workflow JSON saved to: {raw_json_path}")
+
+                # Validate the generated JSON
+                logging.info("Validating and refinining workflow JSON...")
+                workflow = validate_and_refine_workflow(workflow, RefineEngine(claude_client, refine_budget), owned=True)
+                logging.info("✓ JSON validation successful")
+
+                # Save the workflow
+                logging.info("Saving workflow...")
+                filepath = JsonHandler.save_workflow(workflow, description)
+                logging.info(f"✓ Workflow saved to: {filepath}")
+
+                # Only try to execute if ComfyUI is available
+                if is_connected:
+                    logging.info("Executing workflow in ComfyUI...")
+
+                    result = comfyui_client.execute_workflow(workflow)
+
+                    if result and result.paths:
+                        for output_path in result.paths:
+                            logging.info(f"✓ Generated image saved to: {output_path}")
+                    else:
+                        logging.warning("Warning: Failed to execute workflow in ComfyUI. The workflow JSON has been saved and can be imported manually.")
 
     except Exception as e:
-        print(f"\nError: {str(e)}")
+        logging.error(f"Error: {str(e)}")
         sys.exit(1)
 
+def process_batch(batch_file: str, manifest_path: Optional[str], generate_workers: int,
+                  execute_workers: int, queue_size: int, cache: Optional[WorkflowCache] = None,
+                  use_templates: bool = True,
+                  schema_path: Optional[str] = NodeSchemaRegistry.DEFAULT_PATH,
+                  refine_budget: Optional[RefineBudget] = None, backends: Optional[List[str]] = None,
+                  affinity_wait: Optional[float] = None, result_store: Optional[ResultStore] = None) -> None:
+    """Process every description in a JSONL/CSV file through the pipelined batch runner"""
+    config = Config()
+    if not config.validate():
+        logging.error("Error: Configuration is invalid. Please check your environment variables.")
+        sys.exit(1)
+
+    try:
+        descriptions = load_descriptions(batch_file)
+    except (OSError, ValueError) as e:
+        logging.error(f"Error reading batch file: {str(e)}")
+        sys.exit(1)
+
+    claude_client = ClaudeClient(config.get_api_key(), cache=cache, use_templates=use_templates)
+    # Several ComfyUI servers are driven as one pool with load-aware dispatch
+    comfyui_client = (ComfyUIPool(backends, result_store=result_store) if backends
+                      else ComfyUIClient(result_store=result_store))
+    is_connected, message = comfyui_client.check_connection()
+    if not is_connected:
+        logging.warning(f"Warning: {message}")
+        logging.info("Workflows will be generated and saved but not executed.")
+    elif backends:
+        logging.info(message)
+    load_schema_registry(comfyui_client, is_connected, schema_path)
+
+    if not manifest_path:
+        manifest_path = os.path.join("outputs", f"batch_manifest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+
+    executor = comfyui_client
+    if affinity_wait is not None and not backends:
+        # Group executions by model; the scheduler needs many submissions held at once to choose from
+        executor = AffinityScheduler(comfyui_client, max_wait=affinity_wait)
+        execute_workers = max(execute_workers, queue_size)
+
+    pipeline = BatchPipeline(
+        claude_client,
+        executor if is_connected else None,
+        generate_workers=generate_workers,
+        refine_workers=generate_workers,
+        execute_workers=execute_workers,
+        queue_size=queue_size,
+        refine_budget=refine_budget,
+    )
+
+    logging.info(f"Processing {len(descriptions)} descriptions from {batch_file}...")
+
+    def report(record):
+        mark = "✓" if record["status"] == "ok" else "✗"
+        detail = record["workflow_path"] if record["status"] == "ok" else f"{record['failed_stage']}: {record['error']}"
+        logging.info(f"{mark} [{record['index']}] {detail}")
+
+    try:
+        records = pipeline.run(descriptions, manifest_path, on_item=report)
+    finally:
+        if executor is not comfyui_client:
+            executor.close()
+            logging.info(f"Model affinity: {executor.stats}")
+        comfyui_client.close()
+
+    failed = sum(1 for record in records if record["status"] != "ok")
+    logging.info(f"Batch complete: {len(records) - failed} succeeded, {failed} failed")
+    logging.info(f"✓ Manifest saved to: {manifest_path}")
+    if cache is not None:
+        logging.info(f"Workflow cache: {cache.stats}")
+    auto_repair = pipeline.refine_engine.auto_repair
+    if auto_repair is not None:
+        logging.info(f"Auto-repair saved {auto_repair.llm_calls_saved} refine call(s): {auto_repair.stats}")
+
 def test_workflow():
     """Run a test workflow to verify functionality"""
-    print("\n=== Running Test Workflow ===")
+    logging.info("=== Running Test Workflow ===")
 
     try:
-        comfyui_client = ComfyUIClient()
+        with ComfyUIClient() as comfyui_client:
 
-        is_connected, message = comfyui_client.check_connection()
+            is_connected, message = comfyui_client.check_connection()
 
-        if is_connected:
-            print("\nExecuting workflow in ComfyUI...")
-            print(comfyui_client.preloaded_json_path)
-            with open(comfyui_client.preloaded_json_path, 'r') as f:
-                json_string = f.read()
-                workflow = json.loads(json_string)
+            if is_connected:
+                logging.info("Executing workflow in ComfyUI...")
+                logging.debug(comfyui_client.preloaded_json_path)
+                with open(comfyui_client.preloaded_json_path, 'r') as f:
+                    json_string = f.read()
+                    workflow = json.loads(json_string)
                 
-                print("\nWORKFLOW", workflow, type(workflow))
+                    logging.debug(f"Loaded workflow with {len(workflow.get('nodes', workflow))} node(s)")
 
-            output_path = comfyui_client.execute_workflow(workflow)
+                result = comfyui_client.execute_workflow(workflow)
 
 
-            if output_path:
-                print(f"✓ Generated image saved to: {output_path}")
-            else:
-                print("\nWarning: Failed to execute workflow in ComfyUI. The workflow JSON has been saved and can be imported manually.")
+                if result and result.paths:
+                    for output_path in result.paths:
+                        logging.info(f"✓ Generated image saved to: {output_path}")
+                else:
+                    logging.warning("Warning: Failed to execute workflow in ComfyUI. The workflow JSON has been saved and can be imported manually.")
 
 
         return True
     except Exception as e:
-        print(f"\n✗ Test workflow failed: {str(e)}")
+        logging.error(f"✗ Test workflow failed: {str(e)}")
         return False
 
+def close_output_writer(writer: OutputWriter) -> None:
+    """Finish queued workflow file writes and report any that failed"""
+    try:
+        writer.close()
+    except OutputWriteError as e:
+        logging.error(f"✗ {len(e.failures)} workflow file(s) could not be written: {str(e)}")
+
+
 def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='ComfyUI Workflow Generator')
     parser.add_argument('--description', '-d', help='Workflow description to process')
     parser.add_argument('--test', action='store_true', help='Run test workflow')
+    parser.add_argument('--batch', metavar='FILE', help='Process descriptions from a JSONL or CSV file')
+    parser.add_argument('--manifest', help='Batch result manifest path (JSONL)')
+    parser.add_argument('--generate-workers', type=int, default=4, help='Concurrent LLM calls per batch stage')
+    parser.add_argument('--execute-workers', type=int, default=2, help='Concurrent ComfyUI executions in batch mode')
+    parser.add_argument('--backends', nargs='+', metavar='HOST:PORT',
+                        help='ComfyUI servers to spread batch executions over (default: the local one)')
+    parser.add_argument('--affinity-wait', type=float, default=None, metavar='SECONDS',
+                        help='Reorder batch executions to reduce model swaps, holding a job at most this long '
+                             '(single server only; --backends already routes jobs by model)')
+    parser.add_argument('--queue-size', type=int, default=16, help='Bound of the queues between batch stages')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the generated workflow cache')
+    parser.add_argument('--cache-dir', default='.workflow_cache', help='Generated workflow cache directory')
+    parser.add_argument('--cache-ttl', type=float, default=None, help='Expire cached workflows after this many seconds')
+    parser.add_argument('--cache-size', type=int, default=10000, help='Maximum number of cached workflows')
+    parser.add_argument('--no-result-store', action='store_true',
+                        help='Always execute workflows, even if an identical one already produced images')
+    parser.add_argument('--result-dir', default=ResultStore.DEFAULT_DIR, help='Executed workflow result store directory')
+    parser.add_argument('--no-templates', action='store_true', help='Always ask Claude instead of using local templates')
+    parser.add_argument('--schema-snapshot', default=NodeSchemaRegistry.DEFAULT_PATH,
+                        help='Where to cache the node schemas fetched from ComfyUI /object_info')
+    parser.add_argument('--no-schema', action='store_true', help='Validate with the built-in node tables only')
+    parser.add_argument('--refine-rounds', type=int, default=3, help='Maximum refine rounds per workflow')
+    parser.add_argument('--refine-tokens', type=int, default=None, help='Token budget for refining one workflow')
+    parser.add_argument('--refine-seconds', type=float, default=None, help='Time budget for refining one workflow')
+    parser.add_argument('--output-encoding', default='compact', choices=ENCODINGS,
+                        help='Format of saved workflow JSON (pretty indents it, gzip writes .json.gz)')
+    parser.add_argument('--sync-writes', action='store_true',
+                        help='Write workflow JSON before continuing instead of on a background thread')
+    parser.add_argument('--trace', metavar='FILE', help='Append per-stage timing spans to this JSONL file')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='Logging verbosity')
     args = parser.parse_args()
+    if args.affinity_wait is not None and args.backends:
+        parser.error("--affinity-wait cannot be combined with --backends; the pool already routes jobs by model")
+
+    logging.basicConfig(level=getattr(logging, args.log_level), format="%(message)s")
+    if args.log_level != 'DEBUG':
+        # One line per HTTP request from the Anthropic SDK is noise at INFO
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.trace:
+        tracing.enable(args.trace)
+        # Also runs when a command ends with sys.exit
+        atexit.register(lambda: tracing.log_summary(tracing.disable()))
+
+    writer = OutputWriter(args.output_encoding, background=not args.sync_writes)
+    JsonHandler.use_output_writer(writer)
+    # Registered after tracing so queued writes land (and are traced) before the summary
+    atexit.register(close_output_writer, writer)
+
+    cache = None if args.no_cache else WorkflowCache(args.cache_dir, max_entries=args.cache_size,
+                                                     ttl_seconds=args.cache_ttl)
+
+    result_store = None if args.no_result_store else ResultStore(args.result_dir)
+    schema_path = None if args.no_schema else args.schema_snapshot
+    refine_budget = RefineBudget(args.refine_rounds, args.refine_tokens, args.refine_seconds)
 
     if args.test:
         test_workflow()
         return
 
+    if args.batch:
+        process_batch(args.batch, args.manifest, args.generate_workers, args.execute_workers, args.queue_size, cache,
+                      not args.no_templates, schema_path, refine_budget, args.backends, args.affinity_wait,
+                      result_store)
+        return
+
     if args.description:
         # Non-interactive mode
-        process_workflow(args.description)
+        process_workflow(args.description, cache, not args.no_templates, schema_path, refine_budget, result_store)
         return
 
     # Interactive mode
@@ -151,7 +325,7 @@ You can import these files manually into ComfyUI later.
                 test_workflow()
                 continue
 
-            process_workflow(description)
+            process_workflow(description, cache, not args.no_templates, schema_path, refine_budget, result_store)
             print("\nEnter another description or 'quit' to exit:")
 
         except KeyboardInterrupt:
@@ -0,0 +1,223 @@
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Iterator, List, Tuple
+
+from workflow_templates import WorkflowTemplates
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class MockAnthropicServer:
+    """
+    In-process stub of the Anthropic messages endpoint for benchmarks and offline runs.
+
+    POST /v1/messages answers after `latency` seconds with a text-to-image
+    workflow built from the template, and usage figures derived from the
+    request size. Requests beyond requests_per_minute (counted over a rolling
+    window of `window` seconds, scaled accordingly) get a 429 rate_limit_error with a retry-after header, and
+    overload_rate of the remaining ones fail with 529 overloaded_error, so
+    client retry and pacing logic can be exercised deterministically enough
+    to measure.
+
+    The reply text (the template workflow unless `body` is given) is
+    generated at chunk_size characters every chunk_delay seconds. With
+    "stream": true it is sent as server-sent events as it is produced, and a
+    client hanging up early is counted in `aborted`; otherwise the whole
+    message is sent once generation is done.
+
+    Input tokens are estimated at four characters per token, counting the
+    system blocks too. A system prefix ending in a block with cache_control
+    is remembered once it reaches min_cache_tokens, and later requests with
+    the same prefix report it as cache_read_input_tokens instead of
+    input_tokens, like the real prompt cache.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.05,
+                 requests_per_minute: Optional[int] = None, overload_rate: float = 0.0,
+                 output_tokens: int = 600, window: float = 60.0, body: Optional[str] = None,
+                 chunk_size: int = 16, chunk_delay: float = 0.0, min_cache_tokens: int = 1024):
+        self.latency = latency
+        # A shorter window keeps the same average rate but lets benchmarks finish quickly
+        self.window = window
+        self.requests_per_minute = requests_per_minute
+        self.overload_rate = overload_rate
+        self.output_tokens = output_tokens
+        self.accepted = 0
+        self.rate_limited = 0
+        self.overloaded = 0
+        self.aborted = 0
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.min_cache_tokens = min_cache_tokens
+        self._prompt_cache: set = set()
+        self._window: list = []
+        self._lock = threading.Lock()
+        self._body = body if body is not None else json.dumps(
+            WorkflowTemplates.build("an image of a lighthouse at dusk"))
+
+        self.httpd = _HTTPServer((host, port), self._make_handler())
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "MockAnthropicServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockAnthropicServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _admit(self) -> Optional[float]:
+        """Record a request; returns retry-after seconds if it is over the limit"""
+        with self._lock:
+            if self.requests_per_minute is None:
+                self.accepted += 1
+                return None
+            now = time.monotonic()
+            limit = max(1, round(self.requests_per_minute * self.window / 60))
+            self._window = [stamp for stamp in self._window if now - stamp < self.window]
+            if len(self._window) >= limit:
+                self.rate_limited += 1
+                return max(0.001, self.window - (now - self._window[0]))
+            self._window.append(now)
+            self.accepted += 1
+            return None
+
+    def _chunks(self) -> List[str]:
+        return [self._body[i:i + self.chunk_size] for i in range(0, len(self._body), self.chunk_size)]
+
+    @staticmethod
+    def _text(content: Any) -> str:
+        if isinstance(content, str):
+            return content
+        return "".join(block.get("text", "") for block in content or [] if isinstance(block, dict))
+
+    def _usage(self, request: Dict[str, Any]) -> Dict[str, int]:
+        system = request.get("system")
+        blocks = [{"type": "text", "text": system}] if isinstance(system, str) else list(system or [])
+        cached = max((i + 1 for i, block in enumerate(blocks) if block.get("cache_control")), default=0)
+        prefix = self._text(blocks[:cached])
+        rest = self._text(blocks[cached:]) + "".join(
+            self._text(message.get("content")) for message in request.get("messages", []))
+        usage = {"input_tokens": max(1, len(rest) // 4), "output_tokens": self.output_tokens,
+                 "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+        prefix_tokens = len(prefix) // 4
+        if prefix_tokens < self.min_cache_tokens:
+            usage["input_tokens"] += prefix_tokens
+            return usage
+        with self._lock:
+            hit = prefix in self._prompt_cache
+            self._prompt_cache.add(prefix)
+        usage["cache_read_input_tokens" if hit else "cache_creation_input_tokens"] = prefix_tokens
+        return usage
+
+    def _message(self, request: Dict[str, Any], text: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model"),
+            "content": [{"type": "text", "text": self._body if text is None else text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": self._usage(request),
+        }
+
+    def _events(self, request: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Server-sent events of a streamed message, paced like generation"""
+        message = self._message(request, "")
+        message["stop_reason"] = None
+        message["usage"]["output_tokens"] = 1
+        yield "message_start", {"type": "message_start", "message": message}
+        yield "content_block_start", {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "text", "text": ""}}
+        for chunk in self._chunks():
+            time.sleep(self.chunk_delay)
+            yield "content_block_delta", {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": chunk}}
+        yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+        yield "message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                "usage": {"output_tokens": self.output_tokens}}
+        yield "message_stop", {"type": "message_stop"}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply_json(self, data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> None:
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _error(self, status: int, error_type: str, message: str,
+                       headers: Optional[Dict[str, str]] = None) -> None:
+                self._reply_json({"type": "error", "error": {"type": error_type, "message": message}}, status, headers)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.split("?")[0] != "/v1/messages":
+                    return self._error(404, "not_found_error", "Not found")
+                try:
+                    request = json.loads(body)
+                except ValueError:
+                    return self._error(400, "invalid_request_error", "Invalid JSON body")
+
+                retry_after = server._admit()
+                if retry_after is not None:
+                    return self._error(429, "rate_limit_error", "Number of requests has exceeded your rate limit",
+                                       {"retry-after": f"{retry_after:.3f}"})
+                time.sleep(server.latency)
+                if server.overload_rate and random.random() < server.overload_rate:
+                    with server._lock:
+                        server.overloaded += 1
+                    return self._error(529, "overloaded_error", "Overloaded")
+                if request.get("stream"):
+                    return self._stream(request)
+                time.sleep(server.chunk_delay * len(server._chunks()))
+                self._reply_json(server._message(request))
+
+            def _stream(self, request: Dict[str, Any]) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for event, data in server._events(request):
+                        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    with server._lock:
+                        server.aborted += 1
+
+        return Handler
@@ -0,0 +1,585 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, List
+from urllib.parse import urlparse, parse_qs
+
+# Smallest valid PNG (1x1 transparent pixel), served by /view
+PNG_PIXEL = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+# Loader inputs naming checkpoint, LoRA and VAE files
+MODEL_INPUTS = ('ckpt_name', 'lora_name', 'vae_name')
+
+WS_MAGIC = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def png_payload(size: int = 0) -> bytes:
+    """A valid PNG of at least `size` bytes: the 1x1 pixel padded with a private ancillary chunk"""
+    padding = size - len(PNG_PIXEL) - 12
+    if padding <= 0:
+        return PNG_PIXEL
+    chunk_type, data = b"mkPd", os.urandom(padding)
+    chunk = struct.pack(">I", padding) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+    # The private chunk goes right before IEND (the last 12 bytes)
+    return PNG_PIXEL[:-12] + chunk + PNG_PIXEL[-12:]
+
+OUTPUT_NODE_TYPES = {'SaveImage', 'PreviewImage'}
+
+# Recorded subset of a real ComfyUI /object_info response
+OBJECT_INFO_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "object_info.json")
+
+
+class _WebSocketConnection:
+    """Server side of a single WebSocket connection (RFC 6455, no extensions)"""
+
+    def __init__(self, sock: socket.socket, client_id: str):
+        self.sock = sock
+        self.client_id = client_id
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def _send_frame(self, opcode: int, payload: bytes) -> None:
+        header = bytes([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header += bytes([length])
+        elif length < 65536:
+            header += bytes([126]) + struct.pack("!H", length)
+        else:
+            header += bytes([127]) + struct.pack("!Q", length)
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                self.sock.sendall(header + payload)
+            except OSError:
+                self.closed = True
+
+    def send_json(self, message: Dict[str, Any]) -> None:
+        self._send_frame(0x1, json.dumps(message).encode('utf-8'))
+
+    def send_binary(self, payload: bytes) -> None:
+        self._send_frame(0x2, payload)
+
+    def _recv_exact(self, n: int) -> bytes:
+        data = b""
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed")
+            data += chunk
+        return data
+
+    def serve(self) -> None:
+        """Read client frames until the peer closes; answers pings and closes"""
+        try:
+            while not self.closed:
+                first, second = self._recv_exact(2)
+                opcode = first & 0x0F
+                length = second & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", self._recv_exact(2))[0]
+                elif length == 127:
+                    length = struct.unpack("!Q", self._recv_exact(8))[0]
+                mask = self._recv_exact(4) if second & 0x80 else b""
+                payload = self._recv_exact(length)
+                if mask:
+                    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+                if opcode == 0x8:
+                    self._send_frame(0x8, payload[:2])
+                    break
+                if opcode == 0x9:
+                    self._send_frame(0xA, payload)
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open many connections at once; the default backlog of 5 resets them
+    request_queue_size = 1024
+
+    def server_bind(self) -> None:
+        # Open connections, so stop() can drop keep-alive clients like a dying process would
+        self.connections: set = set()
+        self._connections_lock = threading.Lock()
+        super().server_bind()
+
+    def process_request(self, request, client_address) -> None:
+        with self._connections_lock:
+            self.connections.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request) -> None:
+        with self._connections_lock:
+            self.connections.discard(request)
+        super().shutdown_request(request)
+
+    def close_connections(self) -> None:
+        with self._connections_lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class MockComfyUIServer:
+    """
+    In-process fake of the ComfyUI HTTP/WebSocket API for benchmarks and offline runs.
+
+    Prompts are executed in submission order by `workers` threads (one, like a
+    single-GPU ComfyUI, by default). Every node "runs" for
+    node_delay seconds (or node_delays[class_type]) and the server emits the same execution_start / executing /
+    executed / execution_success messages a real ComfyUI instance sends to the
+    submitting client.
+
+    Like ComfyUI it serves /queue (list, clear, delete) and /interrupt, and
+    with cache_outputs it skips nodes whose inputs match an earlier run
+    (reported in execution_cached). failure_rate of the prompts fail in a
+    random node with execution_error, and http_error_rate of /prompt and
+    /view requests get a 500. A prompt that needs other checkpoint/LoRA/VAE
+    files than the previous one pays model_swap_delay extra. Images are image_bytes-sized PNGs, both from
+    /view and as WebSocket frames. GET /mock/stats reports counters and
+    submission timestamps for load tests.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, node_delay: float = 0.01, workers: int = 1,
+                 previews: int = 0, object_info_path: str = OBJECT_INFO_FIXTURE,
+                 node_delays: Optional[Dict[str, float]] = None, failure_rate: float = 0.0,
+                 http_error_rate: float = 0.0, image_bytes: int = 0, cache_outputs: bool = False,
+                 seed: Optional[int] = None, model_swap_delay: float = 0.0):
+        self.node_delay = node_delay
+        self.node_delays = dict(node_delays or {})
+        self.workers = workers
+        # Binary preview frames sent while each KSampler runs
+        self.previews = previews
+        self.failure_rate = failure_rate
+        self.http_error_rate = http_error_rate
+        self.image = png_payload(image_bytes)
+        self.cache_outputs = cache_outputs
+        # Extra seconds the first loader node takes when the prompt needs other models than the last one
+        self.model_swap_delay = model_swap_delay
+        self._loaded_models: Optional[tuple] = None
+        self.history: Dict[str, Dict[str, Any]] = {}
+        self.clients: Dict[str, _WebSocketConnection] = {}
+        self.stats: Dict[str, Any] = {"submitted": 0, "completed": 0, "failed": 0, "interrupted": 0,
+                                      "cached_nodes": 0, "http_errors": 0, "model_swaps": 0,
+                                      "first_submit": None, "last_submit": None}
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        # Queued and running jobs by prompt ID, in submission order
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._node_cache: set = set()
+        self._random = random.Random(seed)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._number = 0
+        with open(object_info_path, 'rb') as f:
+            self.object_info = f.read()
+        self.object_info_etag = f'"{hashlib.sha256(self.object_info).hexdigest()[:16]}"'
+
+        self.httpd = _HTTPServer((host, port), self._make_handler())
+        self.host, self.port = self.httpd.server_address[:2]
+        self._threads: List[threading.Thread] = []
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def start(self) -> "MockComfyUIServer":
+        self._threads = [threading.Thread(target=self.httpd.serve_forever, daemon=True)]
+        self._threads += [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        for _ in range(self.workers):
+            self._queue.put(None)
+        for conn in list(self.clients.values()):
+            conn.close()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.httpd.close_connections()
+
+    def __enter__(self) -> "MockComfyUIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def drop_websockets(self) -> None:
+        """Abruptly close every WebSocket connection (simulates a network drop)"""
+        for conn in list(self.clients.values()):
+            conn.close()
+
+    # -- queue / execution ---------------------------------------------------
+
+    @property
+    def queue_remaining(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def submit(self, prompt: Dict[str, Any], client_id: Optional[str] = None) -> Dict[str, Any]:
+        prompt_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._number += 1
+            self._pending += 1
+            number = self._number
+            job = {"prompt_id": prompt_id, "number": number, "prompt": prompt, "client_id": client_id,
+                   "running": False, "cancelled": False, "interrupted": False}
+            self._jobs[prompt_id] = job
+            self.stats["submitted"] += 1
+            self.stats["first_submit"] = self.stats["first_submit"] or now
+            self.stats["last_submit"] = now
+        self._queue.put(job)
+        self._broadcast_status()
+        return {"prompt_id": prompt_id, "number": number, "node_errors": {}}
+
+    def queue_state(self) -> Dict[str, List[list]]:
+        """Running and pending prompts in the shape of ComfyUI's GET /queue"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        entry = lambda job: [job["number"], job["prompt_id"], job["prompt"], {"client_id": job["client_id"]}, []]
+        return {"queue_running": [entry(job) for job in jobs if job["running"]],
+                "queue_pending": [entry(job) for job in jobs if not job["running"]]}
+
+    def delete(self, prompt_ids: Optional[List[str]] = None) -> None:
+        """Drop pending prompts (all of them if prompt_ids is None), like POST /queue"""
+        with self._lock:
+            for prompt_id, job in list(self._jobs.items()):
+                if not job["running"] and (prompt_ids is None or prompt_id in prompt_ids):
+                    job["cancelled"] = True
+                    del self._jobs[prompt_id]
+                    self._pending -= 1
+        self._broadcast_status()
+
+    def interrupt(self) -> None:
+        """Stop the running prompts after their current node, like POST /interrupt"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job["running"]:
+                    job["interrupted"] = True
+
+    def _send(self, client_id: Optional[str], message: Dict[str, Any]) -> None:
+        conn = self.clients.get(client_id) if client_id else None
+        if conn is not None:
+            conn.send_json(message)
+
+    def _send_binary(self, client_id: Optional[str], payload: bytes) -> None:
+        conn = self.clients.get(client_id) if client_id else None
+        if conn is not None:
+            conn.send_binary(payload)
+
+    def _broadcast_status(self) -> None:
+        message = {"type": "status", "data": {"status": {"exec_info": {"queue_remaining": self.queue_remaining}}}}
+        for conn in list(self.clients.values()):
+            conn.send_json(message)
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job["cancelled"]:
+                    continue
+                job["running"] = True
+            self._execute(job)
+            with self._lock:
+                self._jobs.pop(job["prompt_id"], None)
+                self._pending -= 1
+            self._broadcast_status()
+
+    @staticmethod
+    def _signatures(nodes: Dict[str, Any]) -> Dict[str, str]:
+        """Per-node hash of class_type and inputs, following links, as ComfyUI's cache keys them"""
+        signatures: Dict[str, str] = {}
+
+        def signature(node_id: str, visiting: frozenset) -> str:
+            if node_id not in signatures:
+                node = nodes.get(node_id)
+                if not isinstance(node, dict) or node_id in visiting:
+                    return f"missing:{node_id}"
+                inputs = {}
+                for name, value in (node.get('inputs') or {}).items():
+                    if isinstance(value, list) and len(value) == 2 and str(value[0]) in nodes:
+                        value = ["link", signature(str(value[0]), visiting | {node_id}), value[1]]
+                    inputs[name] = value
+                key = json.dumps([node.get('class_type'), inputs], sort_keys=True, default=str)
+                signatures[node_id] = hashlib.sha1(key.encode('utf-8')).hexdigest()
+            return signatures[node_id]
+
+        for node_id in nodes:
+            signature(node_id, frozenset())
+        return signatures
+
+    @staticmethod
+    def _models(nodes: Dict[str, Any]) -> tuple:
+        """Model files the prompt loads; ComfyUI reloads weights whenever these change"""
+        return tuple(sorted({(name, value) for node in nodes.values()
+                             for name, value in (node.get('inputs') or {}).items()
+                             if name in MODEL_INPUTS and isinstance(value, str)}))
+
+    def _execute(self, job: Dict[str, Any]) -> None:
+        prompt_id, client_id = job["prompt_id"], job["client_id"]
+        nodes = job["prompt"]
+        outputs: Dict[str, Any] = {}
+        status = "success"
+        messages: List[list] = []
+
+        self._send(client_id, {"type": "execution_start", "data": {"prompt_id": prompt_id}})
+        signatures = self._signatures(nodes) if self.cache_outputs else {}
+        with self._lock:
+            cached = [node_id for node_id, key in signatures.items()
+                      if key in self._node_cache and nodes[node_id].get('class_type') not in OUTPUT_NODE_TYPES]
+            self.stats["cached_nodes"] += len(cached)
+        if self.cache_outputs:
+            self._send(client_id, {"type": "execution_cached", "data": {"nodes": cached, "prompt_id": prompt_id}})
+        fail_at = None
+        swap_at = None
+        models = self._models(nodes)
+        with self._lock:
+            if models and models != self._loaded_models:
+                self._loaded_models = models
+                self.stats["model_swaps"] += 1
+                swap_at = next(node_id for node_id, node in nodes.items() if self._models({node_id: node}))
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            fail_at = self._random.choice(list(nodes))
+
+        for node_id, node in nodes.items():
+            class_type = node.get('class_type') if isinstance(node, dict) else None
+            if job["interrupted"]:
+                status = "interrupted"
+                self._send(client_id, {"type": "execution_interrupted",
+                                       "data": {"prompt_id": prompt_id, "node_id": node_id, "node_type": class_type,
+                                                "executed": list(outputs)}})
+                break
+            if node_id in cached:
+                continue
+            self._send(client_id, {"type": "executing", "data": {"node": node_id, "prompt_id": prompt_id}})
+            delay = self.node_delays.get(class_type, self.node_delay)
+            if node_id == swap_at:
+                delay += self.model_swap_delay
+            if delay:
+                time.sleep(delay)
+            if node_id == fail_at:
+                status = "error"
+                error = {"prompt_id": prompt_id, "node_id": node_id, "node_type": class_type,
+                         "exception_message": "Injected failure", "exception_type": "RuntimeError",
+                         "traceback": [], "executed": list(outputs)}
+                messages.append(["execution_error", error])
+                self._send(client_id, {"type": "execution_error", "data": error})
+                break
+            if class_type == 'KSampler':
+                for _ in range(self.previews):
+                    self._send_binary(client_id, struct.pack(">II", 1, 1) + self.image)
+            elif class_type == 'SaveImageWebsocket':
+                self._send_binary(client_id, struct.pack(">II", 1, 2) + self.image)
+            if class_type in OUTPUT_NODE_TYPES:
+                output = {"images": [{"filename": f"mock_{prompt_id[:8]}_{node_id}.png", "subfolder": "", "type": "output"}]}
+                outputs[node_id] = output
+                self._send(client_id, {"type": "executed",
+                                       "data": {"node": node_id, "output": output, "prompt_id": prompt_id}})
+
+        if status == "success" and signatures:
+            with self._lock:
+                self._node_cache.update(signatures.values())
+        self.history[prompt_id] = {
+            "prompt": [job["number"], prompt_id, job["prompt"], {}, list(outputs)],
+            "outputs": outputs,
+            "status": {"status_str": status, "completed": status == "success", "messages": messages},
+        }
+        with self._lock:
+            self.stats[{"success": "completed", "error": "failed", "interrupted": "interrupted"}[status]] += 1
+        if status == "success":
+            self._send(client_id, {"type": "execution_success", "data": {"prompt_id": prompt_id}})
+        # ComfyUI ends every prompt, failed or not, with executing: null
+        self._send(client_id, {"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+
+    def _http_error(self) -> bool:
+        """Decide whether to fail this request (http_error_rate) and count it"""
+        if not self.http_error_rate or self._random.random() >= self.http_error_rate:
+            return False
+        with self._lock:
+            self.stats["http_errors"] += 1
+        return True
+
+    # -- HTTP ----------------------------------------------------------------
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _reply_json(self, data: Any, status: int = 200) -> None:
+                self._reply(status, json.dumps(data).encode('utf-8'))
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/ws":
+                    return self._websocket(parse_qs(url.query).get("clientId", [str(uuid.uuid4())])[0])
+                if url.path == "/history":
+                    return self._reply_json(server.history)
+                if url.path.startswith("/history/"):
+                    prompt_id = url.path[len("/history/"):]
+                    entry = server.history.get(prompt_id)
+                    return self._reply_json({prompt_id: entry} if entry else {})
+                if url.path == "/view":
+                    if server._http_error():
+                        return self._reply_json({"error": "injected failure"}, 500)
+                    return self._reply(200, server.image, "image/png")
+                if url.path == "/object_info":
+                    return self._object_info()
+                if url.path == "/queue":
+                    return self._reply_json(server.queue_state())
+                if url.path == "/prompt":
+                    return self._reply_json({"exec_info": {"queue_remaining": server.queue_remaining}})
+                if url.path == "/mock/stats":
+                    with server._lock:
+                        return self._reply_json(dict(server.stats, queue_remaining=server._pending))
+                self._reply_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                path = urlparse(self.path).path
+                if path == "/interrupt":
+                    server.interrupt()
+                    return self._reply(200, b"")
+                if path == "/queue":
+                    try:
+                        data = json.loads(body or b"{}")
+                    except ValueError:
+                        return self._reply_json({"error": "invalid body"}, 400)
+                    if data.get("clear"):
+                        server.delete()
+                    if data.get("delete"):
+                        server.delete(list(data["delete"]))
+                    return self._reply(200, b"")
+                if path != "/prompt":
+                    return self._reply_json({"error": "not found"}, 404)
+                if server._http_error():
+                    return self._reply_json({"error": "injected failure"}, 500)
+                try:
+                    data = json.loads(body)
+                    prompt = data["prompt"]
+                except (ValueError, KeyError):
+                    return self._reply_json({"error": "invalid prompt"}, 400)
+                # Like ComfyUI, only the flat API format is accepted
+                if not isinstance(prompt, dict) or not all(
+                        isinstance(node, dict) and 'class_type' in node for node in prompt.values()):
+                    return self._reply_json({"error": {"type": "invalid_prompt",
+                                                       "message": "Cannot execute because a node is missing the class_type property."},
+                                             "node_errors": {}}, 400)
+                self._reply_json(server.submit(prompt, data.get("client_id")))
+
+            def _object_info(self) -> None:
+                if self.headers.get("If-None-Match") == server.object_info_etag:
+                    self.send_response(304)
+                    self.send_header("ETag", server.object_info_etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("ETag", server.object_info_etag)
+                self.send_header("Content-Length", str(len(server.object_info)))
+                self.end_headers()
+                self.wfile.write(server.object_info)
+
+            def _websocket(self, client_id: str) -> None:
+                key = self.headers.get("Sec-WebSocket-Key", "")
+                accept = base64.b64encode(hashlib.sha1((key + WS_MAGIC).encode()).digest()).decode()
+                self.send_response(101)
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept)
+                self.end_headers()
+                self.wfile.flush()
+
+                conn = _WebSocketConnection(self.connection, client_id)
+                server.clients[client_id] = conn
+                conn.send_json({"type": "status",
+                                "data": {"status": {"exec_info": {"queue_remaining": server.queue_remaining}},
+                                         "sid": client_id}})
+                conn.serve()
+                if server.clients.get(client_id) is conn:
+                    del server.clients[client_id]
+                self.close_connection = True
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake ComfyUI server for offline runs and load tests")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8188, help='0 picks a free port')
+    parser.add_argument('--node-delay', type=float, default=0.01, help='Seconds every node runs for')
+    parser.add_argument('--node-delays', nargs='*', default=[], metavar='CLASS=SECONDS',
+                        help='Per-class overrides, e.g. KSampler=0.5')
+    parser.add_argument('--workers', type=int, default=1, help='Prompts executed at once')
+    parser.add_argument('--previews', type=int, default=0, help='Preview frames sent per KSampler')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of prompts failing mid-run')
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help='Fraction of /prompt and /view 500s')
+    parser.add_argument('--image-bytes', type=int, default=0, help='Size of every image served')
+    parser.add_argument('--cache-outputs', action='store_true', help='Skip nodes already run with the same inputs')
+    parser.add_argument('--model-swap-delay', type=float, default=0.0,
+                        help='Extra seconds a prompt takes when it needs other models than the previous one')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for failure injection')
+    args = parser.parse_args()
+
+    node_delays = {}
+    for item in args.node_delays:
+        class_type, _, seconds = item.partition('=')
+        node_delays[class_type] = float(seconds)
+    server = MockComfyUIServer(args.host, args.port, args.node_delay, args.workers, args.previews,
+                               node_delays=node_delays, failure_rate=args.failure_rate,
+                               http_error_rate=args.http_error_rate, image_bytes=args.image_bytes,
+                               cache_outputs=args.cache_outputs, seed=args.seed,
+                               model_swap_delay=args.model_swap_delay).start()
+    # Load-test drivers read this line to find the port
+    print(f"Mock ComfyUI listening on http://{server.host}:{server.port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
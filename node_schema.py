@@ -0,0 +1,312 @@
+import hashlib
+import json
+import mmap
+import os
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from workflow_graph import is_link
+from workflow_validator import ValidationError
+
+SNAPSHOT_FORMAT = 1
+
+
+class InputSpec:
+    """
+    One input of a node as described by /object_info
+
+    INT/FLOAT/STRING/BOOLEAN and COMBO (a list of choices) are widget inputs
+    that take literal values; any other type name is a link type such as
+    MODEL or LATENT.
+    """
+
+    __slots__ = ('type', 'choices', 'min', 'max')
+
+    def __init__(self, spec: List[Any]):
+        kind = spec[0] if spec else '*'
+        options = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+        if isinstance(kind, list):
+            self.type, self.choices = 'COMBO', frozenset(kind)
+        elif kind == 'COMBO':
+            self.type, self.choices = 'COMBO', frozenset(options.get('options', ()))
+        else:
+            self.type, self.choices = kind, None
+        self.min = options.get('min')
+        self.max = options.get('max')
+
+    def check_value(self, node_id: str, class_type: str, name: str, value: Any) -> Optional[ValidationError]:
+        """Check a literal (non-link) value; returns the error or None"""
+        kind = self.type
+        if kind == 'INT':
+            ok = isinstance(value, int) and not isinstance(value, bool)
+        elif kind == 'FLOAT':
+            ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+        elif kind == 'STRING':
+            ok = isinstance(value, str)
+        elif kind == 'BOOLEAN':
+            ok = isinstance(value, bool)
+        elif kind == 'COMBO':
+            if not isinstance(value, (str, int, float, bool)):
+                # Lists and dicts are unhashable, so check them before the set lookup
+                return ValidationError(
+                    'bad_type', f"Node {node_id} ({class_type}) input '{name}' must be one value, got {type(value)}",
+                    node_id, name,
+                )
+            if self.choices and value not in self.choices:
+                return ValidationError(
+                    'bad_enum',
+                    f"Node {node_id} ({class_type}) input '{name}' value {value!r} is not one of the "
+                    f"{len(self.choices)} allowed values",
+                    node_id, name,
+                )
+            return None
+        else:
+            return ValidationError(
+                'expected_link',
+                f"Node {node_id} ({class_type}) input '{name}' must be a link to a {kind} output",
+                node_id, name,
+            )
+        if not ok:
+            return ValidationError(
+                'bad_type', f"Node {node_id} ({class_type}) input '{name}' must be {kind}, got {type(value)}",
+                node_id, name,
+            )
+        if (self.min is not None and value < self.min) or (self.max is not None and value > self.max):
+            return ValidationError(
+                'out_of_range',
+                f"Node {node_id} ({class_type}) input '{name}' value {value} is outside [{self.min}, {self.max}]",
+                node_id, name,
+            )
+        return None
+
+
+class NodeSchema:
+    """Compiled schema of one class_type"""
+
+    __slots__ = ('class_type', 'required', 'optional', 'outputs')
+
+    def __init__(self, class_type: str, compact: Dict[str, Any]):
+        self.class_type = class_type
+        self.required = {name: InputSpec(spec) for name, spec in compact.get('r', {}).items()}
+        self.optional = {name: InputSpec(spec) for name, spec in compact.get('o', {}).items()}
+        self.outputs: List[str] = compact.get('out', [])
+
+
+def compact_object_info(object_info: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Strip /object_info down to what validation needs (types, enums, ranges, outputs)"""
+    compact = {}
+    for class_type, info in object_info.items():
+        inputs = info.get('input') or {}
+        entry: Dict[str, Any] = {}
+        for section, key in (('required', 'r'), ('optional', 'o')):
+            specs = {}
+            for name, spec in (inputs.get(section) or {}).items():
+                kind = spec[0] if isinstance(spec, list) and spec else '*'
+                options = spec[1] if isinstance(spec, list) and len(spec) > 1 and isinstance(spec[1], dict) else {}
+                kept = {k: options[k] for k in ('min', 'max', 'options') if k in options}
+                specs[name] = [kind, kept] if kept else [kind]
+            if specs:
+                entry[key] = specs
+        entry['out'] = list(info.get('output') or [])
+        compact[class_type] = entry
+    return compact
+
+
+class NodeSchemaRegistry:
+    """
+    Node schemas from ComfyUI's /object_info, cached in an on-disk snapshot
+
+    The snapshot is one JSON header line (ETag, content hash, byte offsets of
+    every class) followed by each class's compact schema. Loading memory-maps
+    the file and only parses the header; a class's schema is decoded from its
+    slice the first time a workflow uses it. refresh() revalidates against the
+    server with If-None-Match and only rewrites the snapshot when the content
+    hash changes, so validation runs offline without a request per run.
+    """
+
+    DEFAULT_PATH = os.path.join(".comfyui_schema", "object_info.snapshot")
+
+    def __init__(self, snapshot_path: str = DEFAULT_PATH):
+        self.snapshot_path = snapshot_path
+        self.etag: Optional[str] = None
+        self.sha256: Optional[str] = None
+        self.fetched_at: Optional[float] = None
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._schemas: Dict[str, NodeSchema] = {}
+        self._mmap: Optional[mmap.mmap] = None
+        self._body_offset = 0
+        if os.path.exists(snapshot_path):
+            self.load()
+
+    # -- snapshot ------------------------------------------------------------
+
+    @property
+    def class_types(self) -> frozenset:
+        return frozenset(self._index)
+
+    def __contains__(self, class_type: str) -> bool:
+        return class_type in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def load(self) -> None:
+        """Memory-map the snapshot and read its header"""
+        self.close()
+        with open(self.snapshot_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        newline = self._mmap.find(b"\n")
+        header = json.loads(self._mmap[:newline])
+        if header.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported schema snapshot format: {header.get('format')}")
+        self.etag = header.get('etag')
+        self.sha256 = header.get('sha256')
+        self.fetched_at = header.get('fetched_at')
+        self._index = {class_type: tuple(span) for class_type, span in header['index'].items()}
+        self._body_offset = newline + 1
+        self._schemas = {}
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def save(self, object_info: Dict[str, Any], etag: Optional[str], sha256: str) -> None:
+        """Write a new snapshot atomically and load it"""
+        body = bytearray()
+        index = {}
+        for class_type, entry in compact_object_info(object_info).items():
+            encoded = json.dumps(entry, separators=(',', ':')).encode('utf-8')
+            index[class_type] = [len(body), len(encoded)]
+            body += encoded
+        header = {"format": SNAPSHOT_FORMAT, "etag": etag, "sha256": sha256,
+                  "fetched_at": time.time(), "index": index}
+
+        os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(header, separators=(',', ':')).encode('utf-8') + b"\n")
+            f.write(body)
+        self.close()
+        os.replace(tmp_path, self.snapshot_path)
+        self.load()
+
+    def load_object_info(self, object_info: Dict[str, Any]) -> None:
+        """Build the snapshot from an /object_info document, e.g. a recorded fixture"""
+        raw = json.dumps(object_info, sort_keys=True).encode('utf-8')
+        self.save(object_info, None, hashlib.sha256(raw).hexdigest())
+
+    def refresh(self, client, force: bool = False) -> bool:
+        """
+        Revalidate the snapshot against a ComfyUI server
+
+        Args:
+            client: ComfyUIClient to fetch /object_info with
+            force: Ignore the stored ETag and download unconditionally
+
+        Returns:
+            True if the snapshot changed
+        """
+        status, etag, body = client.get_object_info(None if force else self.etag)
+        if status == 304:
+            return False
+        if status != 200 or body is None:
+            raise RuntimeError(f"Could not fetch /object_info: HTTP {status}")
+        digest = hashlib.sha256(body).hexdigest()
+        if digest == self.sha256 and not force:
+            return False
+        self.save(json.loads(body), etag, digest)
+        return True
+
+    def get(self, class_type: str) -> Optional[NodeSchema]:
+        """Compiled schema for class_type, decoded from the snapshot on first use"""
+        schema = self._schemas.get(class_type)
+        if schema is None:
+            span = self._index.get(class_type)
+            if span is None:
+                return None
+            start = self._body_offset + span[0]
+            schema = NodeSchema(class_type, json.loads(self._mmap[start:start + span[1]]))
+            self._schemas[class_type] = schema
+        return schema
+
+    # -- validation ----------------------------------------------------------
+
+    def validate(self, workflow: Dict[str, Any]) -> List[ValidationError]:
+        """
+        Check every node against its schema
+
+        Covers unknown node types, missing required inputs, literal types,
+        numeric ranges, enum values, link output indices and link types.
+
+        Args:
+            workflow: Workflow in nodes/connections format
+
+        Returns:
+            List of errors; empty if every node matches its schema
+        """
+        nodes = workflow.get('nodes', workflow)
+        connections = workflow.get('connections') if 'nodes' in workflow else None
+        errors: List[ValidationError] = []
+
+        for node_id, node in nodes.items():
+            if not isinstance(node, dict) or 'class_type' not in node:
+                continue
+            class_type = node['class_type']
+            schema = self.get(class_type)
+            if schema is None:
+                errors.append(ValidationError(
+                    'unknown_node_type', f"Node {node_id} uses unknown node type {class_type}", node_id
+                ))
+                continue
+
+            inputs = dict(node.get('inputs') or {})
+            extra = (connections or {}).get(node_id)
+            if isinstance(extra, dict) and isinstance(extra.get('inputs'), dict):
+                inputs.update(extra['inputs'])
+
+            for name in schema.required:
+                if name not in inputs:
+                    errors.append(ValidationError(
+                        'missing_input', f"Node {node_id} ({class_type}) missing required input: {name}",
+                        node_id, name,
+                    ))
+
+            for name, value in inputs.items():
+                spec = schema.required.get(name) or schema.optional.get(name)
+                if spec is None:
+                    continue
+                if is_link(value):
+                    error = self._check_link(nodes, node_id, class_type, name, spec, value)
+                else:
+                    error = spec.check_value(node_id, class_type, name, value)
+                if error is not None:
+                    errors.append(error)
+        return errors
+
+    def _check_link(self, nodes: Dict[str, Any], node_id: str, class_type: str, name: str,
+                    spec: InputSpec, link: List[Any]) -> Optional[ValidationError]:
+        source_id, index = str(link[0]), link[1]
+        source = nodes.get(source_id)
+        if not isinstance(source, dict):
+            return None  # reported by the graph checks
+        source_schema = self.get(source.get('class_type'))
+        if source_schema is None:
+            return None
+        outputs = source_schema.outputs
+        if not 0 <= index < len(outputs):
+            return ValidationError(
+                'bad_output_index',
+                f"Node {node_id} input '{name}' uses output {index} of node {source_id} "
+                f"({source_schema.class_type}), which has {len(outputs)} outputs",
+                node_id, name,
+            )
+        produced = outputs[index]
+        if spec.type in ('*', produced) or produced == '*' or spec.type == 'COMBO':
+            return None
+        return ValidationError(
+            'link_type_mismatch',
+            f"Node {node_id} ({class_type}) input '{name}' expects {spec.type} but output {index} "
+            f"of node {source_id} ({source_schema.class_type}) is {produced}",
+            node_id, name,
+        )
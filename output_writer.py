@@ -0,0 +1,267 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Dict, Any, Optional, List, Tuple
+
+import tracing
+
+# File encodings: "pretty" is the historical indent=2 layout, about three times slower to serialize than
+# "compact"; JSON text is written as given (gzipped for "gzip")
+ENCODINGS = ('compact', 'pretty', 'gzip')
+
+# Writes handled by the background thread before the directories they touched are fsynced
+MAX_BATCH = 256
+
+
+def encode_json(data: Any, encoding: str) -> str:
+    """Serialize a payload for the given encoding (strings are written verbatim)"""
+    if isinstance(data, str):
+        return data
+    if encoding == 'pretty':
+        return json.dumps(data, indent=2)
+    return json.dumps(data, separators=(',', ':'))
+
+
+class OutputWriteError(OSError):
+    """Raised when workflow files could not be written; carries (path, error) of each"""
+
+    def __init__(self, failures: List[Tuple[str, str]]):
+        super().__init__("; ".join(f"{path}: {error}" for path, error in failures))
+        self.failures = failures
+
+
+class OutputWriter:
+    """
+    Atomic, collision-free writer for workflow JSON files
+
+    write() picks the file name at once and returns it: the requested name,
+    or name_2, name_3, ... if that file exists or is still being written,
+    so saves within the same second never overwrite each other. Each file is
+    written to a temporary name in the same directory and renamed into
+    place, so readers never see a partial file.
+
+    With background=True the disk I/O (compression, write, fsync, rename)
+    runs on one worker thread, which takes whatever writes are queued as a
+    batch and fsyncs every directory the batch touched once, after its
+    renames. Without it each write happens before write() returns. durable
+    turns both fsyncs (file before rename, directory after) on or off.
+
+    Dicts are serialized in the caller's thread, so they may be modified
+    as soon as write() returns; that is why "compact" is the default.
+
+    A failed background write is logged when it happens. wait(path) raises
+    it for that file, and flush() and close() raise every failure not
+    reported yet.
+    """
+
+    def __init__(self, encoding: str = 'compact', background: bool = False, durable: bool = True,
+                 max_pending: int = 10000):
+        """
+        Args:
+            encoding: "compact", "pretty" (indent=2) or "gzip" (compact, .gz suffix)
+            background: Write on a worker thread instead of in write()
+            durable: fsync files and their directories
+            max_pending: Queued writes before write() blocks (background only)
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown output encoding {encoding!r}; expected one of {ENCODINGS}")
+        self.encoding = encoding
+        self.background = background
+        self.durable = durable
+        self.written = 0
+        self.batches = 0
+        # (path, error) of every write that failed
+        self.failed: List[Tuple[str, str]] = []
+        # How many of those flush() has raised already
+        self._reported = 0
+
+        self._lock = threading.Lock()
+        # Notified after every batch, for wait()
+        self._written = threading.Condition(self._lock)
+        self._directories: set = set()
+        # Paths handed out whose files are not on disk yet
+        self._reserved: set = set()
+        self._queue: "queue.Queue[Optional[Tuple[str, str]]]" = queue.Queue(max_pending)
+        self._thread: Optional[threading.Thread] = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name="output-writer", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        """
+        Finish every queued write and stop the worker
+
+        Raises:
+            OutputWriteError: As flush()
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def __enter__(self) -> "OutputWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def flush(self) -> None:
+        """
+        Wait until everything written so far is on disk
+
+        Raises:
+            OutputWriteError: With the writes that failed since the last flush
+        """
+        if self._thread is not None:
+            self._queue.join()
+        with self._lock:
+            failures = self.failed[self._reported:]
+            self._reported = len(self.failed)
+        if failures:
+            raise OutputWriteError(failures)
+
+    def wait(self, path: str) -> None:
+        """
+        Wait until one file returned by write() is on disk
+
+        Raises:
+            OutputWriteError: If that file could not be written
+        """
+        with self._written:
+            while path in self._reserved:
+                self._written.wait()
+            failures = [failure for failure in self.failed if failure[0] == path]
+        if failures:
+            raise OutputWriteError(failures)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"written": self.written, "batches": self.batches, "failed": len(self.failed),
+                    "pending": self._queue.qsize()}
+
+    # -- writing -------------------------------------------------------------
+
+    def _reserve(self, directory: str, name: str, suffix: str) -> str:
+        with self._lock:
+            # Each directory is created once per writer rather than on every save
+            if directory not in self._directories:
+                os.makedirs(directory, exist_ok=True)
+                self._directories.add(directory)
+            path = os.path.join(directory, name + suffix)
+            counter = 1
+            while path in self._reserved or os.path.exists(path):
+                counter += 1
+                path = os.path.join(directory, f"{name}_{counter}{suffix}")
+            self._reserved.add(path)
+            return path
+
+    def write(self, directory: str, name: str, data: Any) -> str:
+        """
+        Save a JSON payload (dict or already serialized string)
+
+        Args:
+            directory: Target directory, created if needed
+            name: File name without extension
+            data: Dict/list to serialize, or JSON text to write verbatim
+
+        Returns:
+            Path the file is (or will be, in background mode) written to
+
+        Raises:
+            OSError: In foreground mode, if the file could not be written
+        """
+        text = encode_json(data, self.encoding)
+        path = self._reserve(directory, name, ".json.gz" if self.encoding == 'gzip' else ".json")
+        if self._thread is None:
+            self._write_batch([(path, text)], raise_errors=True)
+        else:
+            self._queue.put((path, text))
+        return path
+
+    def _encode(self, text: str) -> bytes:
+        data = text.encode('utf-8')
+        # mtime=0 keeps identical payloads byte-identical
+        return gzip.compress(data, compresslevel=6, mtime=0) if self.encoding == 'gzip' else data
+
+    def _write_file(self, path: str, text: str) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(self._encode(text))
+                if self.durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _fsync_directory(directory: str) -> None:
+        """Persist the renames in a directory (not supported on every platform)"""
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _write_batch(self, batch: List[Tuple[str, str]], raise_errors: bool = False) -> None:
+        with tracing.span("write", files=len(batch)):
+            directories = set()
+            written = 0
+            for path, text in batch:
+                try:
+                    self._write_file(path, text)
+                    directories.add(os.path.dirname(path) or ".")
+                    written += 1
+                except Exception as e:
+                    logging.error(f"Error writing {path}: {str(e)}")
+                    with self._lock:
+                        self.failed.append((path, str(e)))
+                        self._reserved.discard(path)
+                        self._written.notify_all()
+                    if raise_errors:
+                        # Raised to the caller, so flush() does not report it again
+                        with self._lock:
+                            self._reported = len(self.failed)
+                        raise
+            if self.durable:
+                for directory in directories:
+                    self._fsync_directory(directory)
+            with self._lock:
+                for path, _ in batch:
+                    self._reserved.discard(path)
+                self.written += written
+                self.batches += 1
+                self._written.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= MAX_BATCH:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write_batch(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            if item is None:
+                self._queue.task_done()
+                return
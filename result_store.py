@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any, Optional, List, Tuple
+
+from workflow_cache import WorkflowCache
+
+
+class ResultStore:
+    """
+    Maps a canonical workflow hash (workflow_format.graph_hash) to the images it produced
+
+    Entries live on disk in the same content-addressed layout as
+    WorkflowCache, with LRU eviction beyond max_entries and optional expiry.
+    A stored result is only handed out while every one of its image files
+    still exists; otherwise the entry is dropped and the workflow runs again.
+
+    The store also tracks the hashes being executed right now (claim and
+    release), so identical workflows submitted meanwhile, through any client
+    sharing the store, wait for that run instead of queueing another.
+    """
+
+    DEFAULT_DIR = ".result_store"
+
+    def __init__(self, store_dir: str = DEFAULT_DIR, max_entries: int = 10000, ttl_seconds: Optional[float] = None):
+        self._entries = WorkflowCache(store_dir, max_entries=max_entries, ttl_seconds=ttl_seconds)
+        # Entries dropped because an image had been deleted or moved
+        self.stale = 0
+        # Graph hash -> future of the run producing it
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a graph hash
+
+        Returns:
+            {"prompt_id", "outputs", "paths"} of the run that produced the
+            images, or None if unknown or any image file is gone
+        """
+        entry_json = self._entries.get(key)
+        if entry_json is None:
+            return None
+        # An entry that does not parse or lacks a field counts as stale too
+        try:
+            entry = json.loads(entry_json)
+            result = {"prompt_id": entry['prompt_id'], "outputs": entry['outputs'], "paths": entry['paths']}
+            fresh = (isinstance(result["paths"], list) and len(result["paths"]) > 0
+                     and all(os.path.isfile(path) for path in result["paths"]))
+        except (ValueError, KeyError, TypeError):
+            fresh = False
+        if not fresh:
+            self._entries.delete(key)
+            self.stale += 1
+            return None
+        return result
+
+    def put(self, key: str, prompt_id: str, outputs: Dict[str, Any], paths: List[str]) -> None:
+        """Remember the image files a run saved (as absolute paths)"""
+        if not paths:
+            return
+        self._entries.put(key, json.dumps({
+            "prompt_id": prompt_id,
+            "outputs": outputs,
+            "paths": [os.path.abspath(path) for path in paths],
+            "created": time.time(),
+        }))
+
+    def claim(self, key: str) -> Tuple[Future, bool]:
+        """
+        Join or start the run producing a graph hash
+
+        Returns:
+            (future, leader): when leader is True the caller must execute the
+            workflow and call release(); otherwise the future resolves to the
+            result of the run already executing
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future, False
+            future = self._in_flight[key] = Future()
+            return future, True
+
+    def release(self, key: str, result: Any) -> None:
+        """End the run claimed for a graph hash and hand its result to everyone waiting"""
+        with self._lock:
+            future = self._in_flight.pop(key)
+        future.set_result(result)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {**self._entries.stats, "stale": self.stale, "in_flight": in_flight}
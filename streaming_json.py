@@ -0,0 +1,354 @@
+import json
+import re
+import time
+from typing import Dict, Any, List, Optional, Callable
+
+from json_handler import JsonHandler
+from workflow_validator import ValidationError
+
+# Characters that change the scanner's state outside and inside strings
+_STRUCTURAL = re.compile(r'[{}\[\]",:]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+# Inside values that are decoded whole, only brackets and strings matter
+_SKIM = re.compile(r'[{}\[\]"]')
+_STRING_REST = re.compile(r'(?:[^"\\]|\\.)*"')
+_DECODER = json.JSONDecoder()
+_UNDECODED = object()
+
+# Errors that make the rest of a generation worthless; anything else is left to auto-repair/refine
+FATAL_CODES = frozenset({'invalid_json', 'not_object', 'bad_structure', 'missing_field'})
+
+# Called with (node_id, node, errors found in that node) as soon as a node's JSON is complete
+NodeCallback = Callable[[str, Any, List[ValidationError]], None]
+
+
+class _Frame:
+    """One open object or array; state is what the scanner expects next inside it"""
+
+    __slots__ = ('kind', 'state', 'key', 'token_start', 'skim')
+
+    def __init__(self, kind: str, state: str, token_start: int, skim: bool = False):
+        self.kind = kind
+        self.state = state
+        self.key: Optional[str] = None
+        # Where the current member's value starts
+        self.token_start = token_start
+        # Part of a value json.loads will check as a whole, so only nesting is tracked
+        self.skim = skim
+
+
+class StreamingWorkflowParser:
+    """
+    Incremental parser for a workflow JSON object arriving in chunks
+
+    feed() scans each chunk once, tracking nesting and string state, and
+    stops at the end of the first complete top-level object, so any text
+    the model writes before or after it is ignored. Every entry of "nodes"
+    is decoded the moment its closing brace arrives and checked on the spot
+    (structure, then inputs against the schema registry or requirement
+    tables). Structural problems are fatal: feed() returns False so the
+    caller can stop the generation instead of paying for the rest of it.
+
+    Top-level values are decoded once each and assembled into .result, so
+    nothing downstream needs to parse the text again.
+    """
+
+    def __init__(self, on_node: Optional[NodeCallback] = None):
+        self.on_node = on_node
+        self.buffer = ""
+        self.result: Dict[str, Any] = {}
+        self.errors: List[ValidationError] = []
+        self.fatal: Optional[ValidationError] = None
+        self.done = False
+        self.node_count = 0
+        # CPU time spent in feed(), as opposed to waiting for chunks
+        self.parse_seconds = 0.0
+        self.started = time.perf_counter()
+        # Seconds from the start of parsing until the first error, if any
+        self.first_error_at: Optional[float] = None
+        self._nodes: Optional[Dict[str, Any]] = None
+        self._stack: List[_Frame] = []
+        self._pos = 0
+        self._root_start: Optional[int] = None
+        self._end: Optional[int] = None
+        self._in_string = False
+        self._string_is_key = False
+        self._string_start = 0
+
+    @property
+    def text(self) -> str:
+        """The JSON object's text (complete once done is True)"""
+        if self._root_start is None:
+            return ""
+        return self.buffer[self._root_start:self._end]
+
+    def _error(self, error: ValidationError) -> None:
+        if self.first_error_at is None:
+            self.first_error_at = time.perf_counter() - self.started
+        self.errors.append(error)
+        if error.code in FATAL_CODES and self.fatal is None:
+            self.fatal = error
+
+    def _syntax_error(self, pos: int, expected: str) -> None:
+        self._error(ValidationError(
+            'invalid_json', f"Invalid JSON format: expected {expected} at char {pos - (self._root_start or 0)}"
+        ))
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Consume the next piece of the response
+
+        Returns:
+            False once a fatal error was found (stop generating), else True
+        """
+        if self.done or self.fatal is not None:
+            return self.fatal is None
+        start = time.perf_counter()
+        self.buffer += chunk
+        self._scan()
+        self.parse_seconds += time.perf_counter() - start
+        return self.fatal is None
+
+    def close(self) -> Dict[str, Any]:
+        """
+        Finish parsing after the last chunk
+
+        Returns:
+            The parsed workflow; check .errors and .fatal before using it
+        """
+        if not self.done and self.fatal is None:
+            self._error(ValidationError(
+                'invalid_json', "Invalid JSON format: response ended before the JSON object was complete"
+            ))
+        return self.result
+
+    # -- scanner -------------------------------------------------------------
+
+    def _scan(self) -> None:
+        buf = self.buffer
+        n = len(buf)
+        pos = self._pos
+        stack = self._stack
+
+        while pos < n and not self.done and self.fatal is None:
+            if self._root_start is None:
+                start = buf.find('{', pos)
+                if start < 0:
+                    pos = n
+                    break
+                self._root_start = start
+                stack.append(_Frame('{', 'key_or_end', start + 1))
+                pos = start + 1
+                continue
+
+            if self._in_string:
+                match = _STRING_SPECIAL.search(buf, pos)
+                if match is None:
+                    pos = n
+                    break
+                i = match.start()
+                if buf[i] == '\\':
+                    if i + 1 >= n:
+                        # Wait for the escaped character
+                        pos = i
+                        break
+                    pos = i + 2
+                    continue
+                self._in_string = False
+                self._end_string(i)
+                pos = i + 1
+                continue
+
+            frame = stack[-1]
+            if frame.skim:
+                pos = self._skim(buf, pos)
+                if pos < 0:
+                    # Wait for the rest of a string
+                    pos = -pos - 1
+                    break
+                continue
+
+            match = _STRUCTURAL.search(buf, pos)
+            end = match.start() if match else n
+            if end > pos and buf[pos:end].strip():
+                # Bare scalar text (number, true, false, null) is only valid as a value
+                if frame.state in ('value', 'value_or_end'):
+                    frame.state = 'scalar'
+                elif frame.state != 'scalar':
+                    self._syntax_error(pos, "',' or a closing bracket")
+                    break
+            if match is None:
+                pos = n
+                break
+            # A value decoded whole returns where it ended
+            pos = self._structural(buf[end], end) or end + 1
+
+        self._pos = pos
+
+    def _skim(self, buf: str, pos: int) -> int:
+        """Advance past the next bracket or string of a skimmed value; returns -pos - 1 to wait for more input"""
+        match = _SKIM.search(buf, pos)
+        if match is None:
+            return len(buf)
+        i = match.start()
+        c = buf[i]
+        if c == '"':
+            rest = _STRING_REST.match(buf, i + 1)
+            return rest.end() if rest is not None else -i - 1
+        stack = self._stack
+        if c in '{[':
+            stack.append(_Frame(c, '', i + 1, True))
+            return i + 1
+        if (c == '}') != (stack[-1].kind == '{'):
+            self._syntax_error(i, "a matching closing bracket")
+            return i + 1
+        stack.pop()
+        parent = stack[-1]
+        if not parent.skim:
+            parent.state = 'after'
+            self._complete(parent, parent.token_start, i + 1)
+        return i + 1
+
+    def _end_string(self, i: int) -> None:
+        frame = self._stack[-1]
+        if self._string_is_key:
+            key = self.buffer[self._string_start + 1:i]
+            frame.key = json.loads(f'"{key}"') if '\\' in key else key
+            frame.state = 'colon'
+        else:
+            frame.state = 'scalar'
+
+    def _structural(self, c: str, i: int) -> Optional[int]:
+        stack = self._stack
+        frame = stack[-1]
+        state = frame.state
+
+        if c == '"':
+            if frame.kind == '{' and state in ('key', 'key_or_end'):
+                self._string_is_key = True
+            elif state in ('value', 'value_or_end'):
+                self._string_is_key = False
+            else:
+                return self._syntax_error(i, "',' or a closing bracket")
+            self._in_string = True
+            self._string_start = i
+        elif c == ':':
+            if frame.kind != '{' or state != 'colon':
+                return self._syntax_error(i, "a value")
+            frame.state = 'value'
+            frame.token_start = i + 1
+        elif c == ',':
+            if state == 'scalar':
+                self._complete(frame, frame.token_start, i)
+            elif state != 'after':
+                return self._syntax_error(i, "a value")
+            frame.state = 'key' if frame.kind == '{' else 'value'
+            frame.token_start = i + 1
+        elif c in '{[':
+            if state not in ('value', 'value_or_end'):
+                return self._syntax_error(i, "',' or a closing bracket")
+            frame.state = 'child'
+            frame.token_start = i
+            nodes = len(stack) == 1 and frame.key == 'nodes'
+            if nodes and c == '{':
+                self._nodes = {}
+            elif not nodes:
+                # A value that has fully arrived is decoded in one go, without scanning it
+                try:
+                    value, end = _DECODER.raw_decode(self.buffer, i)
+                except ValueError:
+                    pass
+                else:
+                    frame.state = 'after'
+                    self._complete(frame, i, end, value)
+                    return end
+            # Only the root and the "nodes" object are scanned in full
+            stack.append(_Frame(c, 'key_or_end' if c == '{' else 'value_or_end', i + 1, not nodes))
+        else:
+            if (c == '}') != (frame.kind == '{'):
+                return self._syntax_error(i, "a matching closing bracket")
+            if state == 'scalar':
+                self._complete(frame, frame.token_start, i)
+            elif state not in ('after', 'key_or_end', 'value_or_end'):
+                return self._syntax_error(i, "a value")
+            stack.pop()
+            if not stack:
+                self.done = True
+                self._end = i + 1
+                return
+            parent = stack[-1]
+            parent.state = 'after'
+            self._complete(parent, parent.token_start, i + 1)
+
+    # -- values --------------------------------------------------------------
+
+    def _complete(self, frame: _Frame, start: int, end: int, value: Any = _UNDECODED) -> None:
+        """A member value of frame spans buffer[start:end]; decode it (unless given) if it is a top-level value or a node"""
+        depth = len(self._stack)
+        if depth == 1:
+            key = frame.key
+            if key == 'nodes':
+                if self._nodes is None:
+                    self._error(ValidationError('bad_structure', "'nodes' must be a dictionary"))
+                    return
+                self.result['nodes'] = self._nodes
+                return
+            try:
+                self.result[key] = json.loads(self.buffer[start:end]) if value is _UNDECODED else value
+            except ValueError as e:
+                self._error(ValidationError('invalid_json', f"Invalid JSON format in '{key}': {str(e)}"))
+        elif depth == 2 and frame.kind == '{' and self._stack[0].key == 'nodes':
+            try:
+                node = json.loads(self.buffer[start:end]) if value is _UNDECODED else value
+            except ValueError as e:
+                self._error(ValidationError('invalid_json', f"Invalid JSON format in node {frame.key}: {str(e)}",
+                                            frame.key))
+                return
+            self._add_node(frame.key, node)
+
+    def _add_node(self, node_id: str, node: Any) -> None:
+        self._nodes[node_id] = node
+        self.node_count += 1
+        errors = self.check_node(node_id, node)
+        for error in errors:
+            self._error(error)
+        if self.on_node is not None:
+            self.on_node(node_id, node, errors)
+
+    @staticmethod
+    def check_node(node_id: str, node: Any) -> List[ValidationError]:
+        """Checks that need nothing but the node itself: structure, then the values it sets"""
+        if not isinstance(node, dict):
+            return [ValidationError('bad_structure', f"Node {node_id} must be an object", node_id)]
+        if 'class_type' not in node:
+            return [ValidationError('missing_field', f"Node {node_id} missing required fields: {{'class_type'}}",
+                                    node_id)]
+        inputs = node.get('inputs', {})
+        if not isinstance(inputs, dict):
+            return [ValidationError('bad_structure', f"Node {node_id} inputs must be an object", node_id)]
+
+        errors: List[ValidationError] = []
+        registry = JsonHandler.schema_registry
+        if registry is not None and node['class_type'] in registry:
+            errors.extend(registry.validate({'nodes': {node_id: node}}))
+        else:
+            checker = JsonHandler.get_validator().checkers.get(node['class_type'])
+            if checker is not None:
+                checker.check(node_id, inputs, errors)
+        # "connections" (later in the stream) may still supply a missing input
+        return [error for error in errors if error.code != 'missing_input']
+
+
+def parse_workflow_stream(chunks, on_node: Optional[NodeCallback] = None) -> StreamingWorkflowParser:
+    """
+    Parse an iterable of text chunks, stopping at the first fatal error
+
+    Returns:
+        The parser; .result holds the workflow, .errors/.fatal what was found
+    """
+    parser = StreamingWorkflowParser(on_node)
+    for chunk in chunks:
+        if not parser.feed(chunk) or parser.done:
+            break
+    parser.close()
+    return parser
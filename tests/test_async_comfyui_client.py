@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+import pytest
+
+from async_comfyui_client import AsyncComfyUIClient
+from mock_comfyui_server import MockComfyUIServer
+
+WORKFLOW = {
+    "1": {"class_type": "EmptyLatentImage", "inputs": {"width": 64, "height": 64, "batch_size": 1}},
+    "2": {"class_type": "SaveImage", "inputs": {"images": ["1", 0]}},
+}
+
+
+@pytest.mark.parametrize("frame", [b"{not json", b"[1, 2]", b'{"type": "executing", "data": "x"}', b'"text"'])
+def test_reader_survives_malformed_frames(tmp_path, frame):
+    async def run(server):
+        async with AsyncComfyUIClient(server.host, server.port) as client:
+            assert await client.execute_workflow(WORKFLOW, str(tmp_path)) is not None
+            for conn in list(server.clients.values()):
+                conn._send_frame(0x1, frame)
+            await asyncio.sleep(0.05)
+            assert not client._reader.done()
+            return await asyncio.wait_for(client.execute_workflow(WORKFLOW, str(tmp_path)), 10)
+
+    with MockComfyUIServer(node_delay=0.001) as server:
+        assert asyncio.run(run(server)) is not None
+
+
+def test_concurrent_connects_share_one_socket(tmp_path):
+    async def run(server):
+        async with AsyncComfyUIClient(server.host, server.port) as client:
+            await client._ensure_ws()
+            connect, connects = client._connect_ws, []
+
+            async def counting_connect():
+                connects.append(1)
+                await connect()
+
+            client._connect_ws = counting_connect
+            await client._ws.close()
+            await asyncio.gather(*(client._ensure_ws() for _ in range(8)))
+            # Give the reader time to notice the closed socket and run its reconnect loop
+            await asyncio.sleep(0.1)
+            return len(connects)
+
+    with MockComfyUIServer() as server:
+        assert asyncio.run(run(server)) == 1
@@ -0,0 +1,33 @@
+import pytest
+
+from auto_repair import coerce_types
+from json_handler import JsonHandler
+from workflow_validator import ValidationError
+
+
+@pytest.fixture(autouse=True)
+def no_registry(monkeypatch):
+    monkeypatch.setattr(JsonHandler, "schema_registry", None)
+
+
+def coerce(seed):
+    workflow = {"nodes": {"3": {"class_type": "KSampler", "inputs": {"seed": seed}}}}
+    changes = coerce_types(workflow, [ValidationError('bad_type', "seed", "3", "seed")])
+    return changes, workflow["nodes"]["3"]["inputs"]["seed"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("20", 20),
+    (" -7 ", -7),
+    ("20.0", 20),
+    ("2e3", 2000),
+    ("18446744073709551615", 18446744073709551615),
+    ("18446744073709551615.0", 18446744073709551615),
+])
+def test_integral_text_coerced_exactly(text, expected):
+    assert coerce(text) == (1, expected)
+
+
+@pytest.mark.parametrize("text", ["20.5", "1e-3", "twenty", "1_000", "1e100"])
+def test_non_integral_text_left_alone(text):
+    assert coerce(text) == (0, text)
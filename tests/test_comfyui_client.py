@@ -0,0 +1,38 @@
+import os
+
+from comfyui_client import ComfyUIClient, local_image_name
+from mock_comfyui_server import MockComfyUIServer
+
+WORKFLOW = {
+    "1": {"class_type": "EmptyLatentImage", "inputs": {"width": 64, "height": 64, "batch_size": 1}},
+    "2": {"class_type": "SaveImage", "inputs": {"images": ["1", 0]}},
+}
+
+
+def test_local_image_name_stays_in_directory():
+    image = {"filename": "ComfyUI_00001_.png", "subfolder": "a/b", "type": "temp"}
+    assert local_image_name("p1", image) == "comfyui_p1_temp_a_b_ComfyUI_00001_.png"
+    assert local_image_name("p1", {"filename": "../x.png", "subfolder": "", "type": "output"}) == "comfyui_p1_.._x.png"
+
+
+def test_same_named_outputs_do_not_collide(tmp_path):
+    outputs = {
+        "9": {"images": [{"filename": "ComfyUI_00001_.png", "subfolder": "", "type": "output"},
+                         {"filename": "ComfyUI_00001_.png", "subfolder": "faces", "type": "output"},
+                         {"filename": "ComfyUI_00001_.png", "subfolder": "", "type": "temp"}]},
+    }
+    with MockComfyUIServer() as server, ComfyUIClient(server.host, server.port) as client:
+        first = client.download_outputs("p1", outputs, str(tmp_path))
+        second = client.download_outputs("p2", outputs, str(tmp_path))
+    paths = first.paths + second.paths
+    assert not first.failed and not second.failed
+    assert len(set(paths)) == 6
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths)
+
+
+def test_websocket_outputs_are_named_by_prompt(tmp_path):
+    with MockComfyUIServer(node_delay=0.001) as server, ComfyUIClient(server.host, server.port) as client:
+        results = [client.execute_workflow(WORKFLOW, output_dir=str(tmp_path), websocket_outputs=True)
+                   for _ in range(2)]
+    names = sorted(os.listdir(tmp_path))
+    assert names == sorted(f"comfyui_{result.prompt_id}_websocket_2_00000.png" for result in results)
@@ -0,0 +1,97 @@
+import queue
+import time
+
+import pytest
+
+from comfyui_client import ComfyUIClient
+from comfyui_session import WebSocketSession, history_events
+from mock_comfyui_server import MockComfyUIServer
+
+WORKFLOW = {
+    "1": {"class_type": "EmptyLatentImage", "inputs": {"width": 64, "height": 64, "batch_size": 1}},
+    "2": {"class_type": "SaveImage", "inputs": {"images": ["1", 0]}},
+}
+
+
+@pytest.fixture
+def server():
+    with MockComfyUIServer(node_delay=0.001) as server:
+        yield server
+
+
+@pytest.fixture
+def session(server):
+    client = ComfyUIClient(server.host, server.port)
+    session = WebSocketSession(client.ws_url, client.client_id, client.base_url, client.get_history,
+                               reconnect_delay=0.05)
+    session.start()
+    yield session
+    session.close()
+    client.close()
+
+
+def wait_finished(session, prompt_id):
+    deadline = time.time() + 10
+    while session.history_fetcher(prompt_id) is None:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    # /history is written before the last WebSocket message is sent
+    time.sleep(0.05)
+
+
+def drain(events):
+    messages = []
+    while True:
+        try:
+            message = events.get(timeout=2)
+        except queue.Empty:
+            return messages
+        messages.append(message)
+        if isinstance(message, dict) and message["type"] == "executing" and message["data"]["node"] is None:
+            return messages
+
+
+def test_events_before_subscribe_are_buffered(server, session):
+    prompt_id = server.submit(WORKFLOW, session.client_id)["prompt_id"]
+    wait_finished(session, prompt_id)
+
+    messages = drain(session.subscribe(prompt_id))
+    types = [message["type"] for message in messages]
+    assert types[0] == "execution_start"
+    assert "executed" in types
+    assert messages[-1]["data"] == {"node": None, "prompt_id": prompt_id}
+
+
+def test_orphan_buffer_keeps_the_newest_prompts(server, session, monkeypatch):
+    monkeypatch.setattr(WebSocketSession, "MAX_ORPHANED_PROMPTS", 2)
+    prompt_ids = [server.submit(WORKFLOW, session.client_id)["prompt_id"] for _ in range(3)]
+    for prompt_id in prompt_ids:
+        wait_finished(session, prompt_id)
+
+    assert session.subscribe(prompt_ids[0]).empty()
+    for prompt_id in prompt_ids[1:]:
+        assert drain(session.subscribe(prompt_id))[-1]["data"]["node"] is None
+
+
+def test_reconnect_resyncs_through_history(server, session):
+    # Events for another client_id never reach this socket, as if sent while disconnected
+    prompt_id = server.submit(WORKFLOW, "someone-else")["prompt_id"]
+    events = session.subscribe(prompt_id)
+    wait_finished(session, prompt_id)
+    assert events.empty()
+
+    server.drop_websockets()
+    messages = drain(events)
+    assert session.reconnects == 1
+    assert messages == history_events(prompt_id, session.history_fetcher(prompt_id))
+    assert [message["type"] for message in messages] == ["executed", "executing"]
+
+
+def test_history_events():
+    assert history_events("p", None) is None
+    assert history_events("p", {"status": {"completed": False}, "outputs": {}}) is None
+    assert history_events("p", {"status": {"status_str": "error"}})[0]["type"] == "execution_error"
+    assert history_events("p", {"outputs": {"9": {"images": []}}}) == [
+        {"type": "executed", "data": {"node": "9", "output": {"images": []}, "prompt_id": "p"}},
+        {"type": "executing", "data": {"node": None, "prompt_id": "p"}},
+    ]
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from comfyui_client import ComfyUIClient
+from json_handler import JsonHandler
+from mock_comfyui_server import MockComfyUIServer, OBJECT_INFO_FIXTURE
+from node_schema import NodeSchemaRegistry
+
+WORKFLOW = {
+    "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "v1-5-pruned-emaonly.safetensors"}},
+    "6": {"class_type": "CLIPTextEncode", "inputs": {"text": "a cat", "clip": ["4", 1]}},
+    "7": {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry", "clip": ["4", 1]}},
+    "5": {"class_type": "EmptyLatentImage", "inputs": {"width": 512, "height": 512, "batch_size": 1}},
+    "3": {"class_type": "KSampler", "inputs": {
+        "seed": 18446744073709551615, "steps": 20, "cfg": 8.0, "sampler_name": "euler", "scheduler": "normal",
+        "denoise": 1.0, "model": ["4", 0], "positive": ["6", 0], "negative": ["7", 0], "latent_image": ["5", 0],
+    }},
+    "8": {"class_type": "VAEDecode", "inputs": {"samples": ["3", 0], "vae": ["4", 2]}},
+    "9": {"class_type": "SaveImage", "inputs": {"images": ["8", 0], "filename_prefix": "ComfyUI"}},
+}
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = NodeSchemaRegistry(str(tmp_path / "object_info.snapshot"))
+    with open(OBJECT_INFO_FIXTURE) as f:
+        registry.load_object_info(json.load(f))
+    yield registry
+    registry.close()
+
+
+def workflow_with(node_id, **inputs):
+    workflow = json.loads(json.dumps(WORKFLOW))
+    workflow[node_id]["inputs"].update(inputs)
+    return workflow
+
+
+def codes(errors):
+    return sorted((error.code, error.node_id, error.input_name) for error in errors)
+
+
+def test_fixture_workflow_is_valid(registry):
+    assert registry.validate(WORKFLOW) == []
+
+
+@pytest.mark.parametrize("node_id, inputs, expected", [
+    ("3", {"steps": "20"}, ("bad_type", "3", "steps")),
+    ("3", {"steps": 0}, ("out_of_range", "3", "steps")),
+    ("3", {"sampler_name": "warp_drive"}, ("bad_enum", "3", "sampler_name")),
+    ("3", {"sampler_name": ["euler", "heun"]}, ("bad_type", "3", "sampler_name")),
+    ("4", {"ckpt_name": {"name": "x"}}, ("bad_type", "4", "ckpt_name")),
+    ("3", {"model": ["4", 5]}, ("bad_output_index", "3", "model")),
+    ("3", {"positive": ["4", 0]}, ("link_type_mismatch", "3", "positive")),
+])
+def test_schema_errors(registry, node_id, inputs, expected):
+    assert codes(registry.validate(workflow_with(node_id, **inputs))) == [expected]
+
+
+def test_missing_input_and_unknown_node(registry):
+    workflow = json.loads(json.dumps(WORKFLOW))
+    del workflow["3"]["inputs"]["steps"]
+    workflow["10"] = {"class_type": "NoSuchNode", "inputs": {}}
+    assert codes(registry.validate(workflow)) == [("missing_input", "3", "steps"),
+                                                  ("unknown_node_type", "10", None)]
+
+
+def test_snapshot_round_trip(registry):
+    reloaded = NodeSchemaRegistry(registry.snapshot_path)
+    try:
+        assert reloaded.class_types == registry.class_types
+        assert reloaded.sha256 == registry.sha256
+        steps = reloaded.get("KSampler").required["steps"]
+        assert (steps.type, steps.min, steps.max) == ("INT", 1, 10000)
+        assert "euler" in reloaded.get("KSampler").required["sampler_name"].choices
+        assert reloaded.get("CheckpointLoaderSimple").outputs == ["MODEL", "CLIP", "VAE"]
+        assert reloaded.validate(WORKFLOW) == []
+    finally:
+        reloaded.close()
+
+
+def test_refresh_revalidates_with_etag(tmp_path):
+    registry = NodeSchemaRegistry(str(tmp_path / "object_info.snapshot"))
+    with MockComfyUIServer() as server, ComfyUIClient(server.host, server.port) as client:
+        assert registry.refresh(client) is True
+        assert registry.etag == server.object_info_etag
+        assert len(registry) == len(json.loads(server.object_info))
+
+        status, _, body = client.get_object_info(registry.etag)
+        assert (status, body) == (304, None)
+        assert registry.refresh(client) is False
+        assert registry.refresh(client, force=True) is True
+    registry.close()
+
+
+def test_collect_errors_reports_unhashable_combo(registry, monkeypatch):
+    monkeypatch.setattr(JsonHandler, "schema_registry", registry)
+    errors = JsonHandler.collect_errors(workflow_with("4", ckpt_name=["x", "y"]))
+    assert ("bad_type", "4", "ckpt_name") in codes(errors)
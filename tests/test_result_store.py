@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from result_store import ResultStore
+from workflow_cache import WorkflowCache
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"png")
+    return str(path)
+
+
+def test_round_trip_and_deleted_image(tmp_path, image):
+    store = ResultStore(str(tmp_path / "store"))
+    store.put("k", "p1", {"9": {"images": []}}, [image])
+    assert store.get("k") == {"prompt_id": "p1", "outputs": {"9": {"images": []}}, "paths": [image]}
+
+    (tmp_path / "image.png").unlink()
+    assert store.get("k") is None
+    assert store.stale == 1
+    assert store.get("k") is None
+    assert store.stale == 1
+
+
+@pytest.mark.parametrize("entry", [
+    "{not json",
+    json.dumps([1, 2]),
+    json.dumps({"outputs": {}, "paths": ["IMAGE"]}),
+    json.dumps({"prompt_id": "p1", "paths": ["IMAGE"]}),
+    json.dumps({"prompt_id": "p1", "outputs": {}}),
+    json.dumps({"prompt_id": "p1", "outputs": {}, "paths": "IMAGE"}),
+    json.dumps({"prompt_id": "p1", "outputs": {}, "paths": [7]}),
+])
+def test_malformed_entries_are_stale(tmp_path, image, entry):
+    store_dir = str(tmp_path / "store")
+    WorkflowCache(store_dir).put("k", entry.replace("IMAGE", image))
+    store = ResultStore(store_dir)
+    assert store.get("k") is None
+    assert store.stale == 1
+    assert store.stats["entries"] == 0
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from streaming_json import StreamingWorkflowParser, parse_workflow_stream
+from workflow_templates import WorkflowTemplates
+
+TEMPLATE = WorkflowTemplates.build("an image of a lighthouse at dusk, then upscale it")
+TRICKY = {
+    "nodes": {
+        "1": {"class_type": "Custom", "inputs": {
+            "text": "braces } { ] [ , : and \"quotes\" \\ back\\slash é☃ 😀",
+            "empty": "", "list": [[1, [2, {}]], [], {"a": [None, True, False]}],
+            "seed": 18446744073709551615, "cfg": -7.5e-3,
+        }},
+        "node \"2\"": {"class_type": "Other", "inputs": {}},
+    },
+    "connections": {},
+    "meta": {"nested": {"deep": [1, 2, {"x": "}"}]}},
+    "version": 0.4,
+}
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("workflow", [TEMPLATE, TRICKY], ids=["template", "tricky"])
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+def test_chunked_parse_matches_json_loads(workflow, indent, size):
+    text = json.dumps(workflow, indent=indent, ensure_ascii=size % 2 == 0)
+    seen = []
+    parser = parse_workflow_stream(chunked(f"Here is the workflow:\n```json\n{text}\n```\nDone {{", size),
+                                   on_node=lambda node_id, node, errors: seen.append(node_id))
+    assert parser.done
+    assert parser.errors == []
+    assert parser.result == json.loads(text)
+    assert parser.text == text
+    assert seen == list(workflow["nodes"])
+
+
+@pytest.mark.parametrize("text", [
+    '{"nodes": {"1": {"class_type": "A", "inputs": {}}} "connections": {}}',
+    '{"nodes": {"1": {"class_type": "A", "inputs": {}},}}',
+    '{"nodes": {"1": {"class_type": "A", "inputs": {}}], "connections": {}}',
+    '{"nodes" {}}',
+    '{"a": 1 2}',
+    '{"a": tru}',
+])
+def test_invalid_json_is_fatal(text):
+    for size in (1, 5, len(text)):
+        parser = parse_workflow_stream(chunked(text, size))
+        assert parser.fatal is not None and parser.fatal.code == 'invalid_json'
+        with pytest.raises(ValueError):
+            json.loads(text)
+
+
+def test_truncated_response_is_reported_on_close():
+    text = json.dumps(TEMPLATE)
+    parser = StreamingWorkflowParser()
+    assert parser.feed(text[:len(text) // 2])
+    parser.close()
+    assert not parser.done
+    assert parser.fatal.code == 'invalid_json'
+
+
+def test_bad_node_stops_the_stream_early():
+    text = json.dumps({"nodes": {"1": ["not", "a", "node"], **TEMPLATE["nodes"]}, "connections": {}})
+    parser = StreamingWorkflowParser()
+    fed = 0
+    for chunk in chunked(text, 8):
+        fed += len(chunk)
+        if not parser.feed(chunk):
+            break
+    assert parser.fatal.code == 'bad_structure'
+    assert fed < len(text) // 4
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+import workflow_cache
+from claude_client import ClaudeClient
+from mock_anthropic_server import MockAnthropicServer
+from workflow_cache import WorkflowCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(workflow_cache, "time", clock)
+    return clock
+
+
+def test_key_ignores_case_and_whitespace_only():
+    key = WorkflowCache.make_key("An image of  a cat", "model", "template")
+    assert key == WorkflowCache.make_key("  an IMAGE of a cat\n", "model", "template")
+    assert key != WorkflowCache.make_key("an image of a dog", "model", "template")
+    assert key != WorkflowCache.make_key("an image of a cat", "other-model", "template")
+    assert key != WorkflowCache.make_key("an image of a cat", "model", "edited template")
+
+
+def test_entries_expire_relative_to_creation(tmp_path, clock):
+    cache = WorkflowCache(str(tmp_path), ttl_seconds=10)
+    cache.put("aa11", '{"a": 1}')
+    clock.now += 6
+    assert cache.get("aa11") == '{"a": 1}'
+    # Reading does not extend the lifetime
+    clock.now += 6
+    assert cache.get("aa11") is None
+    assert not os.path.exists(os.path.join(str(tmp_path), "aa", "aa11.json"))
+    assert cache.stats == {"hits": 1, "misses": 1, "evictions": 1, "entries": 0}
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    cache = WorkflowCache(str(tmp_path), max_entries=2)
+    for key in ("aa11", "bb22"):
+        cache.put(key, key)
+        clock.now += 1
+    assert cache.get("aa11") == "aa11"
+    clock.now += 1
+    cache.put("cc33", "cc33")
+
+    assert cache.get("bb22") is None
+    assert (cache.get("aa11"), cache.get("cc33")) == ("aa11", "cc33")
+    assert cache.stats["evictions"] == 1
+    # A new instance rebuilds its index from the files left on disk
+    assert WorkflowCache(str(tmp_path)).stats["entries"] == 2
+
+
+def test_use_cache_false_bypasses_lookup_and_store(tmp_path):
+    cache = WorkflowCache(str(tmp_path))
+    with MockAnthropicServer(latency=0) as server:
+        client = ClaudeClient("test-key", cache=cache, use_templates=False, base_url=server.base_url)
+        first = client.generate_workflow("a workflow that does something")
+        assert client.generate_workflow("A workflow that does  something") == first
+        assert server.accepted == 1
+
+        assert client.generate_workflow("a workflow that does something", use_cache=False) == first
+        assert client.generate_workflow("a workflow that does something else", use_cache=False) == first
+        assert server.accepted == 3
+    assert cache.stats == {"hits": 1, "misses": 1, "evictions": 0, "entries": 1}
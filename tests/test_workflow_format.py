@@ -0,0 +1,100 @@
+import copy
+import json
+
+import pytest
+
+from workflow_format import canonical_prompt, from_api_prompt, graph_hash, is_api_prompt, to_api_prompt
+
+PROMPT = {
+    "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "v1-5-pruned-emaonly.safetensors"}},
+    "6": {"class_type": "CLIPTextEncode", "inputs": {"text": "a cat", "clip": ["4", 1]}},
+    "7": {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry", "clip": ["4", 1]}},
+    "5": {"class_type": "EmptyLatentImage", "inputs": {"width": 512, "height": 512, "batch_size": 1}},
+    "3": {"class_type": "KSampler", "inputs": {
+        "seed": 18446744073709551615, "steps": 20, "cfg": 8.0, "sampler_name": "euler", "scheduler": "normal",
+        "denoise": 1.0, "model": ["4", 0], "positive": ["6", 0], "negative": ["7", 0], "latent_image": ["5", 0],
+    }},
+    "8": {"class_type": "VAEDecode", "inputs": {"samples": ["3", 0], "vae": ["4", 2]}},
+    "9": {"class_type": "SaveImage", "inputs": {"images": ["8", 0], "filename_prefix": "ComfyUI"}},
+}
+
+
+def relabelled(prompt, offset):
+    """Same graph with every node ID shifted and the node order reversed"""
+    new_id = {node_id: str(int(node_id) + offset) for node_id in prompt}
+    return {
+        new_id[node_id]: {"class_type": node["class_type"], "inputs": {
+            name: [new_id[value[0]], value[1]] if isinstance(value, list) else value
+            for name, value in node["inputs"].items()
+        }}
+        for node_id, node in reversed(list(prompt.items()))
+    }
+
+
+def test_nodes_connections_workflow_is_flattened():
+    workflow = {
+        "nodes": {
+            4: {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "x.safetensors"}, "pos": [0, 0]},
+            "8": {"class_type": "VAEDecode", "inputs": {"samples": [3, 0]}, "_meta": {"title": "Decode"}},
+        },
+        "connections": {"8": {"inputs": {"vae": [4, 2], "samples": ["4", 0]}}},
+    }
+    original = copy.deepcopy(workflow)
+    assert to_api_prompt(workflow) == {
+        "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "x.safetensors"}},
+        "8": {"class_type": "VAEDecode", "inputs": {"samples": ["4", 0], "vae": ["4", 2]},
+              "_meta": {"title": "Decode"}},
+    }
+    assert workflow == original
+
+
+def test_api_prompt_round_trip():
+    assert is_api_prompt(PROMPT)
+    assert to_api_prompt(PROMPT) == PROMPT
+    assert all(to_api_prompt(PROMPT)[node_id] is node for node_id, node in PROMPT.items())
+    wrapped = from_api_prompt(PROMPT)
+    assert not is_api_prompt(wrapped)
+    assert to_api_prompt(wrapped) == PROMPT
+    assert to_api_prompt(json.loads(json.dumps(wrapped))) == PROMPT
+
+
+def test_canonical_prompt_ignores_ids_order_and_titles():
+    canonical = canonical_prompt(PROMPT)
+    assert sorted(canonical) == [str(i) for i in range(len(PROMPT))]
+    assert canonical_prompt(relabelled(PROMPT, 100)) == canonical
+    assert canonical_prompt(from_api_prompt(relabelled(PROMPT, 7))) == canonical
+    titled = {**PROMPT, "9": {**PROMPT["9"], "_meta": {"title": "Save"}}}
+    assert graph_hash(titled) == graph_hash(PROMPT)
+
+    # The canonical form is itself a valid prompt describing the same graph
+    assert canonical_prompt(canonical) == canonical
+    assert graph_hash(canonical) == graph_hash(PROMPT)
+
+
+@pytest.mark.parametrize("node_id, name, value", [
+    ("6", "text", "a dog"),
+    ("3", "seed", 18446744073709551614),
+    ("3", "positive", ["7", 0]),
+    ("4", "ckpt_name", "other.safetensors"),
+])
+def test_graph_hash_changes_with_the_graph(node_id, name, value):
+    changed = copy.deepcopy(PROMPT)
+    changed[node_id]["inputs"][name] = value
+    assert graph_hash(changed) != graph_hash(PROMPT)
+
+
+def test_canonical_prompt_terminates_on_cycles():
+    cyclic = {"1": {"class_type": "A", "inputs": {"x": ["2", 0]}}, "2": {"class_type": "B", "inputs": {"y": ["1", 0]}}}
+    assert len(canonical_prompt(cyclic)) == 2
+
+
+@pytest.mark.parametrize("workflow", [
+    [],
+    {"nodes": []},
+    {"1": {"inputs": {}}},
+    {"nodes": {"1": {"class_type": "A", "inputs": {}}}, "connections": {"2": {"inputs": {}}}},
+    {"nodes": {"1": {"class_type": "A", "inputs": {}}}, "connections": [["1", 0]]},
+])
+def test_invalid_workflows_raise(workflow):
+    with pytest.raises(ValueError):
+        to_api_prompt(workflow)
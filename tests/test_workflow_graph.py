@@ -0,0 +1,76 @@
+import pytest
+
+from workflow_graph import WorkflowGraph
+
+NODES = {
+    "4": {"class_type": "CheckpointLoaderSimple", "inputs": {}},
+    "5": {"class_type": "EmptyLatentImage", "inputs": {}},
+    "3": {"class_type": "KSampler", "inputs": {"model": ["4", 0], "latent_image": ["5", 0]}},
+    "8": {"class_type": "VAEDecode", "inputs": {"samples": ["3", 0], "vae": ["4", 2]}},
+    "9": {"class_type": "SaveImage", "inputs": {"images": ["8", 0]}},
+}
+
+
+def graph_with(connections=None, **inputs):
+    nodes = {node_id: {**node, "inputs": dict(node["inputs"])} for node_id, node in NODES.items()}
+    for node_id, extra in inputs.items():
+        nodes[node_id.lstrip("n")]["inputs"].update(extra)
+    return WorkflowGraph(nodes, connections)
+
+
+def error_codes(graph):
+    return [(error.code, error.node_id, error.input_name) for error in graph.errors()]
+
+
+def test_valid_graph():
+    graph = graph_with()
+    assert error_codes(graph) == []
+    order = graph.topological_order()
+    assert order.index("4") < order.index("3") < order.index("8") < order.index("9")
+
+
+@pytest.mark.parametrize("inputs, connections, cycle", [
+    ({"n3": {"positive": ["8", 0]}}, None, ["3", "8", "3"]),
+    ({"n8": {"vae": ["8", 0]}}, None, ["8", "8"]),
+    ({}, {"5": {"inputs": {"samples": ["8", 0]}}}, ["5", "3", "8", "5"]),
+])
+def test_cycles_are_reported(inputs, connections, cycle):
+    graph = graph_with(connections, **inputs)
+    assert graph.topological_order() is None
+    found = graph.find_cycle()
+    assert found[0] == found[-1]
+    assert sorted(found[:-1]) == sorted(cycle[:-1])
+    assert [code for code, _, _ in error_codes(graph)] == ["cycle"]
+
+
+def test_long_chain_does_not_recurse():
+    nodes = {"0": {"class_type": "EmptyLatentImage", "inputs": {}}}
+    for i in range(1, 5000):
+        nodes[str(i)] = {"class_type": "LatentUpscaleBy", "inputs": {"samples": [str(i - 1), 0]}}
+    graph = WorkflowGraph(nodes)
+    assert graph.find_cycle() is None
+    assert len(graph.topological_order()) == 5000
+
+
+@pytest.mark.parametrize("inputs, connections, expected", [
+    ({"n8": {"samples": ["42", 0]}}, None, [("unknown_source", "8", "samples")]),
+    ({"n8": {"samples": [42, 0]}}, None, [("unknown_source", "8", "samples")]),
+    ({}, {"9": {"inputs": {"images": ["7", 0]}}}, [("unknown_source", "9", "images")]),
+    ({"n8": {"vae": ["4", 3]}}, None, [("bad_output_index", "8", "vae")]),
+    ({"n8": {"vae": ["4", -1]}}, None, [("bad_output_index", "8", "vae")]),
+])
+def test_dangling_links_are_reported(inputs, connections, expected):
+    graph = graph_with(connections, **inputs)
+    assert error_codes(graph) == expected
+    # A link to a missing node adds no edge, so the rest of the graph still sorts
+    assert graph.topological_order() is not None
+
+
+def test_dead_nodes_and_missing_output():
+    nodes = dict(NODES, **{"7": {"class_type": "CLIPTextEncode", "inputs": {"clip": ["4", 1]}}})
+    graph = WorkflowGraph(nodes)
+    assert graph.dead_nodes() == ["7"]
+    assert "7" not in graph.pruned(nodes)
+
+    del nodes["9"]
+    assert [code for code, _, _ in error_codes(WorkflowGraph(nodes))] == ["no_output"]
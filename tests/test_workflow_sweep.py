@@ -0,0 +1,48 @@
+import pytest
+
+from json_handler import JsonHandler
+from workflow_sweep import ParameterSweep
+
+WORKFLOW = {
+    "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "sd15.safetensors"}},
+    "2": {"class_type": "CLIPTextEncode", "inputs": {"text": "a cat", "clip": ["1", 1]}},
+    "3": {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry", "clip": ["1", 1]}},
+    "4": {"class_type": "EmptyLatentImage", "inputs": {"width": 512, "height": 512, "batch_size": 1}},
+    "5": {"class_type": "KSampler", "inputs": {
+        "seed": 1, "steps": 20, "cfg": 7.0, "sampler_name": "euler", "scheduler": "normal", "denoise": 1.0,
+        "model": ["1", 0], "positive": ["2", 0], "negative": ["3", 0], "latent_image": ["4", 0],
+    }},
+    "6": {"class_type": "VAEDecode", "inputs": {"samples": ["5", 0], "vae": ["1", 2]}},
+    "7": {"class_type": "SaveImage", "inputs": {"images": ["6", 0], "filename_prefix": "sweep"}},
+}
+
+
+@pytest.fixture
+def sweep(monkeypatch):
+    # Requirement tables only, as when no ComfyUI schema is loaded
+    monkeypatch.setattr(JsonHandler, "schema_registry", None)
+    return ParameterSweep(WORKFLOW)
+
+
+def codes(variant):
+    return [(error.code, error.input_name) for error in variant.errors]
+
+
+def test_valid_overrides(sweep):
+    variant = sweep.variant({"KSampler.seed": 42, "positive.text": "a dog", "4.width": 768,
+                             "SaveImage.filename_prefix": "run"})
+    assert variant.valid
+    assert variant.prompt["5"]["inputs"]["seed"] == 42
+    assert sweep.base["5"]["inputs"]["seed"] == 1
+
+
+def test_misspelled_input_rejected(sweep):
+    assert codes(sweep.variant({"KSampler.steps_": 20})) == [("unknown_input", "steps_")]
+    # EmptyLatentImage has no requirement table entry
+    assert codes(sweep.variant({"4.widht": 768})) == [("unknown_input", "widht")]
+
+
+def test_wrong_type_rejected(sweep):
+    assert codes(sweep.variant({"KSampler.steps": "twenty"})) == [("bad_type", "steps")]
+    assert codes(sweep.variant({"4.width": "768"})) == [("bad_type", "width")]
+    assert codes(sweep.variant({"4.batch_size": True})) == [("bad_type", "batch_size")]
@@ -0,0 +1,85 @@
+import pytest
+
+from workflow_templates import WorkflowTemplates
+
+
+def test_plain_description():
+    params = WorkflowTemplates.match("Create an image of a cat")
+    assert params["positive"] == "a cat"
+    assert params["negative"] == WorkflowTemplates.DEFAULT_NEGATIVE
+    assert (params["width"], params["height"]) == (512, 512)
+    assert params["upscale"] is None
+
+
+@pytest.mark.parametrize("description, positive, negative, upscale", [
+    ("Generate an image of a quiet harbor at dawn without people and then upscale 2x",
+     "a quiet harbor at dawn", "people", {"scale_by": 2.0}),
+    ("Create a picture of a cat with no people then upscale it", "a cat", "people", {"scale_by": 2.0}),
+    ("an image of a forest at night with no people and scale it to 1024x1024",
+     "a forest at night", "people", {"width": 1024, "height": 1024}),
+    ("Make a 768x512 image of a castle on a hill, no fog", "a castle on a hill", "fog", None),
+])
+def test_negative_clause_and_next_step_split(description, positive, negative, upscale):
+    params = WorkflowTemplates.match(description)
+    assert params["positive"] == positive
+    assert params["negative"] == negative
+    assert params["upscale"] == upscale
+
+
+@pytest.mark.parametrize("description, positive, negative", [
+    ("an image of a red fox in snow without people 1024x768", "a red fox in snow", "people"),
+    ("an image of a lighthouse at 1024x768 and then upscale 2x", "a lighthouse",
+     WorkflowTemplates.DEFAULT_NEGATIVE),
+])
+def test_size_not_part_of_prompts(description, positive, negative):
+    params = WorkflowTemplates.match(description)
+    assert params["positive"] == positive
+    assert params["negative"] == negative
+    assert (params["width"], params["height"]) == (1024, 768)
+
+
+def test_words_starting_with_no_are_not_negatives():
+    params = WorkflowTemplates.match("an image of a piano in a nook")
+    assert params["positive"] == "a piano in a nook"
+    assert params["negative"] == WorkflowTemplates.DEFAULT_NEGATIVE
+
+
+@pytest.mark.parametrize("description", [
+    "an image of a dragon with shiny scales",
+    "an image of a large-scale battle",
+    "an image of an enlarged heart",
+])
+def test_scale_nouns_are_not_an_upscale_step(description):
+    params = WorkflowTemplates.match(description)
+    assert params["positive"] == description[len("an image of "):]
+    assert params["upscale"] is None
+
+
+@pytest.mark.parametrize("description, positive, upscale", [
+    ("an image of a cat scaled up by 3", "a cat", {"scale_by": 3.0}),
+    ("an image of a cat lit by 2 lamps, then upscale it", "a cat lit by 2 lamps", {"scale_by": 2.0}),
+    ("a 768x512 image of a cat and scale it to 1536", "a cat", {"width": 1536, "height": 1024}),
+    ("an image of a cat and resize the image to 1024x1024", "a cat", {"width": 1024, "height": 1024}),
+])
+def test_upscale_needs_a_target_factor_or_size(description, positive, upscale):
+    params = WorkflowTemplates.match(description)
+    assert params["positive"] == positive
+    assert params["upscale"] == upscale
+
+
+@pytest.mark.parametrize("description, positive, negative", [
+    ("a picture of a man holding a sign that says no parking", "a man holding a sign that says no parking",
+     WorkflowTemplates.DEFAULT_NEGATIVE),
+    ("a picture of a cat avoiding water", "a cat avoiding water", WorkflowTemplates.DEFAULT_NEGATIVE),
+    ("a picture of a cat and no dogs", "a cat", "dogs"),
+    ("an image of a cat. No dogs, then upscale it", "a cat", "dogs"),
+])
+def test_negative_cues_start_a_clause(description, positive, negative):
+    params = WorkflowTemplates.match(description)
+    assert params["positive"] == positive
+    assert params["negative"] == negative
+
+
+def test_unsupported_features_fall_back():
+    assert WorkflowTemplates.match("inpaint the sky of an image of a beach") is None
+    assert WorkflowTemplates.match("a workflow that loads a checkpoint") is None
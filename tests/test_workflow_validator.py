@@ -0,0 +1,28 @@
+import pytest
+
+from json_handler import JsonHandler, WorkflowValidationError
+from workflow_validator import WorkflowValidator
+
+NODES = {
+    "1": {"class_type": "CheckpointLoaderSimple", "inputs": {}},
+    "2": {"class_type": "VAEDecode", "inputs": {}},
+}
+
+
+@pytest.mark.parametrize("connections, expected", [
+    ({"2": {"inputs": {"vae": ["1", 2]}}}, []),
+    ({"9": {"inputs": {"vae": ["1", 2]}}}, [("unknown_target", "9", None)]),
+    ({"2": ["1", 2]}, [("bad_connection", "2", None)]),
+    ({"2": {"inputs": {"vae": ["1"]}}}, [("bad_connection", "2", "vae")]),
+])
+def test_check_connections(connections, expected):
+    errors = []
+    WorkflowValidator.check_connections(NODES, connections, errors)
+    assert [(error.code, error.node_id, error.input_name) for error in errors] == expected
+
+
+def test_validate_connections_raises_with_every_error():
+    connections = {"9": {"inputs": {}}, "2": {"inputs": {"vae": "1"}}}
+    with pytest.raises(WorkflowValidationError) as raised:
+        JsonHandler.validate_connections(NODES, connections)
+    assert [error.code for error in raised.value.errors] == ["unknown_target", "bad_connection"]
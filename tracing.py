@@ -0,0 +1,186 @@
+import contextvars
+import json
+import logging
+import math
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+# Job the current thread or task is working on; spans are tagged with it
+_job: contextvars.ContextVar = contextvars.ContextVar('trace_job', default=None)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty list, fraction in (0, 1]"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Tracer:
+    """
+    Collects span durations and writes them to a JSONL trace file
+
+    Every span becomes one line: {"job", "span", "start", "duration", ...attrs},
+    with start in seconds since the tracer was created. Durations are also
+    kept in memory per span name for summary(). Safe to use from many
+    threads.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.durations: Dict[str, List[float]] = {}
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+
+    def record(self, name: str, start: float, duration: float, attrs: Optional[Dict[str, Any]] = None) -> None:
+        """Record a finished span; start is a time.perf_counter() value"""
+        with self._lock:
+            self.durations.setdefault(name, []).append(duration)
+            if self._file is not None:
+                record = {"job": _job.get(), "span": name, "start": round(start - self._origin, 6),
+                          "duration": round(duration, 6)}
+                if attrs:
+                    record.update(attrs)
+                self._file.write(json.dumps(record, default=str) + "\n")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, total and p50/p95/p99 seconds per span name"""
+        with self._lock:
+            durations = {name: list(values) for name, values in self.durations.items()}
+        return {
+            name: {
+                "count": len(values),
+                "total": round(sum(values), 6),
+                "p50": round(percentile(values, 0.50), 6),
+                "p95": round(percentile(values, 0.95), 6),
+                "p99": round(percentile(values, 0.99), 6),
+            }
+            for name, values in durations.items()
+        }
+
+    def close(self) -> Dict[str, Dict[str, float]]:
+        """Append the summary to the trace file and close it; returns the summary"""
+        summary = self.summary()
+        with self._lock:
+            if self._file is not None:
+                self._file.write(json.dumps({"summary": summary}) + "\n")
+                self._file.close()
+                self._file = None
+        return summary
+
+
+class _Span:
+    """Times a with-block and records it on exit"""
+
+    __slots__ = ('tracer', 'name', 'attrs', 'start')
+
+    def __init__(self, tracer: Tracer, name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs: Any) -> None:
+        """Attach attributes known only inside the block (e.g. token counts)"""
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.start, time.perf_counter() - self.start, self.attrs)
+
+
+class _NullSpan:
+    """Stand-in while tracing is off: one shared instance, nothing recorded"""
+
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+_tracer: Optional[Tracer] = None
+
+
+def enable(path: Optional[str] = None) -> Tracer:
+    """Start tracing to a JSONL file (or in memory only if path is None)"""
+    global _tracer
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def disable() -> Optional[Dict[str, Dict[str, float]]]:
+    """Stop tracing; returns the summary, or None if tracing was off"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer.close() if tracer is not None else None
+
+
+def current() -> Optional[Tracer]:
+    return _tracer
+
+
+def span(name: str, **attrs: Any):
+    """
+    Time a block as a span of the current job
+
+    Example:
+        with tracing.span("refine", round=2) as s:
+            ...
+            s.set(tokens=1234)
+
+    While tracing is off this returns a shared no-op object, so an
+    instrumented call costs one global lookup.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return _Span(tracer, name, attrs)
+
+
+def record(name: str, duration: float, **attrs: Any) -> None:
+    """Record a duration measured elsewhere (e.g. summed over stream chunks) as a span ending now"""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.record(name, time.perf_counter() - duration, duration, attrs)
+
+
+class _Job:
+    __slots__ = ('job_id', '_token')
+
+    def __init__(self, job_id: Any):
+        self.job_id = job_id
+
+    def __enter__(self) -> "_Job":
+        self._token = _job.set(self.job_id)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        _job.reset(self._token)
+
+
+def job(job_id: Any) -> _Job:
+    """Tag every span recorded inside the with-block (same thread or task) with a job ID"""
+    return _Job(job_id)
+
+
+def log_summary(summary: Optional[Dict[str, Dict[str, float]]]) -> None:
+    """Log a summary() table at INFO level"""
+    if not summary:
+        return
+    lines = [f"{'span':>10} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'total s':>9}"]
+    for name, stats in summary.items():
+        lines.append(f"{name:>10} {stats['count']:>6} {stats['p50'] * 1000:>9.1f} {stats['p95'] * 1000:>9.1f} "
+                     f"{stats['p99'] * 1000:>9.1f} {stats['total']:>9.2f}")
+    logging.info("Trace summary:\n" + "\n".join(lines))
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class WorkflowCache:
+    """
+    Content-addressed on-disk cache of generated workflow JSON
+
+    Entries are keyed by a SHA-256 over the normalized description, the model
+    name and a fingerprint of the prompt template, so changing either the model
+    or the prompt invalidates old entries automatically. Each entry is one file;
+    an in-memory index of last-use times drives LRU eviction beyond max_entries
+    and expiry after ttl_seconds.
+    """
+
+    def __init__(self, cache_dir: str = ".workflow_cache", max_entries: int = 10000,
+                 ttl_seconds: Optional[float] = None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> (created, last used)
+        self._index: Dict[str, Tuple[float, float]] = {}
+        self._load_index()
+
+    @staticmethod
+    def normalize_description(description: str) -> str:
+        """Case- and whitespace-insensitive form of a description"""
+        return " ".join(description.lower().split())
+
+    @classmethod
+    def make_key(cls, description: str, model: str, template: str) -> str:
+        """
+        Build the cache key for a generation request
+
+        Args:
+            description: User's workflow description
+            model: Model name the workflow is generated with
+            template: Prompt template text (or a fingerprint of it)
+
+        Returns:
+            Hex digest identifying the request
+        """
+        h = hashlib.sha256()
+        for part in (cls.normalize_description(description), model, template):
+            h.update(part.encode('utf-8'))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_index(self) -> None:
+        if not os.path.isdir(self.cache_dir):
+            return
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    mtime = os.path.getmtime(os.path.join(root, name))
+                    self._index[name[:-5]] = (mtime, mtime)
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def _remove(self, key: str) -> None:
+        self._index.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached workflow JSON for key, or None on a miss"""
+        with self._lock:
+            stamp = self._index.get(key)
+            if stamp is None or self._expired(stamp[0]):
+                if stamp is not None:
+                    self._remove(key)
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), 'r') as f:
+                    workflow_json = f.read()
+            except OSError:
+                self._index.pop(key, None)
+                self.misses += 1
+                return None
+            # Refresh last-use time for LRU eviction; TTL stays relative to creation
+            self._index[key] = (stamp[0], time.time())
+            self.hits += 1
+            return workflow_json
+
+    def put(self, key: str, workflow_json: str) -> None:
+        """Store workflow JSON under key, evicting the least recently used entries if full"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(workflow_json)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            now = time.time()
+            self._index[key] = (now, now)
+            while len(self._index) > self.max_entries:
+                oldest = min(self._index, key=lambda k: self._index[k][1])
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        """Remove one entry, if present"""
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._index),
+        }
@@ -0,0 +1,143 @@
+import hashlib
+import json
+from typing import Dict, Any, List
+
+# Node fields ComfyUI's /prompt endpoint reads; anything else is dropped on conversion
+_API_NODE_FIELDS = ('class_type', 'inputs', '_meta')
+
+
+def is_api_prompt(workflow: Any) -> bool:
+    """True for the flat {node_id: {class_type, inputs}} map ComfyUI's /prompt expects"""
+    return (isinstance(workflow, dict) and 'nodes' not in workflow and bool(workflow)
+            and all(isinstance(node, dict) and 'class_type' in node for node in workflow.values()))
+
+
+def _api_link(value: Any) -> Any:
+    """Return value with a [4, 1] style link's source ID as a string; other values unchanged"""
+    if (isinstance(value, list) and len(value) == 2 and isinstance(value[0], int)
+            and not isinstance(value[0], bool) and isinstance(value[1], int)):
+        return [str(value[0]), value[1]]
+    return value
+
+
+def _api_node(node: Dict[str, Any], extra_inputs: Any) -> Dict[str, Any]:
+    """Node in API form, reusing the original dict when it already is one"""
+    inputs = node.get('inputs')
+    if not isinstance(inputs, dict):
+        inputs = {}
+    if isinstance(extra_inputs, dict) and extra_inputs:
+        inputs = {**inputs, **extra_inputs}
+    if any(_api_link(value) is not value for value in inputs.values()):
+        inputs = {name: _api_link(value) for name, value in inputs.items()}
+
+    if inputs is node.get('inputs') and all(key in _API_NODE_FIELDS for key in node):
+        return node
+    api_node = {'class_type': node['class_type'], 'inputs': inputs}
+    if '_meta' in node:
+        api_node['_meta'] = node['_meta']
+    return api_node
+
+
+def to_api_prompt(workflow: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Convert a workflow to the ComfyUI API prompt format
+
+    A nodes/connections workflow is flattened into {node_id: {class_type,
+    inputs}}, with each node's 'connections' inputs merged over its own inputs
+    (the connection wins when both name the same input). Node IDs and link
+    sources become strings, and fields other than class_type, inputs and _meta
+    are dropped. A workflow already in API format is accepted as well. Nodes
+    that need no change are reused rather than copied.
+
+    Args:
+        workflow: Workflow in nodes/connections or API format
+
+    Returns:
+        Prompt dict ready to post to /prompt
+
+    Raises:
+        ValueError: If the workflow is in neither format, or connections
+            reference nodes that do not exist
+    """
+    if is_api_prompt(workflow):
+        nodes, connections = workflow, None
+    elif isinstance(workflow, dict) and isinstance(workflow.get('nodes'), dict):
+        nodes, connections = workflow['nodes'], workflow.get('connections')
+    else:
+        raise ValueError("Workflow is neither in nodes/connections nor in API prompt format")
+
+    # Generated workflows often carry "connections": [] when every link sits in the node inputs
+    if not connections:
+        connections = None
+    elif not isinstance(connections, dict):
+        raise ValueError("'connections' must be a dictionary")
+    if connections:
+        unknown = [target_id for target_id in connections if target_id not in nodes and str(target_id) not in nodes]
+        if unknown:
+            raise ValueError(f"Connections reference non-existent nodes: {unknown}")
+
+    prompt: Dict[str, Dict[str, Any]] = {}
+    for node_id, node in nodes.items():
+        if not isinstance(node, dict) or 'class_type' not in node:
+            raise ValueError(f"Node {node_id} has no class_type")
+        extra = connections.get(node_id) if connections else None
+        prompt[str(node_id)] = _api_node(node, extra.get('inputs') if isinstance(extra, dict) else None)
+    return prompt
+
+
+def from_api_prompt(prompt: Dict[str, Any]) -> Dict[str, Any]:
+    """Wrap an API-format prompt as a nodes/connections workflow (links stay in the node inputs)"""
+    return {'nodes': prompt, 'connections': {}}
+
+
+def canonical_prompt(workflow: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    API prompt with node IDs renumbered independently of the original ones
+
+    Every node gets a content signature: its class_type and inputs, with
+    each link replaced by the signature of the node it points to (and the
+    output index). Nodes are renumbered "0", "1", ... in signature order and
+    links rewritten to match, so two workflows describing the same graph
+    with different IDs or node order produce the same prompt. _meta
+    (titles) is dropped since it does not affect execution.
+
+    Raises:
+        ValueError: As to_api_prompt
+    """
+    prompt = to_api_prompt(workflow)
+    signatures: Dict[str, str] = {}
+
+    def is_link(value: Any) -> bool:
+        return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and value[0] in prompt
+
+    def signature(node_id: str, visiting: frozenset) -> str:
+        if node_id not in signatures:
+            if node_id in visiting:
+                # A cycle cannot execute anyway; keep hashing total
+                return "cycle"
+            inputs = {
+                name: ["link", signature(value[0], visiting | {node_id}), value[1]] if is_link(value) else value
+                for name, value in prompt[node_id]['inputs'].items()
+            }
+            text = json.dumps([prompt[node_id]['class_type'], inputs], sort_keys=True, separators=(',', ':'))
+            signatures[node_id] = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return signatures[node_id]
+
+    order: List[str] = sorted(prompt, key=lambda node_id: signature(node_id, frozenset()))
+    new_ids = {node_id: str(index) for index, node_id in enumerate(order)}
+    return {
+        new_ids[node_id]: {
+            'class_type': prompt[node_id]['class_type'],
+            'inputs': {
+                name: [new_ids[value[0]], value[1]] if is_link(value) else value
+                for name, value in prompt[node_id]['inputs'].items()
+            },
+        }
+        for node_id in order
+    }
+
+
+def graph_hash(workflow: Dict[str, Any]) -> str:
+    """SHA-256 of canonical_prompt with sorted keys: equal for workflows that execute identically"""
+    text = json.dumps(canonical_prompt(workflow), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
@@ -0,0 +1,242 @@
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from workflow_validator import ValidationError
+
+# Number of output slots per class_type; links into unknown types are not index-checked
+OUTPUT_ARITY: Dict[str, int] = {
+    'CheckpointLoaderSimple': 3,
+    'CheckpointLoader': 3,
+    'CLIPTextEncode': 1,
+    'CLIPSetLastLayer': 1,
+    'CLIPLoader': 1,
+    'ConditioningCombine': 1,
+    'ConditioningSetArea': 1,
+    'ControlNetLoader': 1,
+    'ControlNetApply': 1,
+    'EmptyLatentImage': 1,
+    'ImageScale': 1,
+    'ImageScaleBy': 1,
+    'ImageUpscaleWithModel': 1,
+    'KSampler': 1,
+    'KSamplerAdvanced': 1,
+    'LatentUpscale': 1,
+    'LatentUpscaleBy': 1,
+    'LoadImage': 2,
+    'LoraLoader': 2,
+    'UNETLoader': 1,
+    'UpscaleModelLoader': 1,
+    'VAEDecode': 1,
+    'VAEEncode': 1,
+    'VAELoader': 1,
+    'SaveImage': 0,
+    'PreviewImage': 0,
+    'SaveImageWebsocket': 0,
+}
+
+# Nodes ComfyUI executes for their side effects; everything else only runs if an output needs it
+OUTPUT_NODE_TYPES = frozenset({'SaveImage', 'PreviewImage', 'SaveImageWebsocket'})
+
+# (source_id, output_index, target_id, input_name)
+Edge = Tuple[str, Any, str, str]
+
+
+def is_link(value: Any) -> bool:
+    """True for a [source_node_id, output_index] input value"""
+    return (isinstance(value, list) and len(value) == 2
+            and isinstance(value[0], (str, int)) and isinstance(value[1], int) and not isinstance(value[1], bool))
+
+
+class WorkflowGraph:
+    """
+    Adjacency-indexed view of a workflow, built once per workflow
+
+    Edges are collected from link-valued node inputs and from the optional
+    'connections' section (the latter wins for the same target input). All
+    analyses are O(V+E) over the prebuilt adjacency lists.
+    """
+
+    def __init__(self, nodes: Dict[str, Any], connections: Optional[Dict[str, Any]] = None,
+                 output_arity: Optional[Dict[str, int]] = None, output_node_types=OUTPUT_NODE_TYPES):
+        self.nodes = nodes
+        self.output_arity = OUTPUT_ARITY if output_arity is None else output_arity
+        self.output_node_types = output_node_types
+
+        links: Dict[Tuple[str, str], Any] = {}
+        for node_id, node in nodes.items():
+            inputs = node.get('inputs') if isinstance(node, dict) else None
+            if isinstance(inputs, dict):
+                for name, value in inputs.items():
+                    if is_link(value):
+                        links[(node_id, name)] = value
+        for target_id, info in (connections or {}).items():
+            if isinstance(info, dict) and isinstance(info.get('inputs'), dict):
+                for name, value in info['inputs'].items():
+                    if is_link(value):
+                        links[(str(target_id), name)] = value
+
+        self.edges: List[Edge] = []
+        self.successors: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+        self.predecessors: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+        for (target_id, name), (source_id, index) in links.items():
+            source_id = str(source_id)
+            self.edges.append((source_id, index, target_id, name))
+            if source_id in self.successors and target_id in self.predecessors:
+                self.successors[source_id].append(target_id)
+                self.predecessors[target_id].append(source_id)
+
+    def class_type(self, node_id: str) -> Optional[str]:
+        node = self.nodes.get(node_id)
+        return node.get('class_type') if isinstance(node, dict) else None
+
+    def topological_order(self) -> Optional[List[str]]:
+        """Kahn's algorithm; returns None if the graph has a cycle"""
+        indegree = {node_id: len(sources) for node_id, sources in self.predecessors.items()}
+        ready = [node_id for node_id, degree in indegree.items() if degree == 0]
+        order: List[str] = []
+        while ready:
+            node_id = ready.pop()
+            order.append(node_id)
+            for target_id in self.successors[node_id]:
+                indegree[target_id] -= 1
+                if indegree[target_id] == 0:
+                    ready.append(target_id)
+        return order if len(order) == len(self.nodes) else None
+
+    def find_cycle(self) -> Optional[List[str]]:
+        """Return one cycle as a list of node IDs (first repeated at the end), or None"""
+        WHITE, GREY, BLACK = 0, 1, 2
+        color = dict.fromkeys(self.nodes, WHITE)
+        for root in self.nodes:
+            if color[root] != WHITE:
+                continue
+            path = [root]
+            stack = [iter(self.successors[root])]
+            color[root] = GREY
+            while stack:
+                target = next(stack[-1], None)
+                if target is None:
+                    color[path.pop()] = BLACK
+                    stack.pop()
+                elif color[target] == GREY:
+                    return path[path.index(target):] + [target]
+                elif color[target] == WHITE:
+                    color[target] = GREY
+                    path.append(target)
+                    stack.append(iter(self.successors[target]))
+        return None
+
+    def live_nodes(self) -> set:
+        """Nodes an output node depends on (including the output nodes)"""
+        live = {node_id for node_id in self.nodes if self.class_type(node_id) in self.output_node_types}
+        frontier = list(live)
+        while frontier:
+            for source_id in self.predecessors[frontier.pop()]:
+                if source_id not in live:
+                    live.add(source_id)
+                    frontier.append(source_id)
+        return live
+
+    def dead_nodes(self) -> List[str]:
+        """Nodes whose results never reach an output node"""
+        live = self.live_nodes()
+        return [node_id for node_id in self.nodes if node_id not in live]
+
+    def link_errors(self) -> List[ValidationError]:
+        """Links from missing nodes or to output slots the source does not have"""
+        errors: List[ValidationError] = []
+        for source_id, index, target_id, name in self.edges:
+            if source_id not in self.nodes:
+                errors.append(ValidationError(
+                    'unknown_source',
+                    f"Connection from non-existent source node {source_id} to node {target_id}",
+                    target_id, name,
+                ))
+                continue
+            source_type = self.class_type(source_id)
+            arity = self.output_arity.get(source_type)
+            if arity is not None and not 0 <= index < arity:
+                errors.append(ValidationError(
+                    'bad_output_index',
+                    f"Node {target_id} input '{name}' uses output {index} of node {source_id} "
+                    f"({source_type}), which has {arity} output{'s' if arity != 1 else ''}",
+                    target_id, name,
+                ))
+        return errors
+
+    def errors(self) -> List[ValidationError]:
+        """All graph-level errors: bad links, cycles and missing output nodes"""
+        errors = self.link_errors()
+        cycle = self.find_cycle()
+        if cycle:
+            errors.append(ValidationError('cycle', f"Workflow contains a cycle: {' -> '.join(cycle)}", cycle[0]))
+        if self.nodes and not any(self.class_type(node_id) in self.output_node_types for node_id in self.nodes):
+            errors.append(ValidationError('no_output', "Workflow has no output node (e.g. SaveImage)"))
+        return errors
+
+    def pruned(self, workflow: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Return a copy of workflow without dead nodes
+
+        Args:
+            workflow: The workflow this graph was built from (either format)
+
+        Returns:
+            Workflow of the same shape with unreachable nodes (and their
+            connection entries) removed
+        """
+        live = self.live_nodes()
+        if 'nodes' not in workflow:
+            return {node_id: node for node_id, node in workflow.items() if node_id in live}
+        pruned = {**workflow, 'nodes': {node_id: node for node_id, node in self.nodes.items() if node_id in live}}
+        if isinstance(workflow.get('connections'), dict):
+            pruned['connections'] = {
+                target_id: info for target_id, info in workflow['connections'].items() if target_id in live
+            }
+        return pruned
+
+    def neighbourhood(self, node_ids: Iterable[str]) -> set:
+        """The given nodes plus the nodes directly linked to or from them"""
+        around = {node_id for node_id in node_ids if node_id in self.nodes}
+        for node_id in list(around):
+            around.update(self.predecessors[node_id])
+            around.update(self.successors[node_id])
+        return around
+
+    def excerpt(self, workflow: Dict[str, Any], node_ids: Iterable[str]) -> Dict[str, Any]:
+        """
+        Return the part of a nodes/connections workflow around some nodes
+
+        Args:
+            workflow: The workflow this graph was built from
+            node_ids: Nodes of interest; their direct neighbours are kept too
+
+        Returns:
+            Workflow of the same shape with only those nodes and their
+            connection entries
+        """
+        keep = self.neighbourhood(node_ids)
+        excerpt = {**workflow, 'nodes': {node_id: node for node_id, node in self.nodes.items() if node_id in keep}}
+        if isinstance(workflow.get('connections'), dict):
+            excerpt['connections'] = {
+                target_id: info for target_id, info in workflow['connections'].items() if target_id in keep
+            }
+        return excerpt
+
+
+def merge_excerpt(workflow: Dict[str, Any], excerpt: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply an edited excerpt (see WorkflowGraph.excerpt) to the full workflow
+
+    Nodes and connection entries in the excerpt replace the ones with the
+    same ID, and new IDs are added; everything else is kept as is.
+
+    Raises:
+        ValueError: If the excerpt has no 'nodes' dictionary
+    """
+    if not isinstance(excerpt, dict) or not isinstance(excerpt.get('nodes'), dict):
+        raise ValueError("Workflow excerpt must contain a 'nodes' dictionary")
+    merged = {**workflow, 'nodes': {**workflow.get('nodes', {}), **excerpt['nodes']}}
+    if isinstance(excerpt.get('connections'), dict) and excerpt['connections']:
+        connections = workflow.get('connections')
+        merged['connections'] = {**(connections if isinstance(connections, dict) else {}), **excerpt['connections']}
+    return merged
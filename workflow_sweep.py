@@ -0,0 +1,220 @@
+import itertools
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Iterable, Tuple, Union
+
+from json_handler import JsonHandler, WorkflowValidationError
+from workflow_format import to_api_prompt
+from workflow_graph import is_link
+from workflow_validator import ValidationError
+
+# "3.seed", ("3", "seed"), "KSampler.cfg" or "positive.text"
+OverrideKey = Union[str, Tuple[str, str]]
+
+# Aliases for the CLIPTextEncode nodes feeding a sampler's conditioning inputs
+_CONDITIONING_ALIASES = ('positive', 'negative')
+
+
+def _value_kind(value: Any) -> Any:
+    """Types an override may have to replace a literal input value; None if any value goes"""
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, (int, float)):
+        return (int, float)
+    if isinstance(value, str):
+        return str
+    return None
+
+
+@dataclass
+class SweepVariant:
+    """One expanded variant of a sweep"""
+    index: int
+    # Resolved overrides: (node_id, input_name) -> value
+    overrides: Dict[Tuple[str, str], Any]
+    # API-format prompt; shares every untouched node with the base prompt, so do not mutate it
+    prompt: Dict[str, Any]
+    errors: List[ValidationError] = field(default_factory=list)
+    result: Any = None
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+
+class ParameterSweep:
+    """
+    Expand one validated workflow into many variants that differ in a few inputs
+
+    The base workflow is validated in full once and converted to API format.
+    Each variant copies only the nodes it changes (and their inputs dicts),
+    sharing every other node with the base prompt, and only the changed
+    literal values are checked against the node schema. An override that
+    replaces or introduces a link changes the graph, so that variant gets a
+    full validation instead.
+
+    Example:
+        sweep = ParameterSweep(workflow)
+        variants = sweep.expand(ParameterSweep.grid({"KSampler.seed": range(1000)}))
+        sweep.run(comfyui_client, variants)
+    """
+
+    def __init__(self, workflow: Dict[str, Any]):
+        errors = JsonHandler.collect_errors(workflow)
+        if errors:
+            raise WorkflowValidationError(errors)
+        self.full_validations = 1
+        self.leaf_validations = 0
+        self.base = to_api_prompt(workflow)
+        self._key_cache: Dict[OverrideKey, List[Tuple[str, str]]] = {}
+
+    @staticmethod
+    def grid(axes: Dict[OverrideKey, Iterable[Any]]) -> List[Dict[OverrideKey, Any]]:
+        """
+        Cartesian product of override values
+
+        Args:
+            axes: Override key -> values to try, e.g. {"3.seed": range(10), "3.cfg": [6, 8]}
+
+        Returns:
+            One overrides dict per combination
+        """
+        keys = list(axes)
+        return [dict(zip(keys, values)) for values in itertools.product(*(list(axes[key]) for key in keys))]
+
+    def resolve(self, key: OverrideKey) -> List[Tuple[str, str]]:
+        """
+        Resolve an override key to (node_id, input_name) targets
+
+        The node part may be a node ID, a class_type present exactly once, or
+        'positive'/'negative' for the text encoders wired into the samplers.
+
+        Raises:
+            ValueError: If the key matches no node or an ambiguous class_type
+        """
+        cached = self._key_cache.get(key)
+        if cached is not None:
+            return cached
+        if isinstance(key, tuple):
+            node_ref, input_name = key
+        else:
+            node_ref, _, input_name = key.rpartition('.')
+        node_ref = str(node_ref)
+        if not node_ref or not input_name:
+            raise ValueError(f"Override key {key!r} must look like 'node.input'")
+
+        if node_ref in self.base:
+            node_ids = [node_ref]
+        elif node_ref in _CONDITIONING_ALIASES:
+            node_ids = sorted({
+                str(node['inputs'][node_ref][0]) for node in self.base.values()
+                if is_link(node['inputs'].get(node_ref))
+            })
+        else:
+            node_ids = [node_id for node_id, node in self.base.items() if node['class_type'] == node_ref]
+            if len(node_ids) > 1:
+                raise ValueError(f"Override key {key!r} is ambiguous: {node_ref} nodes {node_ids}; use a node ID")
+        if not node_ids:
+            raise ValueError(f"Override key {key!r} matches no node")
+
+        targets = [(node_id, input_name) for node_id in node_ids]
+        self._key_cache[key] = targets
+        return targets
+
+    def _check_leaf(self, node_id: str, name: str, value: Any, errors: List[ValidationError]) -> None:
+        """Validate one overridden literal against the node schema, else the requirement tables and base node"""
+        self.leaf_validations += 1
+        class_type = self.base[node_id]['class_type']
+        registry = JsonHandler.schema_registry
+        schema = registry.get(class_type) if registry is not None else None
+        if schema is not None:
+            spec = schema.required.get(name) or schema.optional.get(name)
+            if spec is None:
+                errors.append(ValidationError(
+                    'unknown_input', f"Node {node_id} ({class_type}) has no input '{name}'", node_id, name
+                ))
+                return
+            error = spec.check_value(node_id, class_type, name, value)
+            if error is not None:
+                errors.append(error)
+            return
+        checker = JsonHandler.get_validator().checkers.get(class_type)
+        if checker is not None and checker.has_input(name):
+            checker.check_input(node_id, name, value, errors)
+            return
+        # Not in the tables: accept only inputs the validated base node already has, with a value of the same kind
+        base_inputs = self.base[node_id]['inputs']
+        if name not in base_inputs:
+            errors.append(ValidationError(
+                'unknown_input', f"Node {node_id} ({class_type}) has no input '{name}'", node_id, name
+            ))
+            return
+        expected = _value_kind(base_inputs[name])
+        if expected is not None and (not isinstance(value, expected) or isinstance(value, bool) != (expected is bool)):
+            errors.append(ValidationError(
+                'bad_type',
+                f"Node {node_id} ({class_type}) input '{name}' must be of type {expected}, got {type(value)}",
+                node_id, name,
+            ))
+
+    def variant(self, overrides: Dict[OverrideKey, Any], index: int = 0) -> SweepVariant:
+        """
+        Build one variant
+
+        Args:
+            overrides: Override key -> new value
+            index: Position of the variant in its sweep
+
+        Returns:
+            SweepVariant whose errors list is empty if the variant is valid
+        """
+        resolved: Dict[Tuple[str, str], Any] = {}
+        for key, value in overrides.items():
+            for target in self.resolve(key):
+                resolved[target] = value
+
+        prompt = dict(self.base)
+        copied = set()
+        errors: List[ValidationError] = []
+        structural = False
+        for (node_id, name), value in resolved.items():
+            if node_id not in copied:
+                node = prompt[node_id]
+                prompt[node_id] = {**node, 'inputs': dict(node['inputs'])}
+                copied.add(node_id)
+            inputs = prompt[node_id]['inputs']
+            if is_link(value) or is_link(inputs.get(name)):
+                structural = True
+            else:
+                self._check_leaf(node_id, name, value, errors)
+            inputs[name] = value
+
+        if structural:
+            self.full_validations += 1
+            errors = JsonHandler.collect_errors(prompt)
+        return SweepVariant(index, resolved, prompt, errors)
+
+    def expand(self, overrides_list: Iterable[Dict[OverrideKey, Any]]) -> List[SweepVariant]:
+        """Build a variant for every overrides dict, e.g. from grid()"""
+        return [self.variant(overrides, index) for index, overrides in enumerate(overrides_list)]
+
+    def run(self, client, variants: List[SweepVariant], output_dir: str = "outputs",
+            max_in_flight: int = 64) -> List[SweepVariant]:
+        """
+        Submit every valid variant to ComfyUI as one batch
+
+        Args:
+            client: ComfyUIClient to execute with
+            variants: Variants from expand(); invalid ones are skipped
+            output_dir: Directory images are saved into
+            max_in_flight: See ComfyUIClient.execute_batch
+
+        Returns:
+            The same variants, each valid one with its WorkflowResult (or None
+            on failure) in .result
+        """
+        runnable = [variant for variant in variants if variant.valid]
+        results = client.execute_batch((variant.prompt for variant in runnable), output_dir,
+                                       max_in_flight=max_in_flight)
+        for variant, result in zip(runnable, results):
+            variant.result = result
+        return variants
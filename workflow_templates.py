@@ -0,0 +1,191 @@
+import hashlib
+import re
+from typing import Dict, Any, Optional
+
+# Words that signal a plain text-to-image request
+_IMAGE_INTENT = re.compile(
+    r"\b(image|images|photo|photos|picture|pictures|portrait|illustration|render|painting|"
+    r"drawing|artwork|wallpaper|text[- ]to[- ]image|txt2img)\b"
+)
+# Features the templates cannot express; those descriptions go to the LLM
+_UNSUPPORTED = re.compile(
+    r"\b(controlnet|inpaint\w*|outpaint\w*|img2img|image[- ]to[- ]image|lora|video|animat\w*|"
+    r"mask\w*|ipadapter|ip-adapter|refiner|sdxl|face ?detailer|load(?:s|ing)? an? (?:existing )?image|"
+    r"from an? (?:existing|input|uploaded) image|upscale model|esrgan)\b"
+)
+# "upscale" on its own, or scale/resize/enlarge aimed at the image or given a factor or size.
+# Nouns and adjectives ("shiny scales", "large-scale", "an enlarged heart") are not a step.
+_RESIZE_VERB = r"(?<![-\w])(?:scal|resiz|enlarg)(?:e|ed|ing)\b"
+_UPSCALE_STEP = (r"\bupscal\w*|" + _RESIZE_VERB +
+                 r"(?:\s+(?:it|them|(?:the|that|this)\s+(?:image|picture|photo|result|output)s?)\b|"
+                 r"(?:\s+(?:it|them|(?:the|that|this)\s+\w+))?\s+(?:up\b|by\s+\d|to\s+\d|\d(?:\.\d+)?\s*x\b))")
+_UPSCALE = re.compile(_UPSCALE_STEP)
+
+# "without" opens its own phrase; the other cues only count at the start of a clause, so
+# "a sign that says no parking" stays in the subject
+_NEGATIVE_CUE = (r"(?:\bwithout|(?:(?:^|[,.;:])\s*|\b(?:and|with)\s+)"
+                 r"(?:avoid(?:ing)?|no|negative(?: prompt)?:?))\s+")
+# Where a subject or negative phrase ends: punctuation, the next step, a size or the end
+_CLAUSE_END = (r"\s*(?:[,.;]|\b(?:and\s+)?then\b|\b(?:and\s+)?(?:" + _UPSCALE_STEP + r")|"
+               r"\b(?:at\s+|in\s+)?\d{3,4}\s*[x×]\s*\d{3,4}\b|$)")
+_SUBJECT = re.compile(r"\b(?:of|showing|depicting|featuring|with the prompt)\s+(.+?)"
+                      r"(?=\s*" + _NEGATIVE_CUE + r"|" + _CLAUSE_END + r")", re.IGNORECASE)
+_NEGATIVE = re.compile(_NEGATIVE_CUE + r"(.+?)" + _CLAUSE_END, re.IGNORECASE)
+_SIZE = re.compile(r"\b(\d{3,4})\s*[x×]\s*(\d{3,4})\b")
+_STEPS = re.compile(r"\b(\d{1,3})\s*(?:sampling\s+)?steps\b")
+_SEED = re.compile(r"\bseed\s*(?:of\s*|[:=]\s*)?(\d+)\b")
+_CFG = re.compile(r"\bcfg(?:\s*scale)?\s*(?:of\s*|[:=]\s*)?(\d+(?:\.\d+)?)\b")
+_DENOISE = re.compile(r"\bdenois\w*\s*(?:of\s*|[:=]\s*)?(\d(?:\.\d+)?)\b")
+_BATCH = re.compile(r"\b(\d{1,2})\s+(?:images|pictures|photos|variations)\b")
+_SCALE_BY = re.compile(r"\b(\d(?:\.\d+)?)\s*x\b|\bby\s+(?:a\s+factor\s+of\s+)?(\d(?:\.\d+)?)\b")
+_SCALE_TO = re.compile(r"\bto\s+(\d{3,4})(?:\s*[x×]\s*(\d{3,4}))?\b")
+_CHECKPOINT = re.compile(r"\b([\w.-]+\.(?:safetensors|ckpt))\b")
+
+_SAMPLERS = ('euler_ancestral', 'euler', 'dpmpp_2m_sde', 'dpmpp_2m', 'dpmpp_sde', 'ddim', 'uni_pc', 'heun', 'lms')
+_SCHEDULERS = ('karras', 'exponential', 'sgm_uniform', 'simple', 'normal')
+
+
+class WorkflowTemplates:
+    """
+    Deterministic builder for the common text-to-image graph
+
+    Recognises plain text-to-image descriptions (optionally with an upscale
+    step) using precompiled regular expressions and builds the
+    CheckpointLoaderSimple -> CLIPTextEncode x2 -> EmptyLatentImage -> KSampler
+    -> VAEDecode -> [ImageScale/ImageScaleBy] -> SaveImage graph directly, in
+    the same nodes/connections format the LLM generator produces. Anything
+    the template cannot express returns None so the caller falls back to
+    ClaudeClient.generate_workflow.
+    """
+
+    DEFAULT_CHECKPOINT = "v1-5-pruned-emaonly.safetensors"
+    DEFAULT_NEGATIVE = "blurry, low quality, distorted"
+
+    @staticmethod
+    def match(description: str) -> Optional[Dict[str, Any]]:
+        """
+        Extract template parameters from a description
+
+        Args:
+            description: User's workflow description
+
+        Returns:
+            Dict of template parameters, or None if the description is not a
+            plain text-to-image request
+        """
+        text = description.strip()
+        lowered = text.lower()
+        if not _IMAGE_INTENT.search(lowered) or _UNSUPPORTED.search(lowered):
+            return None
+
+        subject = _SUBJECT.search(text)
+        negative = _NEGATIVE.search(text)
+        size = _SIZE.search(lowered)
+        scale_to = _SCALE_TO.search(lowered)
+        # A "to WxH" size belongs to the upscale step, not the latent
+        if size and scale_to and scale_to.group(2) and size.start() == scale_to.start(1):
+            size = None
+
+        params: Dict[str, Any] = {
+            "positive": subject.group(1).strip() if subject else text,
+            "negative": negative.group(1).strip() if negative else WorkflowTemplates.DEFAULT_NEGATIVE,
+            "width": int(size.group(1)) // 8 * 8 if size else 512,
+            "height": int(size.group(2)) // 8 * 8 if size else 512,
+            "batch_size": 1,
+            "steps": 20,
+            "cfg": 8.0,
+            "denoise": 1.0,
+            "sampler_name": next((name for name in _SAMPLERS if name in lowered), "euler"),
+            "scheduler": next((name for name in _SCHEDULERS if name in lowered), "normal"),
+            # Derived from the description so the same request always builds the same graph
+            "seed": int(hashlib.sha256(lowered.encode('utf-8')).hexdigest()[:8], 16),
+            "ckpt_name": WorkflowTemplates.DEFAULT_CHECKPOINT,
+            "upscale": None,
+        }
+
+        for pattern, key, cast in ((_STEPS, "steps", int), (_SEED, "seed", int), (_CFG, "cfg", float),
+                                   (_DENOISE, "denoise", float), (_BATCH, "batch_size", int)):
+            found = pattern.search(lowered)
+            if found:
+                params[key] = cast(found.group(1))
+        checkpoint = _CHECKPOINT.search(text)
+        if checkpoint:
+            params["ckpt_name"] = checkpoint.group(1)
+
+        step = _UPSCALE.search(lowered)
+        if step:
+            # Only a factor or size after the verb belongs to the upscale step
+            scale_to = _SCALE_TO.search(lowered, step.start())
+            if scale_to and scale_to.group(2):
+                params["upscale"] = {"width": int(scale_to.group(1)), "height": int(scale_to.group(2))}
+            elif scale_to:
+                # One target size is the long side; keep the latent's aspect ratio
+                ratio = int(scale_to.group(1)) / max(params["width"], params["height"])
+                params["upscale"] = {"width": round(params["width"] * ratio), "height": round(params["height"] * ratio)}
+            else:
+                factor = _SCALE_BY.search(lowered, step.start())
+                scale_by = float(factor.group(1) or factor.group(2)) if factor else 2.0
+                params["upscale"] = {"scale_by": scale_by}
+        return params
+
+    @staticmethod
+    def build_from_params(params: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the workflow graph for parameters returned by match"""
+        nodes: Dict[str, Any] = {
+            "3": {
+                "class_type": "KSampler",
+                "inputs": {
+                    "seed": params["seed"],
+                    "steps": params["steps"],
+                    "cfg": params["cfg"],
+                    "sampler_name": params["sampler_name"],
+                    "scheduler": params["scheduler"],
+                    "denoise": params["denoise"],
+                    "model": ["4", 0],
+                    "positive": ["6", 0],
+                    "negative": ["7", 0],
+                    "latent_image": ["5", 0],
+                },
+            },
+            "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": params["ckpt_name"]}},
+            "5": {
+                "class_type": "EmptyLatentImage",
+                "inputs": {"width": params["width"], "height": params["height"], "batch_size": params["batch_size"]},
+            },
+            "6": {"class_type": "CLIPTextEncode", "inputs": {"text": params["positive"], "clip": ["4", 1]}},
+            "7": {"class_type": "CLIPTextEncode", "inputs": {"text": params["negative"], "clip": ["4", 1]}},
+            "8": {"class_type": "VAEDecode", "inputs": {"samples": ["3", 0], "vae": ["4", 2]}},
+        }
+
+        image_source = ["8", 0]
+        upscale = params.get("upscale")
+        if upscale:
+            if "scale_by" in upscale:
+                nodes["10"] = {
+                    "class_type": "ImageScaleBy",
+                    "inputs": {"upscale_method": "bicubic", "scale_by": upscale["scale_by"], "image": ["8", 0]},
+                }
+            else:
+                nodes["10"] = {
+                    "class_type": "ImageScale",
+                    "inputs": {"upscale_method": "bicubic", "width": upscale["width"], "height": upscale["height"],
+                               "crop": "disabled", "image": ["8", 0]},
+                }
+            image_source = ["10", 0]
+
+        nodes["9"] = {"class_type": "SaveImage", "inputs": {"images": image_source, "filename_prefix": "ComfyUI"}}
+        return {"nodes": nodes, "connections": {}}
+
+    @staticmethod
+    def build(description: str) -> Optional[Dict[str, Any]]:
+        """
+        Build a workflow for a description without calling the LLM
+
+        Args:
+            description: User's workflow description
+
+        Returns:
+            Workflow dict, or None if no template applies
+        """
+        params = WorkflowTemplates.match(description)
+        return WorkflowTemplates.build_from_params(params) if params is not None else None
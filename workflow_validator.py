@@ -0,0 +1,193 @@
+import json
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
+
+
+@dataclass
+class ValidationError:
+    """One problem found in a workflow"""
+    # Machine-readable category, e.g. 'missing_input' or 'bad_type'
+    code: str
+    message: str
+    node_id: Optional[str] = None
+    input_name: Optional[str] = None
+
+    def __str__(self) -> str:
+        return self.message
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"code": self.code, "message": self.message, "node_id": self.node_id, "input_name": self.input_name}
+
+
+class NodeChecker:
+    """
+    Input checks for one class_type, compiled from a requirements table entry
+
+    The per-input type specs are flattened into a tuple of
+    (name, allowed types, description) once, so checking a node is a single
+    loop with one isinstance call per required input.
+    """
+
+    __slots__ = ('class_type', 'inputs')
+
+    def __init__(self, class_type: str, required_inputs: Dict[str, Any]):
+        self.class_type = class_type
+        self.inputs: Tuple[Tuple[str, Any, str], ...] = tuple(
+            (name, expected, f"one of types {expected}" if isinstance(expected, tuple) else f"of type {expected}")
+            for name, expected in required_inputs.items()
+        )
+
+    def check(self, node_id: str, inputs: Dict[str, Any], errors: List[ValidationError]) -> None:
+        for name, expected, description in self.inputs:
+            if name not in inputs:
+                errors.append(ValidationError(
+                    'missing_input',
+                    f"Node {node_id} ({self.class_type}) missing required input: {name}",
+                    node_id, name,
+                ))
+                continue
+            value = inputs[name]
+            if not isinstance(value, expected):
+                errors.append(ValidationError(
+                    'bad_type',
+                    f"Node {node_id} ({self.class_type}) input '{name}' must be {description}, got {type(value)}",
+                    node_id, name,
+                ))
+
+    def has_input(self, name: str) -> bool:
+        return any(input_name == name for input_name, _, _ in self.inputs)
+
+    def check_input(self, node_id: str, name: str, value: Any, errors: List[ValidationError]) -> None:
+        """Check a single input value, e.g. after overriding one parameter"""
+        for input_name, expected, description in self.inputs:
+            if input_name == name:
+                if not isinstance(value, expected):
+                    errors.append(ValidationError(
+                        'bad_type',
+                        f"Node {node_id} ({self.class_type}) input '{name}' must be {description}, got {type(value)}",
+                        node_id, name,
+                    ))
+                return
+
+
+class WorkflowValidator:
+    """
+    Single-pass workflow validator that collects every error
+
+    Built once from the requirements tables; validate() walks the graph one
+    time and returns a structured list of all problems instead of raising on
+    the first, so a single refine round can address all of them.
+    """
+
+    def __init__(self, node_requirements: Dict[str, Dict[str, Any]], required_node_types: Set[str],
+                 required_fields: Set[str]):
+        self.required_node_types = frozenset(required_node_types)
+        self.required_fields = frozenset(required_fields)
+        self.checkers: Dict[str, NodeChecker] = {
+            class_type: NodeChecker(class_type, spec['required_inputs'])
+            for class_type, spec in node_requirements.items()
+        }
+
+    def validate(self, workflow: Union[str, Dict[str, Any]],
+                 skip_inputs: frozenset = frozenset()) -> List[ValidationError]:
+        """
+        Validate a workflow
+
+        Args:
+            workflow: Workflow dict, or JSON string to parse
+            skip_inputs: class_types whose input checks are done elsewhere
+                (e.g. by a NodeSchemaRegistry)
+
+        Returns:
+            List of every error found; empty if the workflow is valid
+        """
+        if isinstance(workflow, (str, bytes)):
+            try:
+                workflow = json.loads(workflow)
+            except json.JSONDecodeError as e:
+                return [ValidationError('invalid_json', f"Invalid JSON format: {str(e)}")]
+
+        if not isinstance(workflow, dict):
+            return [ValidationError('not_object', "Workflow must be a JSON object")]
+
+        errors: List[ValidationError] = []
+        missing_keys = [key for key in ("nodes", "connections") if key not in workflow]
+        if missing_keys:
+            errors.append(ValidationError('missing_key', f"Workflow missing required keys: {missing_keys}"))
+
+        nodes = workflow.get('nodes')
+        if 'nodes' in workflow and not isinstance(nodes, dict):
+            errors.append(ValidationError('bad_structure', "'nodes' must be a dictionary"))
+            nodes = None
+
+        if nodes is not None:
+            self._check_nodes(nodes, errors, skip_inputs)
+
+        connections = workflow.get('connections')
+        if 'connections' in workflow:
+            if not isinstance(connections, dict):
+                errors.append(ValidationError('bad_structure', "'connections' must be a dictionary"))
+            elif nodes is not None:
+                self.check_connections(nodes, connections, errors)
+
+        return errors
+
+    def _check_nodes(self, nodes: Dict[str, Any], errors: List[ValidationError],
+                     skip_inputs: frozenset = frozenset()) -> None:
+        checkers = self.checkers
+        required_fields = self.required_fields
+        found_node_types = set()
+
+        for node_id, node in nodes.items():
+            if not isinstance(node, dict):
+                errors.append(ValidationError('bad_structure', f"Node {node_id} must be an object", node_id))
+                continue
+            missing_fields = required_fields.difference(node)
+            if missing_fields:
+                errors.append(ValidationError(
+                    'missing_field', f"Node {node_id} missing required fields: {missing_fields}", node_id
+                ))
+                if 'class_type' not in node:
+                    continue
+
+            class_type = node['class_type']
+            found_node_types.add(class_type)
+
+            inputs = node.get('inputs')
+            if not isinstance(inputs, dict):
+                if 'inputs' in node:
+                    errors.append(ValidationError('bad_structure', f"Node {node_id} inputs must be an object", node_id))
+                continue
+
+            checker = checkers.get(class_type)
+            if checker is not None and class_type not in skip_inputs:
+                checker.check(node_id, inputs, errors)
+
+        missing_types = self.required_node_types - found_node_types
+        if missing_types:
+            errors.append(ValidationError('missing_node_type', f"Workflow missing required node types: {missing_types}"))
+
+    @staticmethod
+    def check_connections(nodes: Dict[str, Any], connections: Dict[str, Any], errors: List[ValidationError]) -> None:
+        """Check the 'connections' section against the nodes, appending to errors"""
+        for target_id, connection_info in connections.items():
+            if target_id not in nodes:
+                errors.append(ValidationError(
+                    'unknown_target', f"Connection references non-existent target node: {target_id}", target_id
+                ))
+                continue
+
+            if not isinstance(connection_info, dict) or not isinstance(connection_info.get('inputs'), dict):
+                errors.append(ValidationError(
+                    'bad_connection', f"Invalid connection structure for node {target_id}", target_id
+                ))
+                continue
+
+            for input_name, connection in connection_info['inputs'].items():
+                if not isinstance(connection, list) or len(connection) != 2:
+                    errors.append(ValidationError(
+                        'bad_connection',
+                        f"Invalid connection format for node {target_id}, "
+                        f"input {input_name}: expected [node_id, output_index]",
+                        target_id, input_name,
+                    ))